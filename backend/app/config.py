@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 import os
 
@@ -13,6 +14,159 @@ class Settings(BaseSettings):
     SECRET_KEY: str  # For JWT signing
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Token do GET /metrics (header X-Metrics-Token); sem token configurado a rota fica fechada
+    METRICS_TOKEN: Optional[str] = None
+
+    # Pool de conexões do banco (por processo)
+    DB_ECHO: bool = False  # loga todo SQL
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    # Supabase pooler em modo transação (porta 6543): sem cache de prepared statements do asyncpg
+    DB_USE_POOLER: bool = False
+    # Réplica de leitura para GETs só de leitura (ex.: listagem de peças/outfits, analytics)
+    SUPABASE_DB_READ_URL: Optional[str] = None
+    # Depois de uma escrita, as leituras do usuário vão ao primário por este tempo (atraso da réplica)
+    DB_READ_AFTER_WRITE_SECONDS: float = 5.0
+    # ex.: redis://localhost:6379/0 — compartilha a janela entre workers (requer o pacote redis)
+    DB_READ_AFTER_WRITE_REDIS_URL: Optional[str] = None
+
+    # Modelos/geração por estágio do pipeline. Chaves aceitas por estágio:
+    # model, temperature, max_output_tokens, thinking_budget (JSON no .env)
+    GEMINI_DEFAULT_MODEL: str = "gemini-2.5-flash"
+    GEMINI_STAGE_CONFIG: Dict[str, Dict[str, Any]] = {
+        "event_context": {"model": "gemini-2.5-flash-lite", "temperature": 0.2, "max_output_tokens": 512},
+        "scoring": {"model": "gemini-2.5-flash-lite", "temperature": 0.2},
+        "strategy": {"temperature": 0.4, "thinking_budget": 0},
+        "validation": {"model": "gemini-2.5-flash-lite", "temperature": 0.2},
+        "final_analysis": {"temperature": 0.8},
+        "lite": {"temperature": 0.4, "thinking_budget": 0},
+        "image_analysis": {"temperature": 0.1},
+        "image_analysis_batch": {"temperature": 0.1},
+    }
+    # Rebaixa automaticamente o modelo de um estágio quando o p95 passa do orçamento
+    GEMINI_AUTO_DOWNGRADE: bool = False
+    GEMINI_DOWNGRADE_MODEL: str = "gemini-2.5-flash-lite"
+    GEMINI_STAGE_P95_BUDGET_SECONDS: Dict[str, float] = {
+        "event_context": 2.0,
+        "scoring": 6.0,
+        "strategy": 4.0,
+        "validation": 3.0,
+        "final_analysis": 8.0,
+        "lite": 6.0,
+        "image_analysis": 6.0,
+        "image_analysis_batch": 20.0,
+    }
+    GEMINI_LATENCY_WINDOW: int = 200
+    GEMINI_LATENCY_MAX_AGE_SECONDS: float = 300.0  # amostras mais velhas saem do p95
+
+    # Cache em memória do guarda-roupa por usuário
+    WARDROBE_CACHE_MAX_USERS: int = 1000
+    WARDROBE_CACHE_MAX_ITEMS: int = 50000
+    WARDROBE_CACHE_TTL_SECONDS: float = 300.0  # limita a defasagem entre workers
+
+    # Memoização de outfits gerados (usuário + evento + modo + guarda-roupa)
+    OUTFIT_RESULT_CACHE_ENABLED: bool = False
+    OUTFIT_RESULT_CACHE_TTL_SECONDS: float = 600.0
+    OUTFIT_RESULT_CACHE_MAX_ENTRIES: int = 2000
+
+    # Narrativa final do outfit: cache por peças + contexto do evento
+    NARRATIVE_CACHE_TTL_SECONDS: float = 86400.0
+    NARRATIVE_CACHE_MAX_ENTRIES: int = 2000
+    # Narrativa adiada sem texto depois disso (worker reiniciou) é gerada de novo no GET
+    NARRATIVE_STALE_SECONDS: float = 120.0
+
+    # Respostas guardadas por Idempotency-Key em POST /outfits/
+    OUTFIT_IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    OUTFIT_IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    # ex.: redis://localhost:6379/0 — sem ela as chaves valem só no processo (retry em outro worker gera de novo)
+    OUTFIT_IDEMPOTENCY_REDIS_URL: Optional[str] = None
+
+    # Prazo total por requisição de outfit (o cliente pode pedir menos via X-Request-Timeout)
+    OUTFIT_DEADLINE_SECONDS: float = 25.0
+    OUTFIT_SWAP_DEADLINE_SECONDS: float = 10.0
+    OUTFIT_DEADLINE_MAX_SECONDS: float = 60.0
+    # Tempo mínimo restante para ainda executar cada etapa opcional via LLM
+    DEADLINE_STRATEGY_RESERVE_SECONDS: float = 10.0
+    DEADLINE_VALIDATION_RESERVE_SECONDS: float = 8.0
+    DEADLINE_FINAL_ANALYSIS_RESERVE_SECONDS: float = 6.0
+
+    # Retry com backoff exponencial + jitter e circuit breaker (Gemini e Supabase)
+    RESILIENCE_MAX_ATTEMPTS: int = 3
+    RESILIENCE_BASE_DELAY_SECONDS: float = 0.5
+    RESILIENCE_MAX_DELAY_SECONDS: float = 8.0
+    RESILIENCE_MAX_RETRY_AFTER_SECONDS: float = 30.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+    # Hedge: segunda chamada ao Gemini se a primeira passar do p95 do estágio
+    GEMINI_HEDGE_ENABLED: bool = False
+    GEMINI_HEDGE_MIN_SAMPLES: int = 20
+
+    # Limitador global de chamadas ao Gemini (concorrência + RPM/TPM)
+    GEMINI_LIMITER_ENABLED: bool = True
+    GEMINI_MAX_CONCURRENCY: int = 8
+    GEMINI_RPM_LIMIT: int = 300
+    GEMINI_TPM_LIMIT: int = 1_000_000
+    GEMINI_OUTPUT_TOKEN_ESTIMATE: int = 512
+    # ex.: redis://localhost:6379/0 — compartilha RPM/TPM entre workers (requer o pacote redis)
+    GEMINI_LIMITER_REDIS_URL: Optional[str] = None
+
+    # Upload assíncrono de peças: POST /items/?async_processing=true (ou sempre, se ligado)
+    ITEM_ASYNC_INGESTION: bool = False
+    INGESTION_WORKERS: int = 2
+    INGESTION_QUEUE_SIZE: int = 100
+    # Upload direto ao storage por URL assinada (POST /items/uploads)
+    ITEM_UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024
+    ITEM_UPLOAD_EXTENSIONS: List[str] = [".jpg", ".jpeg", ".png", ".webp", ".heic"]
+
+    # Análise de várias imagens por chamada ao Gemini (POST /items/batch, backfill --vision)
+    GEMINI_BATCH_MAX_IMAGES: int = 8
+    GEMINI_BATCH_MAX_BYTES: int = 12 * 1024 * 1024  # soma das imagens em base64 por requisição
+    ITEM_BATCH_MAX_FILES: int = 20
+
+    # Remoção de fundo (rembg): u2netp/silueta são mais rápidos, isnet-general-use tem melhor recorte
+    REMBG_MODEL: str = "u2net"
+    REMBG_ALLOWED_MODELS: List[str] = ["u2net", "u2netp", "silueta", "isnet-general-use", "u2net_human_seg"]
+    REMBG_INTRA_OP_THREADS: int = 0  # 0 = padrão do onnxruntime (todos os núcleos)
+
+    # Startup: a API aceita conexões na hora e o resto carrega em segundo plano (GET /ready)
+    RUN_DDL_ON_STARTUP: bool = True  # False: rodar python -m app.jobs.migrate no deploy
+    WARMUP_REMBG: bool = True  # carrega o modelo de remoção de fundo antes da primeira foto
+    WARMUP_RETRY_SECONDS: float = 5.0
+
+    # Pontua as peças localmente pelos atributos pré-calculados, sem chamar o LLM
+    OUTFIT_LOCAL_SCORING: bool = False
+
+    # Pontua as peças com um palpite local do contexto enquanto o LLM analisa o evento
+    OUTFIT_SPECULATIVE_SCORING: bool = True
+
+    # Valida combinações pelo grafo de compatibilidade; True volta a usar o LLM
+    OUTFIT_LLM_VALIDATION: bool = False
+
+    # Peças do marketplace por categoria trazidas pelo índice vetorial no modo híbrido
+    HYBRID_MARKETPLACE_CANDIDATES: int = 15
+    # Busca vetorial com filtros (categoria, à venda): o HNSW continua varrendo até achar k linhas
+    # (hnsw.iterative_scan, pgvector >= 0.8) e usa uma lista de candidatos maior (ef_search)
+    VECTOR_ITERATIVE_SCAN: bool = True
+    VECTOR_EF_SEARCH: int = 100
+
+    # Ordem das estratégias do modo híbrido escolhida por bandit (Thompson sampling)
+    STRATEGY_BANDIT_ENABLED: bool = True
+    STRATEGY_BANDIT_STATS_TTL_SECONDS: float = 60.0
+    STRATEGY_BANDIT_PRIOR_WEIGHT: float = 5.0  # pseudo-observações emprestadas do agregado global
+    STRATEGY_LATENCY_PENALTY: float = 0.02  # utilidade perdida por segundo de latência
+
+    # Aprendizado online de preferências a partir do feedback (regressão logística)
+    PREFERENCE_LEARNING_RATE: float = 0.3
+    PREFERENCE_HALF_LIFE_DAYS: float = 30.0
+    PREFERENCE_L2: float = 0.01
+    PREFERENCE_MAX_FEATURES: int = 500
+    PREFERENCE_MAX_BONUS: float = 1.5  # pontos somados/subtraídos da nota 0-10
+
+    # Modo "lite": candidatos por categoria enviados ao prompt único
+    LITE_CANDIDATES_PER_CATEGORY: int = 6
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,95 @@
+# app/database/schema.py
+
+import importlib
+
+from sqlalchemy import text
+
+# Extensões necessárias antes do create_all (items.embedding usa pgvector)
+SCHEMA_PREREQUISITES = [
+    "CREATE EXTENSION IF NOT EXISTS vector",
+]
+
+# Alterações idempotentes para tabelas que já existem no Supabase.
+# create_all só cria tabelas novas, então colunas novas entram aqui.
+SCHEMA_UPGRADES = [
+    # Perfil de preferências materializado
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS color_histogram JSON",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS style_histogram JSON",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS category_histogram JSON",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS formality_histogram JSON",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS outfit_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS feedback_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS rating_sum INTEGER NOT NULL DEFAULT 0",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_preferences_user_id ON user_preferences (user_id)",
+    "ALTER TABLE IF EXISTS user_preferences ADD COLUMN IF NOT EXISTS preference_weights JSON",
+    "ALTER TABLE IF EXISTS outfit_analytics ADD COLUMN IF NOT EXISTS narrative TEXT",
+    # Upload assíncrono
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS processing_status TEXT NOT NULL DEFAULT 'ready'",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS processing_error TEXT",
+    "CREATE INDEX IF NOT EXISTS ix_items_processing ON items (processing_status) WHERE processing_status <> 'ready'",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS raw_path TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_items_raw_path ON items (raw_path) WHERE raw_path IS NOT NULL",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS bg_model TEXT",
+    # Atributos normalizados das peças (scoring local)
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS formality TEXT",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS warmth SMALLINT",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS color_family TEXT",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS pattern TEXT",
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS occasions TEXT[]",
+    "CREATE INDEX IF NOT EXISTS ix_items_user_category_formality ON items (user_id, category, formality)",
+    "CREATE INDEX IF NOT EXISTS ix_items_color_family ON items (color_family)",
+    "CREATE INDEX IF NOT EXISTS ix_items_occasions ON items USING GIN (occasions)",
+    # Vetores de similaridade + índices ANN (geral e só marketplace)
+    "ALTER TABLE IF EXISTS items ADD COLUMN IF NOT EXISTS embedding vector(64)",
+    "CREATE INDEX IF NOT EXISTS ix_items_embedding_hnsw ON items USING hnsw (embedding vector_cosine_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_items_embedding_for_sale_hnsw ON items USING hnsw (embedding vector_cosine_ops) WHERE for_sale",
+    # Grafo de compatibilidade: do JSON único por usuário para uma linha por aresta
+    # (apaga as marcas antigas para o grafo ser remontado na tabela nova)
+    """
+    DO $$ BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'wardrobe_compatibility' AND column_name = 'edges') THEN
+            DELETE FROM wardrobe_compatibility;
+            ALTER TABLE wardrobe_compatibility DROP COLUMN edges;
+        END IF;
+    END $$
+    """,
+]
+
+
+async def ensure_prerequisites(conn) -> None:
+    for statement in SCHEMA_PREREQUISITES:
+        await conn.execute(text(statement))
+
+
+async def upgrade_schema(conn) -> None:
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
+
+
+# item/outfit/profile têm Base própria; os demais usam app.database.Base
+MODEL_MODULES = [
+    "item", "outfit", "profile",
+    "user_preference", "outfit_feedback", "outfit_analytics", "wardrobe_compatibility", "strategy_stats",
+]
+
+
+def load_models() -> list:
+    """Importa todos os modelos (registra os relacionamentos por nome) e devolve as metadatas distintas"""
+    # import tardio: evita ciclo com app.database
+    modules = [importlib.import_module(f"app.models.{name}") for name in MODEL_MODULES]
+    metadatas = []
+    for module in modules:
+        if module.Base.metadata not in metadatas:
+            metadatas.append(module.Base.metadata)
+    return metadatas
+
+
+async def init_models(engine) -> None:
+    """Cria as tabelas que faltam e aplica SCHEMA_UPGRADES (startup ou app.jobs.migrate)"""
+    metadatas = load_models()
+    async with engine.begin() as conn:
+        await ensure_prerequisites(conn)
+        for metadata in metadatas:
+            await conn.run_sync(metadata.create_all)
+        await upgrade_schema(conn)
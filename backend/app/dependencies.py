@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
 from app.config import settings
+from functools import lru_cache
+import secrets
 
 import jwt
 import httpx
@@ -16,16 +17,27 @@ async def get_db():
         yield session
 
 
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+def _remember_user(request: Request, user_id) -> None:
+    # o middleware de main.py marca a escrita depois da resposta (já com commit)
+    request.state.user_id = str(user_id)
+
+
+@lru_cache(maxsize=1)
+def get_supabase():
+    """Cliente Supabase criado no primeiro uso (o import do pacote é lento para o cold start)"""
+    from supabase import create_client
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+
+
 security = HTTPBearer()
 
-def get_current_user_full(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def get_current_user_full(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     try:
-        response = supabase.auth.get_user(token)
+        response = get_supabase().auth.get_user(token)
         if not response.user:
             raise HTTPException(status_code=401, detail="Invalid token")
-        
+        _remember_user(request, response.user.id)
         return {
             "id": response.user.id,
             "email": response.user.email,
@@ -34,12 +46,26 @@ def get_current_user_full(credentials: HTTPAuthorizationCredentials = Depends(se
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Auth error: {str(e)}")
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     try:
-        user = supabase.auth.get_user(token)
+        user = get_supabase().auth.get_user(token)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
+        _remember_user(request, user.user.id)
         return user.user.id
     except Exception as e:
-        raise HTTPException(status_code=401, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+def require_metrics_token(x_metrics_token: str = Header(None)):
+    """Métricas internas (filas, pool, caches): só com o METRICS_TOKEN"""
+    if not settings.METRICS_TOKEN or not x_metrics_token or not secrets.compare_digest(x_metrics_token, settings.METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Metrics token required")
+
+
+async def get_read_db(user_id: str = Depends(get_current_user)):
+    """Sessão para GETs só de leitura: réplica (SUPABASE_DB_READ_URL) se configurada, senão o primário"""
+    from app.database.database import read_sessionmaker
+    async with (await read_sessionmaker(user_id))() as session:
+        yield session
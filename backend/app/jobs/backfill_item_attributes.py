@@ -0,0 +1,122 @@
+# app/jobs/backfill_item_attributes.py
+#
+# Preenche formality/warmth/color_family/pattern/occasions e o vetor de
+# similaridade (embedding) das peças antigas.
+#
+#   python -m app.jobs.backfill_item_attributes            # derivação local (sem LLM)
+#   python -m app.jobs.backfill_item_attributes --vision   # reanalisa as imagens no Gemini, em lotes
+#   python -m app.jobs.backfill_item_attributes --all      # recalcula também as já preenchidas
+
+import argparse
+import asyncio
+import logging
+from typing import List
+
+import httpx
+from sqlalchemy import or_
+from sqlalchemy.future import select
+
+from app.database.database import AsyncSessionLocal
+from app.models.item import Item
+from app.services.garment_attributes import derive_attributes, item_attributes, normalize_attributes
+from app.services.embeddings import embed_item, image_color_features
+from app.services.gemini_service import GeminiService
+from app.services.rate_limiter import Priority
+
+
+def _local_attributes(item: Item, recompute: bool = False) -> dict:
+    # sem --all, mantém o que já foi gravado e só completa o que falta
+    attributes = derive_attributes(item) if recompute else item_attributes(item)
+    for field, value in attributes.items():
+        setattr(item, field, value)
+    return {**attributes, "embedding": embed_item(item)}
+
+
+async def _download(client: httpx.AsyncClient, item: Item):
+    try:
+        response = await client.get(item.img_url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        logging.error(f"[Backfill] Falha ao baixar a imagem de {item.id}: {e}")
+        return None
+
+
+async def _vision_attributes(items: List[Item], gemini: GeminiService, recompute: bool = False) -> List[dict]:
+    """Baixa as imagens do lote e analisa em poucas chamadas (analyze_images_bytes)"""
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
+        images = await asyncio.gather(*(_download(client, item) for item in items))
+
+    downloaded = [i for i, image in enumerate(images) if image is not None]
+    analyses = {}
+    if downloaded:
+        try:
+            results = await gemini.analyze_images_bytes([images[i] for i in downloaded], priority=Priority.BATCH)
+            analyses = {i: result for i, result in zip(downloaded, results) if result is not None}
+        except Exception as e:
+            logging.error(f"[Backfill] Falha na análise em lote, usando derivação local: {e}")
+
+    updates = []
+    for index, item in enumerate(items):
+        analysis = analyses.get(index)
+        if analysis is None:
+            updates.append(_local_attributes(item, recompute))
+            continue
+        attributes = normalize_attributes(analysis, item)
+        for field, value in attributes.items():
+            setattr(item, field, value)
+        updates.append({**attributes, "embedding": embed_item(item, image_color_features(images[index]))})
+    return updates
+
+
+async def backfill(batch_size: int = 200, vision: bool = False, everything: bool = False) -> int:
+    gemini = GeminiService() if vision else None
+    updated = 0
+    last_id = None
+    async with AsyncSessionLocal() as db:
+        while True:
+            stmt = select(Item).order_by(Item.id).limit(batch_size)
+            if last_id is not None:
+                stmt = stmt.where(Item.id > last_id)
+            if not everything:
+                stmt = stmt.where(or_(
+                    Item.formality.is_(None),
+                    Item.warmth.is_(None),
+                    Item.color_family.is_(None),
+                    Item.pattern.is_(None),
+                    Item.occasions.is_(None),
+                    Item.embedding.is_(None),
+                ))
+            items = (await db.execute(stmt)).scalars().all()
+            if not items:
+                break
+
+            if gemini is not None:
+                updates = await _vision_attributes(items, gemini, recompute=everything)
+            else:
+                updates = [_local_attributes(item, recompute=everything) for item in items]
+            for item, fields in zip(items, updates):
+                for field, value in fields.items():
+                    setattr(item, field, value)
+            await db.commit()
+
+            updated += len(items)
+            last_id = items[-1].id
+            logging.info(f"[Backfill] {updated} peças atualizadas")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preenche os atributos normalizados das peças")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--vision", action="store_true", help="reanalisa as imagens com o Gemini (prioridade batch)")
+    parser.add_argument("--all", action="store_true", help="recalcula também peças já preenchidas")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(backfill(args.batch_size, vision=args.vision, everything=args.all))
+    print(f"{total} peças atualizadas")
+
+
+if __name__ == "__main__":
+    main()
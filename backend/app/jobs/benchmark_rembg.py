@@ -0,0 +1,112 @@
+# app/jobs/benchmark_rembg.py
+#
+# Compara os modelos de remoção de fundo em fotos de peças: tempo de carga
+# do modelo, latência por imagem (primeira chamada e p50/p95 das seguintes)
+# e pico de memória. Cada modelo roda em um processo próprio, para o pico de
+# memória de um não contaminar o outro.
+#
+#   python -m app.jobs.benchmark_rembg fotos/
+#   python -m app.jobs.benchmark_rembg fotos/ --models u2net u2netp silueta --repeat 5 --threads 2
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.config import settings
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _run_model(model: str, images: List[bytes], repeat: int, threads: int) -> Dict:
+    from rembg import remove
+    from app.services.background_removal import build_session
+
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    session = build_session(model, threads)
+    load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    remove(images[0], session=session)
+    first = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(repeat):
+        for image in images:
+            started = time.perf_counter()
+            remove(image, session=session)
+            latencies.append(time.perf_counter() - started)
+
+    return {
+        "model": model,
+        "load_s": load,
+        "first_s": first,
+        "p50_s": statistics.median(latencies),
+        "p95_s": _percentile(latencies, 0.95),
+        "peak_mb": _peak_rss_mb(),
+        "model_mb": _peak_rss_mb() - baseline,
+    }
+
+
+def _load_images(source: Path) -> List[bytes]:
+    files = [source] if source.is_file() else sorted(
+        p for p in source.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    return [f.read_bytes() for f in files]
+
+
+def benchmark(source: Path, models: List[str], repeat: int, threads: int) -> List[Dict]:
+    images = _load_images(source)
+    if not images:
+        raise SystemExit(f"Nenhuma imagem em {source}")
+    logging.info(f"{len(images)} imagens, {repeat} rodadas por modelo")
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for model in models:
+        with context.Pool(1) as pool:
+            try:
+                results.append(pool.apply(_run_model, (model, images, repeat, threads)))
+            except Exception as e:
+                logging.error(f"Modelo {model} falhou: {e}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência e memória dos modelos de remoção de fundo")
+    parser.add_argument("images", type=Path, help="imagem ou pasta com fotos de peças")
+    parser.add_argument("--models", nargs="+", default=settings.REMBG_ALLOWED_MODELS)
+    parser.add_argument("--repeat", type=int, default=3, help="rodadas sobre o conjunto (depois da primeira chamada)")
+    parser.add_argument("--threads", type=int, default=settings.REMBG_INTRA_OP_THREADS, help="intra-op threads (0 = padrão)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = benchmark(args.images, args.models, max(1, args.repeat), args.threads)
+
+    print(f"{'modelo':<20}{'carga(s)':>10}{'1ª(s)':>10}{'p50(s)':>10}{'p95(s)':>10}{'pico(MB)':>10}{'modelo(MB)':>12}")
+    for r in results:
+        print(
+            f"{r['model']:<20}{r['load_s']:>10.2f}{r['first_s']:>10.3f}{r['p50_s']:>10.3f}"
+            f"{r['p95_s']:>10.3f}{r['peak_mb']:>10.0f}{r['model_mb']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
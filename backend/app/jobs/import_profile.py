@@ -0,0 +1,63 @@
+# app/jobs/import_profile.py
+#
+# Mede quanto cada import custa no cold start (python -X importtime em um
+# processo limpo) e lista os mais caros, por módulo e por pacote raiz.
+#
+#   python -m app.jobs.import_profile                   # import do main (a API inteira)
+#   python -m app.jobs.import_profile --module app.routers.items --top 15
+
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def profile_imports(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """(segundos de parede, [(módulo, self_us, cumulativo_us)]) do import em um interpretador novo"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Import de {module} falhou:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # import time:   self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return float(proc.stdout.strip().splitlines()[-1]), rows
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Tempo próprio somado por pacote raiz (rembg, onnxruntime, supabase...)"""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.strip().split(".")[0]] += self_us
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil de tempo de import do cold start")
+    parser.add_argument("--module", default="main", help="módulo a importar (padrão: main)")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    wall, rows = profile_imports(args.module)
+    print(f"import {args.module}: {wall:.2f}s, {len(rows)} módulos\n")
+
+    print(f"{'cumulativo(ms)':>15}{'próprio(ms)':>13}  módulo")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>15.1f}{self_us / 1000:>13.1f}  {name}")
+
+    print(f"\n{'próprio(ms)':>15}  pacote")
+    for package, self_us in sorted(by_package(rows).items(), key=lambda p: p[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>15.1f}  {package}")
+
+
+if __name__ == "__main__":
+    main()
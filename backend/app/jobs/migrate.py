@@ -0,0 +1,28 @@
+# app/jobs/migrate.py
+#
+# Cria as tabelas e aplica SCHEMA_UPGRADES fora do startup da API. Use com
+# RUN_DDL_ON_STARTUP=false (deploy serverless/autoscaling): roda uma vez por
+# deploy em vez de em cada instância que sobe.
+#
+#   python -m app.jobs.migrate
+
+import asyncio
+import logging
+
+from app.database.database import engine
+from app.database.schema import init_models
+
+
+async def migrate() -> None:
+    await init_models(engine)
+    await engine.dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate())
+    print("Schema atualizado")
+
+
+if __name__ == "__main__":
+    main()
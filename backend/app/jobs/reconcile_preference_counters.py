@@ -0,0 +1,53 @@
+# app/jobs/reconcile_preference_counters.py
+#
+# Recalcula outfit_count/feedback_count/rating_sum de user_preferences com
+# COUNT/SUM sobre outfits e outfit_feedback. Os contadores são mantidos por
+# incremento; se um incremento falhar (e a ressincronização imediata também),
+# este job corrige a diferença. Rodar periodicamente (ex.: diário).
+#
+#   python -m app.jobs.reconcile_preference_counters
+#   python -m app.jobs.reconcile_preference_counters --batch-size 1000
+
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy.future import select
+
+from app.database.database import AsyncSessionLocal
+from app.models.user_preference import UserPreference
+from app.services.preference_service import PreferenceService
+
+
+async def reconcile(batch_size: int = 500) -> int:
+    fixed = 0
+    last_user = None
+    async with AsyncSessionLocal() as db:
+        preferences = PreferenceService(db)
+        while True:
+            stmt = select(UserPreference.user_id).order_by(UserPreference.user_id).limit(batch_size)
+            if last_user is not None:
+                stmt = stmt.where(UserPreference.user_id > last_user)
+            user_ids = (await db.execute(stmt)).scalars().all()
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                if await preferences.resync_counters(user_id):
+                    fixed += 1
+            last_user = user_ids[-1]
+            logging.info(f"[Reconcile] até {last_user}: {fixed} perfis corrigidos")
+    return fixed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula os contadores de user_preferences a partir do histórico")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(reconcile(args.batch_size))
+    print(f"{total} perfis corrigidos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# app/jobs/resume_ingestion.py
+#
+# Retoma peças do upload assíncrono que ficaram em "processing" (worker
+# reiniciado, fila cheia) ou, com --failed, as que falharam. O original
+# continua no storage em <user_id>/raw/ até o processamento terminar.
+#
+#   python -m app.jobs.resume_ingestion
+#   python -m app.jobs.resume_ingestion --failed --older-than 0
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.future import select
+
+from app.database.database import AsyncSessionLocal
+from app.models.item import Item
+from app.services.ingestion import FAILED, PROCESSING, IngestionJob, process
+
+
+async def resume(older_than_minutes: float = 10, include_failed: bool = False) -> int:
+    statuses = [PROCESSING, FAILED] if include_failed else [PROCESSING]
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=older_than_minutes)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Item.id, Item.user_id, Item.img_url, Item.bg_model).where(
+                Item.processing_status.in_(statuses),
+                Item.created_at <= cutoff,
+            )
+        )
+        pending = result.all()
+
+    resumed = 0
+    for item_id, user_id, raw_url, bg_model in pending:
+        job = IngestionJob(item_id=item_id, user_id=str(user_id), filename=raw_url, raw_url=raw_url, bg_model=bg_model)
+        try:
+            await process(job)
+            resumed += 1
+        except Exception as e:
+            logging.error(f"[ResumeIngestion] Peça {item_id} falhou de novo: {e}")
+    return resumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retoma o processamento de peças enviadas em modo assíncrono")
+    parser.add_argument("--older-than", type=float, default=10, help="minutos desde o upload (evita pegar jobs em andamento)")
+    parser.add_argument("--failed", action="store_true", help="tenta de novo também as peças que falharam")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(resume(args.older_than, include_failed=args.failed))
+    print(f"{total} peças processadas")
+
+
+if __name__ == "__main__":
+    main()
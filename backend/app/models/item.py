@@ -1,11 +1,16 @@
 
-from sqlalchemy import Column, UUID, Text, ARRAY, Boolean, Numeric, TIMESTAMP
+from sqlalchemy import Column, UUID, Text, ARRAY, Boolean, Numeric, TIMESTAMP, SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
+from pgvector.sqlalchemy import Vector
 import uuid
 from datetime import datetime
 
 Base = declarative_base()
 
+# Dimensão do vetor de similaridade das peças (ver services/embeddings.py)
+EMBEDDING_DIM = 64
+
 class Item(Base):
     __tablename__ = "items"
 
@@ -23,3 +28,19 @@ class Item(Base):
     characteristics = Column(ARRAY(Text)) 
     style = Column(Text)                  
     created_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
+
+    # Atributos normalizados calculados no upload (ver garment_attributes.py)
+    formality = Column(Text, index=True)      # casual | semi-formal | formal
+    warmth = Column(SmallInteger)             # 1 (leve) .. 5 (quente)
+    color_family = Column(Text, index=True)
+    pattern = Column(Text)
+    occasions = Column(ARRAY(Text))
+    # Upload assíncrono: ready | processing | failed (ver services/ingestion.py)
+    processing_status = Column(Text, nullable=False, default="ready", server_default="ready")
+    processing_error = Column(Text)
+    # Caminho do original no bucket (<user_id>/raw/...): único, torna o /uploads/complete idempotente
+    raw_path = Column(Text)
+    # Modelo do rembg pedido no upload (None = REMBG_MODEL): o resume_ingestion reusa o mesmo
+    bg_model = Column(Text)
+    # Não é carregado por padrão; use select(Item.embedding) quando precisar
+    embedding = deferred(Column(Vector(EMBEDDING_DIM)))
@@ -1,6 +1,5 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, Float, DateTime, JSON, Text
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
 from app.database import Base
 import uuid
 from datetime import datetime
@@ -10,8 +9,9 @@ class OutfitAnalytics(Base):
     __tablename__ = "outfit_analytics"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    outfit_id = Column(UUID(as_uuid=True), ForeignKey("outfits.id"), nullable=False)
+    # FKs para auth.users / outfits definidas no schema SQL (tabelas fora deste metadata)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    outfit_id = Column(UUID(as_uuid=True), nullable=False, index=True)
     
     # Métricas de performance
     generation_time = Column(Float, nullable=True)  # Tempo de geração em segundos
@@ -28,9 +28,6 @@ class OutfitAnalytics(Base):
     color_harmony_score = Column(Float, nullable=True)
     style_compatibility_score = Column(Float, nullable=True)
     trend_alignment_score = Column(Float, nullable=True)
+    narrative = Column(Text, nullable=True)  # texto final (pode chegar depois, em segundo plano)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    # Relacionamentos
-    user = relationship("User", back_populates="outfit_analytics")
-    outfit = relationship("Outfit", back_populates="analytics")
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
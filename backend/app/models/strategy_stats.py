@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, Integer, Float, DateTime, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+import uuid
+from datetime import datetime
+
+
+class StrategyStats(Base):
+    __tablename__ = "outfit_strategy_stats"
+    __table_args__ = (UniqueConstraint("context_key", "strategy", name="uq_outfit_strategy_stats_context"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # "<tipo_evento>|<formalidade>" normalizado, ou "*" para o agregado global
+    context_key = Column(String, nullable=False, index=True)
+    strategy = Column(String, nullable=False)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)  # outfit completo e parseado
+    latency_sum = Column(Float, nullable=False, default=0.0)  # segundos, só das tentativas
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)  # notas 1-5 dos outfits gerados
+
+    updated_at = Column(DateTime, default=datetime.utcnow)
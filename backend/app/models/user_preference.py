@@ -1,6 +1,5 @@
-from sqlalchemy import Column, String, JSON, DateTime, ForeignKey
+from sqlalchemy import Column, String, JSON, DateTime, Integer
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
 from app.database import Base
 import uuid
 from datetime import datetime
@@ -10,11 +9,23 @@ class UserPreference(Base):
     __tablename__ = "user_preferences"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False, unique=True, index=True)  # FK para auth.users definida no schema SQL
     preferred_colors = Column(JSON, nullable=True)
     preferred_styles = Column(JSON, nullable=True)
     preferred_formality = Column(String, nullable=True)
     avoided_combinations = Column(JSON, nullable=True)
     favorite_items = Column(JSON, nullable=True)
+
+    # Histogramas mantidos incrementalmente a cada outfit salvo / feedback
+    color_histogram = Column(JSON, nullable=True)
+    style_histogram = Column(JSON, nullable=True)
+    category_histogram = Column(JSON, nullable=True)
+    formality_histogram = Column(JSON, nullable=True)
+    outfit_count = Column(Integer, nullable=False, default=0)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    # Pesos do aprendizado online: {"feature": [peso, timestamp]}
+    preference_weights = Column(JSON, nullable=True)
+
     last_updated = Column(DateTime, default=datetime.utcnow)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
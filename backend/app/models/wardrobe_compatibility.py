@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, Integer, SmallInteger, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.database import Base
+import uuid
+from datetime import datetime
+
+
+class WardrobeCompatibility(Base):
+    """Marca que o grafo do usuário já foi montado (as arestas ficam em wardrobe_compatibility_edges)"""
+    __tablename__ = "wardrobe_compatibility"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), nullable=False, unique=True, index=True)
+    item_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WardrobeCompatibilityEdge(Base):
+    """Uma aresta por par de peças de categorias pareadas, com item_a < item_b"""
+    __tablename__ = "wardrobe_compatibility_edges"
+    __table_args__ = (Index("ix_wardrobe_compatibility_edges_item_b", "item_b"),)
+
+    item_a = Column(UUID(as_uuid=True), primary_key=True)
+    item_b = Column(UUID(as_uuid=True), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    weight = Column(SmallInteger, nullable=False)  # 0-100
@@ -1,19 +1,33 @@
 # app/routers/items.py
 from datetime import datetime, timezone
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Path, Body
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Path, Body, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, UUID4
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from pathlib import Path as _Path
+import asyncio
+import json
+import logging
 import uuid
 import httpx
-from rembg import remove
 
-from app.dependencies import get_db, get_current_user
+from app.dependencies import get_db, get_read_db, get_current_user
 from app.models.item import Item as ItemModel
-from app.schemas.item import ItemCreate, Item
+from app.schemas.item import Item, ItemBatchFailure, ItemBatchResponse, ItemProcessingStatus, SimilarItem, SignedUploadRequest, SignedUploadResponse, UploadCompleteRequest
 from app.services.gemini_service import GeminiService
+from app.services.rate_limiter import Priority
+from app.services.wardrobe_cache import wardrobe_cache
+from app.services.resilience import CircuitOpenError
+from app.services.garment_attributes import ATTRIBUTE_SOURCE_FIELDS, derive_attributes, validate_attributes
+from app.services import storage
+from app.services.background_removal import background_remover, resolve_model
+from app.services.ingestion import IngestionJob, PROCESSING, READY, ingestion_queue, item_payload
+from app.services.embeddings import embed_item, image_color_features, image_part, nearest_items
+from app.services.compatibility import CompatibilityService
 from app.config import settings
 
 router = APIRouter()  # prefix("/items") set in main.py
@@ -31,61 +45,60 @@ class ItemUpdate(BaseModel):
     img_url: Optional[str] = None
     for_sale: Optional[bool] = None
     price: Optional[float] = None
+    formality: Optional[str] = None
+    warmth: Optional[int] = None
+    color_family: Optional[str] = None
+    pattern: Optional[str] = None
+    occasions: Optional[List[str]] = None
 
 # --- Helpers ---
 def _extract_supabase_path(public_url: str) -> str:
-    prefix = (
-        f"{settings.SUPABASE_URL}/storage/v1/object/public/"
-        f"{settings.SUPABASE_STORAGE_BUCKET}/"
-    )
-    return public_url.replace(prefix, "")
+    return storage.object_path(public_url)
 
 async def _upload_bytes_to_supabase(
     image_bytes: bytes,
     user_id: str,
     filename: str,
+    folder: str = "",
+    content_type: str = "image/png",
 ) -> str:
-    ext = _Path(filename).suffix or ".png"
-    file_key = f"{user_id}/{uuid.uuid4()}{ext}"
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{settings.SUPABASE_URL}/storage/v1/object/"
-                f"{settings.SUPABASE_STORAGE_BUCKET}/{file_key}",
-                headers={
-                    "Authorization": f"Bearer {settings.SUPABASE_KEY}",
-                    "Content-Type": "image/png",
-                },
-                content=image_bytes,
-            )
-            if resp.status_code not in (200, 201):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Upload failed: {resp.status_code} {resp.text}"
-                )
-    except HTTPException:
-        raise
+        return await storage.upload_bytes(image_bytes, storage.new_object_key(user_id, filename, folder), content_type)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Storage temporarily unavailable")
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Upload failed: {e.response.status_code} {e.response.text}"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
-    return (
-        f"{settings.SUPABASE_URL}/storage/v1/object/public/"
-        f"{settings.SUPABASE_STORAGE_BUCKET}/{file_key}"
-    )
+def _bg_model(name: Optional[str]) -> str:
+    try:
+        return resolve_model(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- Routes ---
-@router.post("/", response_model=Item)
+@router.post("/", response_model=Item, responses={202: {"model": Item}})
 async def create_item(
     file: UploadFile = File(...),
+    async_processing: bool = Query(False, description="responde 202 e processa a imagem em segundo plano"),
+    bg_model: Optional[str] = Query(None, description="modelo de remoção de fundo (ex.: u2netp, isnet-general-use)"),
     user_id: str = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     # Lê os bytes da imagem enviada
     image_bytes = await file.read()
+    bg_model = _bg_model(bg_model)
+
+    if async_processing or settings.ITEM_ASYNC_INGESTION:
+        return await _enqueue_item(image_bytes, file, user_id, db, bg_model)
 
     # Remove fundo da imagem
     try:
-        image_without_bg = remove(image_bytes)
+        image_without_bg = await background_remover.remove_async(image_bytes, bg_model)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao remover fundo da imagem: {e}")
 
@@ -94,45 +107,280 @@ async def create_item(
 
     # Analisa imagem sem fundo com Gemini
     gemini = GeminiService()
-    analysis = await gemini.analyze_image_bytes(image_without_bg)
-
-    payload = ItemCreate(
-        name=analysis.get("clothe_type"),
-        type=analysis.get("clothe_type"),
-        characteristics=analysis.get("characteristics"),
-        style=analysis.get("style"),
-        color=analysis.get("color"),
-        category=analysis.get("category"),
-        state="new",
-        season=analysis.get("season", []),
-        img_url=img_url,
-        for_sale=False,
-    )
+    try:
+        analysis = await gemini.analyze_image_bytes(image_without_bg)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Image analysis temporarily unavailable")
+
+    payload = item_payload(analysis, img_url)
 
     db_item = ItemModel(
         id=uuid.uuid4(),
         user_id=uuid.UUID(user_id),
         created_at=datetime.now(timezone.utc),
+        embedding=embed_item(payload, image_color_features(image_without_bg)),
         **payload.dict(),
     )
     db.add(db_item)
     await db.commit()
     await db.refresh(db_item)
+    wardrobe_cache.invalidate(user_id)
+    await CompatibilityService(db).add_item(db_item.user_id, db_item)
     return db_item
 
+@router.post("/batch", response_model=ItemBatchResponse)
+async def create_items_batch(
+    files: List[UploadFile] = File(...),
+    bg_model: Optional[str] = Query(None, description="modelo de remoção de fundo (ex.: u2netp, isnet-general-use)"),
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Importação de várias fotos: as análises de visão vão em lotes para o Gemini"""
+    if len(files) > settings.ITEM_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {settings.ITEM_BATCH_MAX_FILES} imagens por lote")
+    bg_model = _bg_model(bg_model)
+
+    failed: List[ItemBatchFailure] = []
+
+    async def prepare(file: UploadFile):
+        try:
+            without_bg = await background_remover.remove_async(await file.read(), bg_model)
+            return without_bg, await storage.upload_bytes(without_bg, storage.new_object_key(user_id, file.filename))
+        except Exception as e:
+            failed.append(ItemBatchFailure(filename=file.filename, error=f"Erro ao processar imagem: {e}"))
+            return None
+
+    prepared = [(file, p) for file, p in zip(files, await asyncio.gather(*(prepare(f) for f in files))) if p]
+    if not prepared:
+        return ItemBatchResponse(items=[], failed=failed)
+
+    try:
+        analyses = await GeminiService().analyze_images_bytes([image for _, (image, _) in prepared], priority=Priority.INGESTION)
+    except CircuitOpenError:
+        analyses = [None] * len(prepared)
+
+    created = []
+    for (file, (image, img_url)), analysis in zip(prepared, analyses):
+        if analysis is None:
+            try:
+                await storage.delete_object(storage.object_path(img_url))
+            except Exception as e:
+                logging.error(f"Erro ao apagar imagem de peça não analisada: {e}")
+            failed.append(ItemBatchFailure(filename=file.filename, error="Falha na análise da imagem"))
+            continue
+        payload = item_payload(analysis, img_url)
+        db_item = ItemModel(
+            id=uuid.uuid4(),
+            user_id=uuid.UUID(user_id),
+            created_at=datetime.now(timezone.utc),
+            embedding=embed_item(payload, image_color_features(image)),
+            **payload.dict(),
+        )
+        db.add(db_item)
+        created.append(db_item)
+
+    if created:
+        await db.commit()
+        for db_item in created:
+            await db.refresh(db_item)
+        wardrobe_cache.invalidate(user_id)
+        compatibility = CompatibilityService(db)
+        for db_item in created:
+            await compatibility.add_item(db_item.user_id, db_item)
+    return ItemBatchResponse(items=[Item.model_validate(i) for i in created], failed=failed)
+
+async def _enqueue_item(image_bytes: bytes, file: UploadFile, user_id: str, db: AsyncSession, bg_model: Optional[str] = None) -> JSONResponse:
+    """Guarda o original, cria a peça em "processing" e deixa o pipeline para os workers"""
+    _require_queue_capacity()
+    raw_url = await _upload_bytes_to_supabase(
+        image_bytes, user_id, file.filename, folder="raw", content_type=file.content_type or "application/octet-stream"
+    )
+    return await _start_ingestion(db, user_id, raw_url, file.filename or "", image_bytes, bg_model, raw_path=storage.object_path(raw_url))
+
+def _require_queue_capacity() -> None:
+    # checa antes de gravar qualquer coisa: o retry do cliente não deixa original nem peça órfã
+    if not ingestion_queue.has_capacity():
+        raise HTTPException(status_code=503, detail="Fila de processamento cheia, tente novamente", headers={"Retry-After": "30"})
+
+async def _start_ingestion(
+    db: AsyncSession,
+    user_id: str,
+    raw_url: str,
+    filename: str,
+    image_bytes: Optional[bytes] = None,
+    bg_model: Optional[str] = None,
+    raw_path: Optional[str] = None,
+) -> JSONResponse:
+    db_item = ItemModel(
+        id=uuid.uuid4(),
+        user_id=uuid.UUID(user_id),
+        created_at=datetime.now(timezone.utc),
+        img_url=raw_url,
+        state="new",
+        for_sale=False,
+        processing_status=PROCESSING,
+        raw_path=raw_path,
+        bg_model=bg_model,
+    )
+    db.add(db_item)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # outro /uploads/complete do mesmo arquivo ganhou a corrida: devolve a peça dele
+        await db.rollback()
+        existing = await _item_by_raw_path(db, user_id, raw_path)
+        if existing is None:
+            raise
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(Item.model_validate(existing)),
+            headers={"Location": f"/items/{existing.id}/status"},
+        )
+    await db.refresh(db_item)
+
+    job = IngestionJob(
+        item_id=db_item.id, user_id=user_id, filename=filename, raw_url=raw_url, image_bytes=image_bytes,
+        bg_model=bg_model,
+    )
+    if not ingestion_queue.enqueue(job):
+        # Encheu entre a checagem e agora: a peça já existe, então responde 202 mesmo assim
+        # e ela fica em "processing" até app.jobs.resume_ingestion
+        logging.warning(f"[Ingestion] Fila cheia, peça {db_item.id} fica para resume_ingestion")
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(Item.model_validate(db_item)),
+        headers={"Location": f"/items/{db_item.id}/status"},
+    )
+
+async def _item_by_raw_path(db: AsyncSession, user_id: str, raw_path: Optional[str]):
+    if not raw_path:
+        return None
+    result = await db.execute(
+        select(ItemModel).where(ItemModel.user_id == user_id, ItemModel.raw_path == raw_path)
+    )
+    return result.scalar_one_or_none()
+
+@router.post("/uploads", response_model=SignedUploadResponse)
+async def create_signed_upload(
+    request: SignedUploadRequest = Body(SignedUploadRequest()),
+    user_id: str = Depends(get_current_user),
+):
+    """URL assinada para o app enviar a foto direto ao storage; depois chamar /items/uploads/complete"""
+    ext = _Path(request.filename).suffix.lower() or ".jpg"
+    if ext not in settings.ITEM_UPLOAD_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Formato não suportado: {ext}")
+    file_key = storage.new_object_key(user_id, request.filename, folder="raw")
+    try:
+        upload_url = await storage.create_signed_upload(file_key)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Storage temporarily unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar URL de upload: {e}")
+    return SignedUploadResponse(upload_url=upload_url, path=file_key)
+
+@router.post("/uploads/complete", response_model=Item, status_code=status.HTTP_202_ACCEPTED)
+async def complete_signed_upload(
+    request: UploadCompleteRequest,
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Foto já está no bucket: cria a peça em "processing" e o worker baixa o arquivo de lá"""
+    path = request.path.strip("/")
+    bg_model = _bg_model(request.bg_model)
+    # só aceita objetos da pasta raw/ do próprio usuário
+    if not path.startswith(f"{user_id}/raw/") or ".." in path:
+        raise HTTPException(status_code=403, detail="Caminho de upload inválido")
+    # complete repetido (retry do app) devolve a mesma peça, mesmo depois de processada
+    item = await _item_by_raw_path(db, user_id, path)
+    if item is not None:
+        return item
+    try:
+        size = await storage.object_size(path)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Storage temporarily unavailable")
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Não foi possível verificar o tamanho do upload")
+    if size is None:
+        raise HTTPException(status_code=404, detail="Upload não encontrado no storage")
+    if size > settings.ITEM_UPLOAD_MAX_BYTES:
+        await storage.delete_object(path)
+        raise HTTPException(status_code=413, detail="Imagem maior que o limite permitido")
+    _require_queue_capacity()
+    return await _start_ingestion(db, user_id, storage.public_url(path), path, bg_model=bg_model, raw_path=path)
+
+@router.get("/{item_id}/status", response_model=ItemProcessingStatus)
+async def get_item_status(
+    item_id: UUID4 = Path(...),
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return await _item_status(item_id, user_id, db)
+
+@router.get("/{item_id}/events")
+async def stream_item_status(
+    item_id: UUID4 = Path(...),
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Progresso do processamento via Server-Sent Events, até ready/failed"""
+    first = await _item_status(item_id, user_id, db)
+
+    async def events():
+        snapshot = first.model_dump(mode="json")
+        yield f"data: {json.dumps(snapshot)}\n\n"
+        job = ingestion_queue.get(item_id)
+        while job is not None and snapshot["status"] == PROCESSING:
+            try:
+                await asyncio.wait_for(job.changed.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            snapshot = job.snapshot()
+            yield f"data: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _item_status(item_id, user_id: str, db: AsyncSession) -> ItemProcessingStatus:
+    job = ingestion_queue.get(item_id)
+    if job is not None and job.user_id == str(user_id):
+        return ItemProcessingStatus(**job.snapshot())
+    # Job em outro worker (ou já expirado da memória): só o estado gravado
+    result = await db.execute(
+        select(ItemModel.processing_status, ItemModel.processing_error).where(
+            ItemModel.id == item_id,
+            ItemModel.user_id == user_id
+        )
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return ItemProcessingStatus(
+        item_id=item_id,
+        status=row.processing_status,
+        progress=1.0 if row.processing_status == READY else 0.0,
+        error=row.processing_error,
+    )
+
 @router.get("/", response_model=List[Item])
 async def get_items(
+    include_processing: bool = Query(False, description="inclui peças ainda em processamento ou que falharam"),
     user_id: str = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    result = await db.execute(select(ItemModel).filter_by(user_id=user_id))
-    return result.scalars().all()
+    items = list(await wardrobe_cache.get_items(db, user_id))
+    if include_processing:
+        result = await db.execute(
+            select(ItemModel).where(ItemModel.user_id == user_id, ItemModel.processing_status != READY)
+        )
+        items += result.scalars().all()
+    return items
 
 @router.get("/{item_id}", response_model=Item)
 async def get_item_by_id(
     item_id: UUID4 = Path(...),
     user_id: str = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     result = await db.execute(
         select(ItemModel).where(
@@ -161,10 +409,25 @@ async def update_item(
     item = result.scalar_one_or_none()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    for field, value in update.dict(exclude_unset=True).items():
+    try:
+        # formality/warmth/color_family/pattern/occasions só no vocabulário fechado (scoring, grafo, vetores)
+        changes = validate_attributes(update.dict(exclude_unset=True))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    for field, value in changes.items():
         setattr(item, field, value)
+    # Campos base editados: recalcula os atributos que o cliente não enviou
+    if ATTRIBUTE_SOURCE_FIELDS & changes.keys():
+        for field, value in derive_attributes(item).items():
+            if field not in changes:
+                setattr(item, field, value)
+    # Recalcula o vetor mantendo o histograma de cor da imagem original
+    old_embedding = await db.scalar(select(ItemModel.embedding).where(ItemModel.id == item.id))
+    item.embedding = embed_item(item, image_part(old_embedding))
     await db.commit()
     await db.refresh(item)
+    wardrobe_cache.invalidate(user_id)
+    await CompatibilityService(db).update_item(item.user_id, item)
     return item
 
 # Também aceita PUT para compatibilidade com clientes externos
@@ -177,6 +440,39 @@ async def update_item_put(
 ):
     return await update_item(item_id, update, user_id, db)
 
+@router.get("/{item_id}/similar", response_model=List[SimilarItem])
+async def get_similar_items(
+    item_id: UUID4 = Path(...),
+    scope: str = Query("marketplace", pattern="^(marketplace|wardrobe|all)$"),
+    same_category: bool = Query(True),
+    k: int = Query(10, ge=1, le=50),
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    result = await db.execute(
+        select(ItemModel, ItemModel.embedding).where(
+            ItemModel.id == item_id,
+            (ItemModel.user_id == user_id) | (ItemModel.for_sale == True)
+        )
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Item not found")
+    item, embedding = row
+    vector = embedding if embedding is not None else embed_item(item)
+
+    neighbours = await nearest_items(
+        db,
+        vector,
+        k=k,
+        category=item.category if same_category else None,
+        for_sale=True if scope == "marketplace" else None,
+        user_id=user_id if scope == "wardrobe" else None,
+        visible_to=user_id if scope == "all" else None,
+        exclude_ids=[item.id],
+    )
+    return [SimilarItem(item=Item.model_validate(n), similarity=s) for n, s in neighbours]
+
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(
     item_id: UUID4 = Path(...),
@@ -194,26 +490,26 @@ async def delete_item(
         raise HTTPException(status_code=404, detail="Item not found")
 
     supa_path = _extract_supabase_path(item.img_url)
-    async with httpx.AsyncClient() as client:
-        resp = await client.delete(
-            f"{settings.SUPABASE_URL}/storage/v1/object/"
-            f"{settings.SUPABASE_STORAGE_BUCKET}/{supa_path}",
-            headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"}
-        )
-        if resp.status_code not in (200, 204):
-            raise HTTPException(status_code=500, detail="Failed to delete image")
+
+    try:
+        await storage.delete_object(supa_path)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Storage temporarily unavailable")
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to delete image")
 
     await db.delete(item)
     await db.commit()
+    wardrobe_cache.invalidate(user_id)
+    await CompatibilityService(db).remove_item(item.user_id, item_id)
 
 
 @router.get("/query/join", response_model=List[Item])
 async def get_mine_and_paid_items(
     user_id: str = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    result = await db.execute(select(ItemModel).filter_by(user_id=user_id))
-    personal_items = result.scalars().all()
+    personal_items = list(await wardrobe_cache.get_items(db, user_id))
     
     paid_result = await db.execute(
         select(ItemModel).filter(
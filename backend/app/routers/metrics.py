@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends
+
+from app.services.wardrobe_cache import wardrobe_cache
+from app.services.recommendation.result_cache import outfit_result_cache
+from app.services.gemini_config import stage_latency
+from app.services.recommendation.encoding import encoding_stats
+from app.services.resilience import resilience_stats
+from app.services.rate_limiter import gemini_limiter
+from app.services.recommendation.singleflight import outfit_flights, idempotent_responses
+from app.services.recommendation.strategy_bandit import strategy_bandit
+from app.services.recommendation.event_guess import speculation_stats
+from app.services.recommendation.narrative import narrative_store
+from app.services.ingestion import ingestion_queue
+from app.services.gemini_service import vision_batch_stats
+from app.services.background_removal import background_remover
+from app.database.database import database_stats
+from app.dependencies import require_metrics_token
+
+router = APIRouter(dependencies=[Depends(require_metrics_token)])
+
+@router.get("/")
+async def get_metrics():
+    return {
+        "wardrobe_cache": wardrobe_cache.stats(),
+        "outfit_result_cache": outfit_result_cache.stats(),
+        "gemini_stages": stage_latency.stats(),
+        "prompt_encoding": encoding_stats.stats(),
+        **resilience_stats(),
+        "gemini_limiter": gemini_limiter.stats(),
+        "outfit_single_flight": outfit_flights.stats(),
+        "outfit_idempotency": idempotent_responses.stats(),
+        "strategy_bandit": strategy_bandit.stats(),
+        "outfit_speculative_scoring": speculation_stats.stats(),
+        "outfit_narratives": narrative_store.stats(),
+        "item_ingestion": ingestion_queue.stats(),
+        "gemini_vision_batches": vision_batch_stats.stats(),
+        "background_removal": background_remover.stats(),
+        "database_pool": database_stats(),
+    }
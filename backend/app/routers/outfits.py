@@ -1,16 +1,29 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Path, Query
+from datetime import datetime
+from pydantic import UUID4
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.dependencies import get_db, get_current_user
+from app.dependencies import get_db, get_read_db, get_current_user
 from app.schemas.outfit import OutfitCreate, Outfit, OutfitResponse
 from app.schemas.outfit import OutfitResponse, Outfit, OutfitCreate as OutfitSchema, OutfitRequest, CustomOutfit, CustomOutfitRequest, CustomOutfitResponse
+from app.schemas.outfit import OutfitAnalyticsResponse, OutfitSwapRequest, OutfitFeedbackRequest, OutfitFeedbackResponse, OutfitNarrativeResponse
 from app.services.recommendation_service import RecommendationService
-from typing import List
+from typing import List, Optional
 from app.models.outfit import Outfit as OutfitModel, CustomOutfit as CustomOutfitModel
 from fastapi import HTTPException  # Adicione no topo, se ainda não tiver
 from app.dependencies import get_current_user_full
 from app.services.recommendation.hybrid import HybridRecommendationService
 from app.services.recommendation.user_only import UserOnlyRecommendationService
+from app.services.recommendation.lite import LiteRecommendationService
+from app.services.recommendation.result_cache import outfit_result_cache, make_outfit_cache_key, wardrobe_fingerprint
+from app.services.wardrobe_cache import wardrobe_cache
+from app.services.recommendation.deadline import request_deadline
+from app.services.recommendation.singleflight import outfit_flights, idempotent_responses, make_flight_key, make_idempotency_key
+from app.services.recommendation.singleflight import IdempotencyConflict, body_fingerprint
+from app.services.recommendation.narrative import narrative_signature, narrative_store
+from app.services.recommendation.analytics import load_generation_context
+from app.database.database import AsyncSessionLocal
+from app.config import settings
 
 
 router = APIRouter()
@@ -19,42 +32,205 @@ router = APIRouter()
 async def create_outfit(
     outfit: OutfitRequest,
     user: dict = Depends(get_current_user_full),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    x_request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
+    deadline = request_deadline(x_request_timeout, settings.OUTFIT_DEADLINE_SECONDS)
     gender = user["metadata"].get("gender", "unspecified")
-    
-    if outfit.mode == "user_only":
-        service = UserOnlyRecommendationService(db)
-    else:
-        service = HybridRecommendationService(db)
-    
 
-    result = await service.generate_outfit(user["id"], outfit.event_raw, outfit.event_json, gender)
+    idem_key = make_idempotency_key(user["id"], idempotency_key) if idempotency_key else None
+    body_hash = body_fingerprint(outfit) if idem_key else None
+    if idem_key:
+        try:
+            stored = await idempotent_responses.lookup(idem_key, body_hash, OutfitResponse)
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key já usada com outro corpo de requisição")
+        if stored is not None:
+            return stored
 
-    if "error" in result: 
-        raise HTTPException(status_code=400, detail=result["error"])
-    
-    if "outfit" not in result:
-        raise HTTPException(status_code=400, detail=result.get("error", "Erro ao gerar o outfit"))
+    cache_key = None
+    if settings.OUTFIT_RESULT_CACHE_ENABLED:
+        wardrobe = await wardrobe_cache.get_items(db, user["id"])
+        cache_key = make_outfit_cache_key(
+            user["id"], outfit.event_raw, outfit.event_json, outfit.mode, gender, wardrobe_fingerprint(wardrobe),
+            outfit.defer_narrative,
+        )
+        cached = None if outfit.fresh else outfit_result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Requisições idênticas simultâneas (duplo toque, retry do cliente) compartilham uma geração
+    flight_key = idem_key or make_flight_key(user["id"], outfit.event_raw, outfit.event_json, outfit.mode, outfit.defer_narrative)
+    generate = lambda: _generate_outfit_response(user["id"], outfit, gender, deadline, cache_key)
+    if idem_key:
+        return await outfit_flights.do(flight_key, lambda: _idempotent(idem_key, body_hash, generate))
+    return await outfit_flights.do(flight_key, generate)
+
+
+async def _idempotent(idem_key: str, body_hash: str, generate) -> OutfitResponse:
+    """Reserva a Idempotency-Key, gera e guarda a resposta (libera a chave se falhar)"""
+    if not await idempotent_responses.reserve(idem_key, body_hash):
+        # outro worker está gerando com a mesma chave (só com OUTFIT_IDEMPOTENCY_REDIS_URL)
+        raise HTTPException(status_code=409, detail="Requisição com esta Idempotency-Key em andamento", headers={"Retry-After": "5"})
+    try:
+        response = await generate()
+    except BaseException:
+        await idempotent_responses.release(idem_key)
+        raise
+    await idempotent_responses.save(idem_key, body_hash, response)
+    return response
+
+
+async def _generate_outfit_response(user_id, outfit: OutfitRequest, gender: str, deadline, cache_key) -> OutfitResponse:
+    """Gera e persiste o outfit numa sessão própria, independente da requisição que iniciou"""
+    async with AsyncSessionLocal() as db:
+        options = {}
+        if outfit.mode == "user_only":
+            service = UserOnlyRecommendationService(db)
+        elif outfit.mode == "lite":
+            service = LiteRecommendationService(db)
+        else:
+            service = HybridRecommendationService(db)
+            # só o híbrido tem a análise final separada (lite e user_only já respondem com o texto)
+            options["defer_narrative"] = outfit.defer_narrative
+
+        result = await service.generate_outfit(user_id, outfit.event_raw, outfit.event_json, gender, deadline=deadline, **options)
+
+        if "error" in result: 
+            raise HTTPException(status_code=400, detail=result["error"])
+        
+        if "outfit" not in result:
+            raise HTTPException(status_code=400, detail=result.get("error", "Erro ao gerar o outfit"))
+
+        db_outfit_orm = result["outfit"]
+        recommendation_text = result.get("recommendation", "Não foi possível gerar uma recomendação detalhada no momento.")
+        
+        db_outfit = Outfit.from_orm(db_outfit_orm)
+        
+        # adiciona também a tabela CustomOutfitModel
+        custom_outfit = CustomOutfitModel(
+            user_id=user_id,
+            generated_by="system",  
+            items=db_outfit.items
+        )
+        
+        db.add(custom_outfit)
+        await db.commit()
+        await db.refresh(custom_outfit)
+
+    response = OutfitResponse(
+        outfit=db_outfit,
+        recommendation=recommendation_text,
+        narrative_status=result.get("narrative_status", "ready"),
+    )
+    if cache_key is not None:
+        outfit_result_cache.set(cache_key, response)
+    return response
+
+
+@router.post("/{outfit_id}/swap", response_model=OutfitResponse)
+async def swap_outfit_piece(
+    swap: OutfitSwapRequest,
+    outfit_id: UUID4 = Path(...),
+    user: dict = Depends(get_current_user_full),
+    db: AsyncSession = Depends(get_db),
+    x_request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout"),
+):
+    deadline = request_deadline(x_request_timeout, settings.OUTFIT_SWAP_DEADLINE_SECONDS)
+    result = await db.execute(
+        select(OutfitModel).where(OutfitModel.id == outfit_id, OutfitModel.user_id == user["id"])
+    )
+    original = result.scalar_one_or_none()
+    if not original:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+
+    gender = user["metadata"].get("gender", "unspecified")
+    service = HybridRecommendationService(db)
+    result = await service.swap_piece(
+        user["id"], original, swap.category, gender,
+        revalidate=swap.revalidate,
+        exclude=[str(id_) for id_ in swap.exclude],
+        deadline=deadline,
+    )
+
+    if "error" in result or "outfit" not in result:
+        raise HTTPException(status_code=400, detail=result.get("error", "Erro ao trocar peça do outfit"))
+
+    db_outfit = Outfit.from_orm(result["outfit"])
 
-    db_outfit_orm = result["outfit"]
-    recommendation_text = result.get("recommendation", "Não foi possível gerar uma recomendação detalhada no momento.")
-    
-    db_outfit = Outfit.from_orm(db_outfit_orm)
-    
-    # adiciona também a tabela CustomOutfitModel
     custom_outfit = CustomOutfitModel(
         user_id=user["id"],
-        generated_by="system",  
+        generated_by="system",
         items=db_outfit.items
     )
-    
     db.add(custom_outfit)
     await db.commit()
-    await db.refresh(custom_outfit)
 
-    
-    return OutfitResponse(outfit=db_outfit, recommendation=recommendation_text)
+    return OutfitResponse(outfit=db_outfit, recommendation=result["recommendation"])
+
+
+@router.get("/{outfit_id}/narrative", response_model=OutfitNarrativeResponse)
+async def get_outfit_narrative(
+    outfit_id: UUID4 = Path(...),
+    wait: float = Query(0.0, ge=0.0, le=30.0, description="segundos para esperar uma narrativa em andamento"),
+    user: dict = Depends(get_current_user_full),
+    db: AsyncSession = Depends(get_db),
+):
+    """Narrativa final de um outfit gerado com defer_narrative (long-poll opcional via `wait`)"""
+    result = await db.execute(
+        select(OutfitModel).where(OutfitModel.id == outfit_id, OutfitModel.user_id == user["id"])
+    )
+    outfit = result.scalar_one_or_none()
+    if not outfit:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+    # encerra a transação antes do long-poll: a conexão volta ao pool enquanto espera
+    await db.commit()
+
+    text = await narrative_store.get(outfit_id, wait=wait)
+    if text is not None:
+        return OutfitNarrativeResponse(outfit_id=outfit_id, status="ready", recommendation=text)
+    if narrative_store.is_pending(outfit_id):
+        return OutfitNarrativeResponse(outfit_id=outfit_id, status="pending")
+
+    context = await load_generation_context(db, outfit_id)
+    if context is not None and context.narrative:
+        return OutfitNarrativeResponse(outfit_id=outfit_id, status="ready", recommendation=context.narrative)
+    if context is None:
+        raise HTTPException(status_code=404, detail="Narrativa não disponível para este outfit")
+
+    # Outro worker pode estar gerando; só refaz se a geração parece ter se perdido
+    age = (datetime.utcnow() - context.created_at).total_seconds() if context.created_at else None
+    if age is not None and age >= settings.NARRATIVE_STALE_SECONDS:
+        service = HybridRecommendationService(db)
+        items = await wardrobe_cache.get_items_by_ids(db, [str(id_) for id_ in outfit.items])
+        gender = user["metadata"].get("gender", "unspecified")
+        validation = {"confidence": context.confidence_score, "score": context.validation_score}
+        service.schedule_narrative(
+            outfit.id, outfit.event_raw, outfit.event_json, items, validation, gender,
+            narrative_signature(outfit.items, context.event_context, gender),
+        )
+    return OutfitNarrativeResponse(outfit_id=outfit_id, status="pending")
+
+
+@router.post("/{outfit_id}/feedback", response_model=OutfitFeedbackResponse, status_code=201)
+async def send_outfit_feedback(
+    payload: OutfitFeedbackRequest,
+    outfit_id: UUID4 = Path(...),
+    user_id: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Nota 1-5 para um outfit gerado; atualiza as preferências aprendidas do usuário"""
+    result = await db.execute(
+        select(OutfitModel.id).where(OutfitModel.id == outfit_id, OutfitModel.user_id == user_id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Outfit not found")
+
+    record = await RecommendationService(db).save_user_feedback(user_id, outfit_id, payload.rating, payload.feedback)
+    if record is None:
+        raise HTTPException(status_code=500, detail="Erro ao salvar feedback")
+    return record
 
 
 @router.post("/custom", response_model=CustomOutfitResponse)
@@ -82,12 +258,20 @@ async def create_custom_outfit(
     
 
 @router.get("/", response_model=List[Outfit])
-async def get_outfits(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_outfits(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(OutfitModel).filter_by(user_id=user_id))
     return result.scalars().all()
 
 
 @router.get("/custom", response_model=List[CustomOutfit])
-async def get_custom_outfits(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_custom_outfits(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(CustomOutfitModel).filter_by(user_id=user_id))
-    return result.scalars().all()
\ No newline at end of file
+    return result.scalars().all()
+
+
+@router.get("/analytics", response_model=OutfitAnalyticsResponse)
+async def get_outfit_analytics(user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    analytics = await RecommendationService(db).get_outfit_analytics(user_id)
+    if not analytics:
+        raise HTTPException(status_code=500, detail="Erro ao gerar analytics")
+    return analytics
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from rembg import remove
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from typing import Optional
+from app.services.background_removal import background_remover
 from app.services.supabase_service import upload_to_supabase
 import uuid
 from io import BytesIO
@@ -7,10 +8,10 @@ from io import BytesIO
 router = APIRouter(prefix="/images", tags=["images"])
 
 @router.post("/remove-background/")
-async def remove_background_and_upload(file: UploadFile = File(...)):
+async def remove_background_and_upload(file: UploadFile = File(...), model: Optional[str] = Query(None)):
     try:
         contents = await file.read()
-        output = remove(contents)  # Remove fundo
+        output = await background_remover.remove_async(contents, model)  # Remove fundo
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao processar imagem: {e}")
 
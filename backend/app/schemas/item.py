@@ -14,6 +14,12 @@ class ItemBase(BaseModel):
     img_url: str
     for_sale: bool = False
     price: Optional[float] = None
+    formality: Optional[str] = None
+    warmth: Optional[int] = None
+    color_family: Optional[str] = None
+    pattern: Optional[str] = None
+    occasions: Optional[List[str]] = None
+    processing_status: str = "ready"
 
 class ItemCreate(ItemBase):
     pass
@@ -26,3 +32,40 @@ class Item(ItemBase):
     model_config = {
         "from_attributes": True
     }
+
+
+class ItemProcessingStatus(BaseModel):
+    item_id: UUID4
+    status: str  # ready | processing | failed
+    stage: Optional[str] = None
+    progress: float = 0.0
+    error: Optional[str] = None
+
+
+class SignedUploadRequest(BaseModel):
+    filename: str = "upload.jpg"
+
+
+class SignedUploadResponse(BaseModel):
+    upload_url: str  # PUT com os bytes da imagem, sem Authorization
+    path: str  # devolver em /items/uploads/complete
+
+
+class UploadCompleteRequest(BaseModel):
+    path: str
+    bg_model: Optional[str] = None
+
+
+class ItemBatchFailure(BaseModel):
+    filename: Optional[str] = None
+    error: str
+
+
+class ItemBatchResponse(BaseModel):
+    items: List[Item]
+    failed: List[ItemBatchFailure] = []
+
+
+class SimilarItem(BaseModel):
+    item: Item
+    similarity: float
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, UUID4
+from pydantic import BaseModel, UUID4, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from typing import Literal
+from app.schemas.item import Item
 
 class OutfitBase(BaseModel):
     event_raw: Optional[str] = None
@@ -14,7 +15,28 @@ class OutfitCreate(OutfitBase):
 class OutfitRequest(BaseModel):
     event_raw: Optional[str] = None
     event_json: Optional[Dict[str, Any]] = None
-    mode: Literal['user_only', 'hybrid'] = 'hybrid'
+    mode: Literal['user_only', 'hybrid', 'lite'] = 'hybrid'  # lite: 1 chamada ao LLM
+    fresh: bool = False  # ignora o cache de resultados e força nova geração
+    defer_narrative: bool = False  # devolve o outfit já com as peças; texto via GET /outfits/{id}/narrative
+
+class OutfitSwapRequest(BaseModel):
+    category: Literal['TOP', 'BOTTOM', 'SHOES']
+    revalidate: bool = False  # roda a validação (1 chamada ao LLM) após a troca
+    exclude: List[UUID4] = []  # peças que não devem ser sugeridas
+
+class OutfitFeedbackRequest(BaseModel):
+    rating: int = Field(..., ge=1, le=5)
+    feedback: Optional[str] = None
+
+class OutfitFeedbackResponse(BaseModel):
+    id: UUID4
+    outfit_id: UUID4
+    rating: int
+    feedback: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
 
 class Outfit(BaseModel):
     id: UUID4
@@ -47,3 +69,21 @@ class CustomOutfitResponse(BaseModel):
 class OutfitResponse(BaseModel):
     outfit: Outfit
     recommendation: str
+    narrative_status: Literal['ready', 'pending'] = 'ready'
+
+class OutfitNarrativeResponse(BaseModel):
+    outfit_id: UUID4
+    status: Literal['ready', 'pending']
+    recommendation: Optional[str] = None
+
+
+class ItemUsage(BaseModel):
+    item: Item
+    usage_count: int
+
+class OutfitAnalyticsResponse(BaseModel):
+    total_outfits: int
+    average_rating: float
+    feedback_count: int
+    most_used_items: List[ItemUsage]
+    recent_outfits: List[Outfit]
@@ -0,0 +1,104 @@
+from typing import Dict, Optional
+import asyncio
+import logging
+import threading
+import time
+
+from app.config import settings
+
+
+def resolve_model(name: Optional[str]) -> str:
+    """Modelo pedido (ou o padrão da instalação); levanta ValueError se não for permitido"""
+    model = (name or settings.REMBG_MODEL).strip().lower()
+    if model not in settings.REMBG_ALLOWED_MODELS:
+        raise ValueError(f"Modelo de remoção de fundo não suportado: {model}")
+    return model
+
+
+def build_session(model: str, intra_op_threads: Optional[int] = None):
+    """Sessão ONNX nova para o modelo, com o número de threads configurado"""
+    # rembg/onnxruntime levam segundos para importar: só quando a primeira imagem chega (ou no warm-up)
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    session_class = next((c for c in sessions_class if c.name() == model), None)
+    if session_class is None:
+        raise ValueError(f"Modelo de remoção de fundo desconhecido pelo rembg: {model}")
+    threads = settings.REMBG_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    sess_opts = ort.SessionOptions()
+    if threads > 0:
+        sess_opts.intra_op_num_threads = threads
+        sess_opts.inter_op_num_threads = 1
+    return session_class(model, sess_opts)
+
+
+class BackgroundRemover:
+    """Uma sessão ONNX por modelo, criada no primeiro uso e reaproveitada.
+
+    rembg.remove() sem sessão recarrega o modelo a cada chamada; aqui o
+    modelo fica em memória e a sessão é compartilhada entre as threads
+    (InferenceSession.run é thread-safe).
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.total_seconds: Dict[str, float] = {}
+        self.load_seconds: Dict[str, float] = {}
+        self.errors = 0
+
+    def session(self, model: str):
+        session = self._sessions.get(model)
+        if session is not None:
+            return session
+        with self._lock:
+            # outra thread pode ter carregado enquanto esperávamos o lock
+            session = self._sessions.get(model)
+            if session is None:
+                started = time.perf_counter()
+                session = build_session(model)
+                self.load_seconds[model] = round(time.perf_counter() - started, 3)
+                self._sessions[model] = session
+                logging.info(f"[rembg] Modelo {model} carregado em {self.load_seconds[model]}s")
+        return session
+
+    def remove(self, image_bytes: bytes, model: Optional[str] = None) -> bytes:
+        """Imagem PNG sem fundo (CPU: chamar fora do event loop)"""
+        from rembg import remove
+
+        model = resolve_model(model)
+        session = self.session(model)
+        started = time.perf_counter()
+        try:
+            return remove(image_bytes, session=session)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            self.total_seconds[model] = self.total_seconds.get(model, 0.0) + time.perf_counter() - started
+
+    async def warm_up(self, model: Optional[str] = None) -> None:
+        """Carrega o modelo padrão antes da primeira foto (warm-up do startup)"""
+        await asyncio.to_thread(self.session, resolve_model(model))
+
+    async def remove_async(self, image_bytes: bytes, model: Optional[str] = None) -> bytes:
+        return await asyncio.to_thread(self.remove, image_bytes, model)
+
+    def stats(self) -> Dict:
+        return {
+            "default_model": settings.REMBG_MODEL,
+            "intra_op_threads": settings.REMBG_INTRA_OP_THREADS,
+            "loaded": sorted(self._sessions),
+            "load_seconds": dict(self.load_seconds),
+            "calls": dict(self.calls),
+            "avg_seconds": {
+                model: round(self.total_seconds[model] / count, 3)
+                for model, count in self.calls.items() if count
+            },
+            "errors": self.errors,
+        }
+
+
+background_remover = BackgroundRemover()
@@ -0,0 +1,329 @@
+from datetime import datetime
+from itertools import product
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+import logging
+
+from sqlalchemy import delete, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.wardrobe_compatibility import WardrobeCompatibility, WardrobeCompatibilityEdge
+from app.services.garment_attributes import FORMALITY_LEVELS, NEUTRAL_FAMILIES, field_value, item_attributes
+from app.services.wardrobe_cache import wardrobe_cache
+
+CATEGORIES = ["TOP", "BOTTOM", "SHOES"]
+PAIRED_CATEGORIES = {
+    "TOP": ["BOTTOM", "SHOES"],
+    "BOTTOM": ["TOP", "SHOES"],
+    "SHOES": ["TOP", "BOTTOM"],
+}
+
+# Pares de famílias de cor que costumam funcionar juntos
+COMPLEMENTARY_COLORS = {
+    frozenset(pair) for pair in [
+        ("blue", "beige"), ("blue", "brown"), ("blue", "pink"), ("blue", "orange"), ("blue", "yellow"),
+        ("green", "beige"), ("green", "brown"), ("green", "pink"),
+        ("red", "blue"), ("purple", "yellow"), ("pink", "gray"), ("orange", "brown"),
+    ]
+}
+
+
+def _category(item) -> str:
+    return (field_value(item, "category") or "").upper()
+
+
+def _color_harmony(a: Optional[str], b: Optional[str]) -> float:
+    if not a or not b:
+        return 0.6
+    if a in NEUTRAL_FAMILIES and b in NEUTRAL_FAMILIES:
+        return 0.85
+    if a in NEUTRAL_FAMILIES or b in NEUTRAL_FAMILIES:
+        return 0.9
+    if a == b:
+        return 0.7  # tom sobre tom
+    if frozenset((a, b)) in COMPLEMENTARY_COLORS:
+        return 0.8
+    if "multicolor" in (a, b):
+        return 0.5
+    return 0.35
+
+
+def pair_score(a, b) -> float:
+    """Compatibilidade 0-1 entre duas peças, só com os atributos normalizados"""
+    attrs_a, attrs_b = item_attributes(a), item_attributes(b)
+
+    color = _color_harmony(attrs_a["color_family"], attrs_b["color_family"])
+
+    patterned = [p for p in (attrs_a["pattern"], attrs_b["pattern"]) if p and p != "solid"]
+    pattern = {0: 0.8, 1: 0.9, 2: 0.3}[len(patterned)]
+
+    if attrs_a["formality"] in FORMALITY_LEVELS and attrs_b["formality"] in FORMALITY_LEVELS:
+        distance = abs(FORMALITY_LEVELS.index(attrs_a["formality"]) - FORMALITY_LEVELS.index(attrs_b["formality"]))
+    else:
+        distance = 1
+    formality = 1.0 - 0.4 * distance
+
+    warmth = 1.0 - abs((attrs_a["warmth"] or 3) - (attrs_b["warmth"] or 3)) / 4.0
+
+    style_a, style_b = (field_value(a, "style") or "").lower(), (field_value(b, "style") or "").lower()
+    style = 1.0 if style_a and style_a == style_b else 0.6
+
+    return round(0.35 * color + 0.2 * pattern + 0.25 * formality + 0.1 * warmth + 0.1 * style, 2)
+
+
+def edge_key(a, b) -> Tuple[str, str]:
+    return tuple(sorted((str(a), str(b))))
+
+
+def _uuids(ids: Iterable) -> List[UUID]:
+    valid = []
+    for id_ in ids:
+        try:
+            valid.append(id_ if isinstance(id_, UUID) else UUID(str(id_)))
+        except ValueError:
+            continue
+    return valid
+
+
+class CompatibilityGraph:
+    """Pesos TOP-BOTTOM, BOTTOM-SHOES e TOP-SHOES de um guarda-roupa.
+
+    Os pesos gravados são buscados sob demanda (load) só entre as peças
+    candidatas; peças sem peso gravado (ex.: marketplace) são avaliadas na
+    hora com pair_score, desde que estejam em `items`.
+    """
+
+    def __init__(self, edges: Optional[Dict[Tuple[str, str], int]] = None, items: Iterable = (),
+                 loader: Optional[Callable[[Set[str]], Awaitable[Dict[Tuple[str, str], int]]]] = None):
+        self.edges = edges or {}
+        self.items: Dict[str, object] = {str(field_value(i, "id")): i for i in items}
+        self._loader = loader
+        self._loaded: Set[str] = set()
+        self.lookups = 0
+        self.computed = 0
+
+    async def load(self, ids: Iterable) -> None:
+        """Busca os pesos gravados entre estas peças (e as já carregadas)"""
+        ids = {str(id_) for id_ in ids}
+        if self._loader is None or ids <= self._loaded:
+            return
+        self._loaded |= ids
+        try:
+            self.edges.update(await self._loader(self._loaded))
+        except Exception as e:
+            logging.error(f"Erro ao carregar pesos de compatibilidade: {e}")
+
+    async def load_pools(self, by_category: Dict[str, List[Dict]], top_n: int = 5) -> None:
+        """load() das peças que best_outfit vai combinar"""
+        await self.load(c["id"] for category in CATEGORIES for c in by_category.get(category, [])[:top_n])
+
+    def add_items(self, items: Iterable) -> None:
+        for item in items:
+            self.items[str(field_value(item, "id"))] = item
+
+    def weight(self, a_id, b_id) -> float:
+        stored = self.edges.get(edge_key(a_id, b_id))
+        if stored is not None:
+            self.lookups += 1
+            return stored / 100.0
+        a, b = self.items.get(str(a_id)), self.items.get(str(b_id))
+        if a is None or b is None:
+            return 0.5
+        self.computed += 1
+        return pair_score(a, b)
+
+    def outfit_pairs(self, outfit_ids: List[str]) -> Dict[str, float]:
+        pairs = {}
+        for i, a in enumerate(outfit_ids):
+            for b in outfit_ids[i + 1:]:
+                pairs[f"{a}|{b}"] = self.weight(a, b)
+        return pairs
+
+    def outfit_score(self, outfit_ids: List[str]) -> float:
+        pairs = self.outfit_pairs(outfit_ids)
+        return sum(pairs.values()) / len(pairs) if pairs else 0.0
+
+    def validate(self, outfit_ids: List[str]) -> Dict:
+        """Validação local no mesmo formato da validação via LLM"""
+        pairs = self.outfit_pairs(outfit_ids)
+        if not pairs:
+            return {"valid": True, "confidence": 0.7, "score": 7.0, "source": "graph"}
+        mean = sum(pairs.values()) / len(pairs)
+        weakest = min(pairs.values())
+        return {
+            "valid": weakest >= 0.45,
+            "confidence": round(0.5 + 0.5 * mean, 2),
+            "score": round(10 * mean, 1),
+            "weakest_pair": round(10 * weakest, 1),
+            "source": "graph",
+        }
+
+    def best_outfit(self, by_category: Dict[str, List[Dict]], top_n: int = 5, pair_weight: float = 0.5) -> Optional[Tuple[List[str], float]]:
+        """Melhor combinação entre as top_n peças de cada categoria (nota individual + compatibilidade)"""
+        pools = [by_category.get(category, [])[:top_n] for category in CATEGORIES]
+        if not all(pools):
+            return None
+        best: Optional[Tuple[List[str], float]] = None
+        for combo in product(*pools):
+            ids = [str(c["id"]) for c in combo]
+            item_score = sum(float(c.get("score", 0)) for c in combo) / (10.0 * len(combo))
+            total = (1 - pair_weight) * item_score + pair_weight * self.outfit_score(ids)
+            if best is None or total > best[1]:
+                best = (ids, total)
+        return best
+
+    def best_replacement(self, candidates: List[Dict], keep_ids: List[str], pair_weight: float = 0.5) -> Optional[Dict]:
+        """Candidata que melhor combina com as peças mantidas do outfit"""
+        best, best_total = None, None
+        for candidate in candidates:
+            compat = [self.weight(candidate["id"], other) for other in keep_ids]
+            mean = sum(compat) / len(compat) if compat else 0.5
+            total = (1 - pair_weight) * float(candidate.get("score", 0)) / 10.0 + pair_weight * mean
+            if best_total is None or total > best_total:
+                best, best_total = candidate, total
+        return best
+
+
+class CompatibilityService:
+    """Grafo persistido em wardrobe_compatibility_edges (uma linha por aresta).
+
+    Cada mudança no guarda-roupa grava ou apaga só as arestas da peça
+    alterada; a marca em wardrobe_compatibility indica que o grafo já foi
+    montado para o usuário.
+    """
+
+    INSERT_CHUNK = 1000
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_graph(self, user_id: UUID, items: Optional[Iterable] = None) -> CompatibilityGraph:
+        """Grafo do usuário (pesos via graph.load); na primeira vez, monta a partir do guarda-roupa inteiro"""
+        try:
+            if items is None:
+                items = await wardrobe_cache.get_items(self.db, user_id)
+            items = list(items)
+            if await self._get_row(user_id) is None:
+                await self._build(user_id, items)
+            return CompatibilityGraph(items=items, loader=lambda ids: self._load_edges(user_id, ids))
+        except Exception as e:
+            logging.error(f"Erro ao carregar grafo de compatibilidade: {e}")
+            return CompatibilityGraph({}, items or [])
+
+    async def add_item(self, user_id: UUID, item) -> None:
+        """Liga a peça nova às peças das categorias pareadas: O(1 peça x tamanho da categoria)"""
+        try:
+            wardrobe = [w for w in await wardrobe_cache.get_items(self.db, user_id) if str(w.id) != str(item.id)]
+            if await self._get_row(user_id) is None:
+                await self._build(user_id, wardrobe + [item])
+                return
+            async with self.db.begin_nested():
+                await self._upsert_edges(user_id, self._edges_for(item, wardrobe))
+                await self._touch(user_id, item_delta=1)
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar grafo de compatibilidade (create): {e}")
+
+    async def update_item(self, user_id: UUID, item) -> None:
+        try:
+            wardrobe = await wardrobe_cache.get_items(self.db, user_id)
+            if await self._get_row(user_id) is None:
+                await self._build(user_id, wardrobe)
+                return
+            async with self.db.begin_nested():
+                await self._delete_edges(item.id)
+                await self._upsert_edges(user_id, self._edges_for(item, wardrobe))
+                await self._touch(user_id)
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar grafo de compatibilidade (update): {e}")
+
+    async def remove_item(self, user_id: UUID, item_id) -> None:
+        try:
+            async with self.db.begin_nested():
+                await self._delete_edges(item_id)
+                await self._touch(user_id, item_delta=-1)
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar grafo de compatibilidade (delete): {e}")
+
+    @staticmethod
+    def build_edges(items: Iterable) -> Dict[Tuple[str, str], int]:
+        by_category: Dict[str, List] = {category: [] for category in CATEGORIES}
+        for item in items:
+            if _category(item) in by_category:
+                by_category[_category(item)].append(item)
+        edges: Dict[Tuple[str, str], int] = {}
+        for first, second in [("TOP", "BOTTOM"), ("BOTTOM", "SHOES"), ("TOP", "SHOES")]:
+            for a in by_category[first]:
+                for b in by_category[second]:
+                    edges[edge_key(a.id, b.id)] = int(round(pair_score(a, b) * 100))
+        return edges
+
+    @staticmethod
+    def _edges_for(item, wardrobe: Iterable) -> Dict[Tuple[str, str], int]:
+        paired = PAIRED_CATEGORIES.get(_category(item), [])
+        return {
+            edge_key(item.id, other.id): int(round(pair_score(item, other) * 100))
+            for other in wardrobe
+            if _category(other) in paired and str(other.id) != str(item.id)
+        }
+
+    async def _get_row(self, user_id: UUID) -> Optional[WardrobeCompatibility]:
+        result = await self.db.execute(select(WardrobeCompatibility).filter_by(user_id=user_id))
+        return result.scalar_one_or_none()
+
+    async def _build(self, user_id: UUID, items: List) -> None:
+        """Monta o grafo inteiro uma vez; quem perder a corrida pela marca não regrava"""
+        try:
+            async with self.db.begin_nested():
+                stmt = insert(WardrobeCompatibility).values(
+                    id=uuid4(), user_id=user_id, item_count=len(items), updated_at=datetime.utcnow(),
+                ).on_conflict_do_nothing(index_elements=["user_id"])
+                result = await self.db.execute(stmt)
+                if result.rowcount:
+                    await self._upsert_edges(user_id, self.build_edges(items))
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao salvar grafo de compatibilidade: {e}")
+
+    async def _load_edges(self, user_id: UUID, ids: Set[str]) -> Dict[Tuple[str, str], int]:
+        uuids = _uuids(ids)
+        if len(uuids) < 2:
+            return {}
+        result = await self.db.execute(
+            select(WardrobeCompatibilityEdge.item_a, WardrobeCompatibilityEdge.item_b, WardrobeCompatibilityEdge.weight)
+            .where(WardrobeCompatibilityEdge.user_id == user_id)
+            .where(WardrobeCompatibilityEdge.item_a.in_(uuids))
+            .where(WardrobeCompatibilityEdge.item_b.in_(uuids))
+        )
+        return {edge_key(a, b): weight for a, b, weight in result.all()}
+
+    async def _upsert_edges(self, user_id: UUID, edges: Dict[Tuple[str, str], int]) -> None:
+        rows = [
+            {"item_a": UUID(a), "item_b": UUID(b), "user_id": user_id, "weight": weight}
+            for (a, b), weight in edges.items()
+        ]
+        for start in range(0, len(rows), self.INSERT_CHUNK):
+            stmt = insert(WardrobeCompatibilityEdge).values(rows[start:start + self.INSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["item_a", "item_b"],
+                set_={"weight": stmt.excluded.weight},
+            )
+            await self.db.execute(stmt)
+
+    async def _delete_edges(self, item_id) -> None:
+        item_id = item_id if isinstance(item_id, UUID) else UUID(str(item_id))
+        await self.db.execute(
+            delete(WardrobeCompatibilityEdge).where(
+                or_(WardrobeCompatibilityEdge.item_a == item_id, WardrobeCompatibilityEdge.item_b == item_id)
+            )
+        )
+
+    async def _touch(self, user_id: UUID, item_delta: int = 0) -> None:
+        values = {"updated_at": datetime.utcnow()}
+        if item_delta:
+            values["item_count"] = func.greatest(0, WardrobeCompatibility.item_count + item_delta)
+        await self.db.execute(update(WardrobeCompatibility).where(WardrobeCompatibility.user_id == user_id).values(**values))
@@ -0,0 +1,194 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import io
+import logging
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.models.item import Item, EMBEDDING_DIM
+from app.services.garment_attributes import field_value, item_attributes
+
+# As últimas posições guardam o histograma de cor da imagem (quando houver)
+IMAGE_DIM = 8
+HASHED_DIM = EMBEDDING_DIM - IMAGE_DIM
+
+FEATURE_WEIGHTS = {
+    "category": 3.0,
+    "formality": 2.0,
+    "color_family": 2.0,
+    "type": 1.5,
+    "style": 1.5,
+    "pattern": 1.0,
+    "occasion": 1.0,
+    "warmth": 1.0,
+    "season": 0.5,
+    "characteristic": 0.5,
+}
+IMAGE_WEIGHT = 1.5
+
+
+def _slot(token: str) -> Tuple[int, float]:
+    """Feature hashing com sinal: posição e sinal estáveis entre processos"""
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % HASHED_DIM, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def _norm(value) -> Optional[str]:
+    if value is None:
+        return None
+    text = " ".join(str(value).strip().lower().split())
+    return text or None
+
+
+def item_features(item) -> List[Tuple[str, float]]:
+    attrs = item_attributes(item)
+    features: List[Tuple[str, float]] = []
+
+    def add(kind: str, value, weight: float = 1.0) -> None:
+        value = _norm(value)
+        if value:
+            features.append((f"{kind}:{value}", FEATURE_WEIGHTS[kind] * weight))
+
+    add("category", field_value(item, "category"))
+    add("type", field_value(item, "type"))
+    add("style", field_value(item, "style"))
+    add("formality", attrs["formality"])
+    add("color_family", attrs["color_family"])
+    add("pattern", attrs["pattern"])
+    for occasion in attrs["occasions"] or []:
+        add("occasion", occasion)
+    for season in field_value(item, "season") or []:
+        add("season", season)
+    for characteristic in field_value(item, "characteristics") or []:
+        add("characteristic", characteristic)
+    if attrs["warmth"] is not None:
+        # vizinhos com peso menor: warmth 3 fica perto de 2 e 4
+        add("warmth", attrs["warmth"])
+        add("warmth", attrs["warmth"] - 1, 0.5)
+        add("warmth", attrs["warmth"] + 1, 0.5)
+    return features
+
+
+def image_color_features(image_bytes: bytes) -> Optional[np.ndarray]:
+    """Histograma RGB 2x2x2 dos pixels opacos (a imagem já vem sem fundo)"""
+    try:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+        image.thumbnail((64, 64))
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 4)
+        pixels = pixels[pixels[:, 3] > 128]
+        if not len(pixels):
+            return None
+        bins = (pixels[:, 0] >> 7) * 4 + (pixels[:, 1] >> 7) * 2 + (pixels[:, 2] >> 7)
+        histogram = np.bincount(bins, minlength=IMAGE_DIM).astype(np.float32)
+        return histogram / histogram.sum()
+    except Exception as e:
+        logging.error(f"[Embeddings] Erro ao extrair cores da imagem: {e}")
+        return None
+
+
+def embed_item(item, image_features: Optional[Sequence[float]] = None) -> List[float]:
+    """Vetor L2-normalizado de EMBEDDING_DIM posições, calculado localmente"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token, weight in item_features(item):
+        index, sign = _slot(token)
+        vector[index] += sign * weight
+    if image_features is not None:
+        vector[HASHED_DIM:] = np.asarray(image_features, dtype=np.float32)[:IMAGE_DIM] * IMAGE_WEIGHT
+    return _normalize(vector).tolist()
+
+
+def image_part(embedding) -> Optional[np.ndarray]:
+    """Recupera o histograma de cor de um vetor salvo (para recalcular só os atributos)"""
+    if embedding is None:
+        return None
+    tail = np.asarray(embedding, dtype=np.float32)[HASHED_DIM:]
+    if not tail.any():
+        return None
+    return tail / tail.sum()
+
+
+def centroid(vectors: Iterable[Sequence[float]]) -> Optional[List[float]]:
+    matrix = [np.asarray(v, dtype=np.float32) for v in vectors]
+    if not matrix:
+        return None
+    return _normalize(np.mean(matrix, axis=0)).tolist()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+async def nearest_items(
+    db: AsyncSession,
+    vector: Sequence[float],
+    k: int = 10,
+    category: Optional[str] = None,
+    for_sale: Optional[bool] = None,
+    user_id=None,
+    visible_to=None,
+    exclude_ids: Iterable = (),
+) -> List[Tuple[Item, float]]:
+    """Top-k por distância de cosseno, usando o índice HNSW de items.embedding.
+
+    Roda num savepoint: se a consulta falhar, só ele é desfeito e a sessão
+    continua utilizável para o fallback do chamador.
+    """
+    distance = Item.embedding.cosine_distance(list(vector)).label("distance")
+    stmt = select(Item, distance).where(Item.embedding.isnot(None))
+    if category:
+        stmt = stmt.where(Item.category.ilike(category))
+    if for_sale is not None:
+        stmt = stmt.where(Item.for_sale == for_sale)
+    if user_id is not None:
+        stmt = stmt.where(Item.user_id == user_id)
+    if visible_to is not None:
+        # peças do próprio usuário ou do marketplace
+        stmt = stmt.where((Item.user_id == visible_to) | (Item.for_sale == True))
+    exclude_ids = list(exclude_ids)
+    if exclude_ids:
+        stmt = stmt.where(Item.id.notin_(exclude_ids))
+    stmt = stmt.order_by(distance).limit(k)
+    filtered = bool(category or for_sale is not None or user_id is not None or visible_to is not None)
+    async with db.begin_nested():
+        if filtered:
+            await _tune_filtered_scan(db, k)
+        result = await db.execute(stmt)
+        rows = result.all()
+    return [(item, round(1.0 - float(dist), 4)) for item, dist in rows]
+
+
+_iterative_scan_supported = True
+# Parâmetro desconhecido / nome inválido (prefixo hnsw reservado) / valor inválido
+UNSUPPORTED_SETTING_SQLSTATES = {"42704", "42602", "22023"}
+
+
+def _sqlstate(error: Exception) -> Optional[str]:
+    orig = getattr(error, "orig", None)
+    return getattr(orig, "sqlstate", None) or getattr(getattr(orig, "__cause__", None), "sqlstate", None)
+
+
+async def _tune_filtered_scan(db: AsyncSession, k: int) -> None:
+    """Filtros são aplicados depois do índice: sem isso, categorias pequenas voltam com menos de k"""
+    global _iterative_scan_supported
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {max(int(settings.VECTOR_EF_SEARCH), k)}"))
+    if not (settings.VECTOR_ITERATIVE_SCAN and _iterative_scan_supported):
+        return
+    try:
+        # savepoint próprio: pgvector < 0.8 rejeita o parâmetro
+        async with db.begin_nested():
+            await db.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+    except Exception as e:
+        if _sqlstate(e) not in UNSUPPORTED_SETTING_SQLSTATES:
+            # erro passageiro (conexão, cancelamento): tenta de novo na próxima busca
+            logging.warning(f"[Embeddings] Falha ao ativar hnsw.iterative_scan: {e}")
+            return
+        _iterative_scan_supported = False
+        logging.warning(f"[Embeddings] hnsw.iterative_scan indisponível (pgvector < 0.8?): {e}")
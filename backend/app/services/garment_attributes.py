@@ -0,0 +1,326 @@
+from typing import Dict, Iterable, List, Optional
+import re
+
+# Vocabulário fechado dos atributos normalizados gravados em items
+FORMALITY_LEVELS = ["casual", "semi-formal", "formal"]
+PATTERNS = ["solid", "striped", "plaid", "floral", "print", "other"]
+OCCASIONS = ["work", "party", "casual", "sport", "formal_event", "date", "travel", "beach"]
+# Atributos normalizados (colunas de items) e campos a partir dos quais são derivados
+ATTRIBUTE_FIELDS = ("formality", "warmth", "color_family", "pattern", "occasions")
+ATTRIBUTE_SOURCE_FIELDS = {"name", "type", "color", "style", "season", "characteristics"}
+# warmth: 1 (muito leve) .. 5 (muito quente)
+MIN_WARMTH, MAX_WARMTH = 1, 5
+
+# Palavras (pt/en) -> família de cor
+COLOR_FAMILIES = {
+    "black": ["black", "preto", "preta", "ônix"],
+    "white": ["white", "branco", "branca", "off-white", "off white", "ivory", "marfim", "cream", "creme"],
+    "gray": ["gray", "grey", "cinza", "grafite", "charcoal", "silver", "prata"],
+    "beige": ["beige", "bege", "khaki", "cáqui", "caqui", "nude", "sand", "areia", "camel", "tan"],
+    "brown": ["brown", "marrom", "chocolate", "caramelo", "caramel", "coffee", "café", "terracotta", "terracota"],
+    "blue": ["blue", "azul", "navy", "marinho", "indigo", "índigo", "denim", "jeans", "turquoise", "turquesa", "teal"],
+    "green": ["green", "verde", "olive", "oliva", "sage", "militar", "mint", "menta"],
+    "red": ["red", "vermelho", "vermelha", "burgundy", "bordô", "vinho", "wine", "maroon"],
+    "pink": ["pink", "rosa", "magenta", "fuchsia", "fúcsia", "salmon", "salmão"],
+    "purple": ["purple", "roxo", "roxa", "lilac", "lilás", "violet", "violeta", "lavender", "lavanda"],
+    "yellow": ["yellow", "amarelo", "amarela", "mustard", "mostarda", "gold", "dourado"],
+    "orange": ["orange", "laranja", "coral", "ferrugem", "rust"],
+}
+NEUTRAL_FAMILIES = {"black", "white", "gray", "beige", "brown"}
+MULTICOLOR_WORDS = ["multicolor", "multicolorido", "colorido", "estampado", "multi"]
+
+FORMAL_WORDS = ["formal", "social", "blazer", "suit", "terno", "tailored", "alfaiataria", "dress shirt", "oxford", "scarpin", "heels", "salto", "gravata", "tie", "loafer", "mocassim"]
+SEMI_FORMAL_WORDS = ["smart", "semi", "chino", "polo", "camisa", "shirt", "cardigan", "blouse", "blusa", "midi", "ankle boot"]
+CASUAL_WORDS = ["casual", "t-shirt", "camiseta", "tee", "hoodie", "sweatshirt", "moletom", "shorts", "bermuda", "sneaker", "tênis", "jeans", "jogger", "sandal", "sandália", "chinelo", "flip", "sport", "esportivo", "athletic"]
+
+WARM_WORDS = {5: ["coat", "casaco", "parka", "puffer", "sobretudo", "wool", "lã"], 4: ["sweater", "suéter", "sweatshirt", "hoodie", "moletom", "jacket", "jaqueta", "boot", "bota", "fleece", "tricô", "knit"], 2: ["linen", "linho", "sleeveless", "regata", "tank", "sandal", "sandália"], 1: ["shorts", "bermuda", "swim", "swimsuit", "swimwear", "maiô", "biquíni", "bikini", "chinelo", "flip"]}
+
+PATTERN_WORDS = {
+    "striped": ["striped", "stripes", "listrado", "listrada", "listras"],
+    "plaid": ["plaid", "xadrez", "tartan", "checked", "checkered", "check"],
+    "floral": ["floral", "flores", "flower"],
+    "print": ["print", "printed", "estampa", "estampado", "estampada", "animal print", "poá", "polka", "graphic", "logo"],
+}
+
+OCCASION_WORDS = {
+    "work": ["trabalho", "work", "escritório", "office", "reunião", "meeting", "entrevista", "interview"],
+    "party": ["festa", "party", "balada", "aniversário", "birthday", "show"],
+    "formal_event": ["casamento", "wedding", "formatura", "gala", "cerimônia", "ceremony", "jantar formal"],
+    "sport": ["academia", "gym", "corrida", "run", "treino", "esporte", "sport", "trilha", "hike"],
+    "date": ["encontro", "date", "jantar", "dinner"],
+    "travel": ["viagem", "travel", "aeroporto", "airport"],
+    "beach": ["praia", "beach", "piscina", "pool"],
+    "casual": ["passeio", "casual", "shopping", "cinema", "almoço", "lunch", "café"],
+}
+
+# Contexto do evento (LLM) -> atributos esperados
+CLIMATE_WARMTH = {"quente": 1.5, "ameno": 3.0, "frio": 4.5}
+STATE_SCORES = {"new": 1.0, "novo": 1.0, "good": 0.8, "bom": 0.8, "used": 0.6, "usado": 0.6, "worn": 0.3, "gasto": 0.3}
+
+
+def field_value(item, key: str):
+    """Campo de um item, seja modelo/ItemRecord ou dict"""
+    if isinstance(item, dict):
+        return item.get(key)
+    return getattr(item, key, None)
+
+
+def _text(*values) -> str:
+    parts: List[str] = []
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(v) for v in value if v)
+        else:
+            parts.append(str(value))
+    return " ".join(parts).lower()
+
+
+def has_word(text: str, word: str) -> bool:
+    """Palavra ou expressão inteira, aceitando plural (brunch não casa com run, sweatshirt não casa com shirt)"""
+    return re.search(rf"(?<!\w){re.escape(word)}(?:e?s)?(?!\w)", text) is not None
+
+
+def matches_words(text: str, words: Iterable[str]) -> bool:
+    return any(has_word(text, word) for word in words)
+
+
+def normalize_color_family(color: Optional[str]) -> Optional[str]:
+    if not color:
+        return None
+    text = color.strip().lower()
+    if matches_words(text, MULTICOLOR_WORDS):
+        return "multicolor"
+    for family, words in COLOR_FAMILIES.items():
+        if matches_words(text, words):
+            return family
+    return "other"
+
+
+def normalize_formality(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    text = value.strip().lower().replace("_", "-")
+    if text in FORMALITY_LEVELS:
+        return text
+    if matches_words(text, ["semi", "semiformal", "smart"]):
+        return "semi-formal"
+    if matches_words(text, ["informal", "casual", "sport", "esportivo"]):
+        return "casual"
+    if matches_words(text, ["formal", "social"]):
+        return "formal"
+    return None
+
+
+def normalize_warmth(value) -> Optional[int]:
+    try:
+        return max(MIN_WARMTH, min(MAX_WARMTH, int(round(float(value)))))
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_pattern(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    text = value.strip().lower()
+    if text in PATTERNS:
+        return text
+    if text in ("plain", "liso", "lisa", "none"):
+        return "solid"
+    for pattern, words in PATTERN_WORDS.items():
+        if matches_words(text, words):
+            return pattern
+    return "other"
+
+
+def validate_attributes(values: Dict) -> Dict:
+    """Atributos enviados pelo cliente, normalizados; ValueError se algum valor estiver fora do vocabulário"""
+    result = {}
+    for field, value in values.items():
+        if field not in ATTRIBUTE_FIELDS or value is None:
+            result[field] = value
+            continue
+        if field == "formality":
+            normalized = normalize_formality(value) if isinstance(value, str) else None
+        elif field == "warmth":
+            valid = isinstance(value, int) and not isinstance(value, bool) and MIN_WARMTH <= value <= MAX_WARMTH
+            normalized = value if valid else None
+        elif field in ("color_family", "pattern"):
+            text = str(value).strip().lower()
+            known = list(COLOR_FAMILIES) + ["multicolor", "other"] if field == "color_family" else PATTERNS
+            guess = normalize_color_family(text) if field == "color_family" else normalize_pattern(text)
+            # "other" só vale se pedido explicitamente (é o fallback para texto desconhecido)
+            normalized = text if text in known else (guess if guess != "other" else None)
+        else:
+            items = [value] if isinstance(value, str) else list(value)
+            normalized = normalize_occasions(items)
+            if len(normalized) != len({str(v).strip().lower().replace(" ", "_") for v in items}):
+                normalized = None
+        if normalized is None:
+            raise ValueError(f"{field}: valor não reconhecido ({value!r})")
+        result[field] = normalized
+    return result
+
+
+def normalize_occasions(values) -> List[str]:
+    if not values:
+        return []
+    if isinstance(values, str):
+        values = [values]
+    result = []
+    for value in values:
+        text = str(value).strip().lower().replace(" ", "_")
+        if text in OCCASIONS and text not in result:
+            result.append(text)
+    return result
+
+
+def derive_formality(item) -> str:
+    text = _text(field_value(item, "style"), field_value(item, "type"), field_value(item, "name"), field_value(item, "characteristics"))
+    if matches_words(text, FORMAL_WORDS):
+        return "formal"
+    if matches_words(text, CASUAL_WORDS):
+        return "casual"
+    if matches_words(text, SEMI_FORMAL_WORDS):
+        return "semi-formal"
+    return "casual"
+
+
+def derive_warmth(item) -> int:
+    text = _text(field_value(item, "type"), field_value(item, "name"), field_value(item, "characteristics"))
+    for warmth in (5, 4, 1, 2):
+        if matches_words(text, WARM_WORDS[warmth]):
+            return warmth
+    seasons = {str(s).lower() for s in (field_value(item, "season") or [])}
+    if seasons & {"winter", "inverno"}:
+        return 4
+    if seasons & {"summer", "verão", "verao"}:
+        return 2
+    return 3
+
+
+def derive_pattern(item) -> str:
+    text = _text(field_value(item, "characteristics"), field_value(item, "name"), field_value(item, "color"))
+    for pattern, words in PATTERN_WORDS.items():
+        if matches_words(text, words):
+            return pattern
+    return "solid"
+
+
+def derive_occasions(item, formality: Optional[str] = None) -> List[str]:
+    formality = formality or derive_formality(item)
+    text = _text(field_value(item, "style"), field_value(item, "type"), field_value(item, "characteristics"))
+    occasions = {
+        "casual": ["casual", "travel"],
+        "semi-formal": ["work", "date", "party"],
+        "formal": ["work", "formal_event"],
+    }[formality][:]
+    if matches_words(text, ["sport", "esportivo", "athletic", "legging", "running", "dry fit"]):
+        occasions.append("sport")
+    if matches_words(text, ["swim", "swimsuit", "swimwear", "maiô", "biquíni", "bikini", "chinelo", "flip", "linho", "linen"]):
+        occasions.append("beach")
+    if matches_words(text, ["party", "festa", "brilho", "glitter", "paetê", "sequin"]):
+        occasions.append("party")
+    return normalize_occasions(occasions)
+
+
+def derive_attributes(item) -> Dict:
+    """Atributos normalizados calculados localmente a partir dos campos básicos"""
+    formality = derive_formality(item)
+    return {
+        "formality": formality,
+        "warmth": derive_warmth(item),
+        "color_family": normalize_color_family(field_value(item, "color")),
+        "pattern": derive_pattern(item),
+        "occasions": derive_occasions(item, formality),
+    }
+
+
+def normalize_attributes(analysis: Dict, item=None) -> Dict:
+    """Normaliza os atributos vindos da análise de imagem; o que faltar é derivado localmente"""
+    base = item if item is not None else {
+        "type": analysis.get("clothe_type"),
+        "color": analysis.get("color"),
+        "style": analysis.get("style"),
+        "season": analysis.get("season"),
+        "characteristics": analysis.get("characteristics"),
+    }
+    derived = derive_attributes(base)
+    formality = normalize_formality(analysis.get("formality")) or derived["formality"]
+    return {
+        "formality": formality,
+        "warmth": normalize_warmth(analysis.get("warmth")) or derived["warmth"],
+        "color_family": normalize_color_family(analysis.get("color") or field_value(base, "color")),
+        "pattern": normalize_pattern(analysis.get("pattern")) or derived["pattern"],
+        "occasions": normalize_occasions(analysis.get("occasions")) or derived["occasions"],
+    }
+
+
+def item_attributes(item) -> Dict:
+    """Atributos gravados na peça, derivando na hora os que ainda não foram preenchidos"""
+    stored = {key: field_value(item, key) for key in ATTRIBUTE_FIELDS}
+    if all(value is not None for value in stored.values()):
+        return stored
+    derived = derive_attributes(item)
+    return {key: stored[key] if stored[key] is not None else derived[key] for key in stored}
+
+
+def event_occasions(event_context: Dict) -> List[str]:
+    text = _text(event_context.get("tipo_evento"), event_context.get("ambiente"))
+    return [occasion for occasion, words in OCCASION_WORDS.items() if matches_words(text, words)]
+
+
+def score_item_locally(item, event_context: Dict, preferences: Optional[Dict] = None) -> float:
+    """Nota 0-10 sem LLM, com os mesmos pesos do prompt de scoring.
+
+    Adequação ao evento 40% (formalidade + ocasião), clima 25%, estado 15%
+    e cores/estilos sugeridos 20%.
+    """
+    attrs = item_attributes(item)
+
+    wanted_formality = normalize_formality(event_context.get("formalidade")) or "casual"
+    distance = abs(FORMALITY_LEVELS.index(attrs["formality"]) - FORMALITY_LEVELS.index(wanted_formality)) if attrs["formality"] in FORMALITY_LEVELS else 1
+    formality_fit = {0: 1.0, 1: 0.5, 2: 0.0}[distance]
+    occasions = event_occasions(event_context)
+    occasion_fit = 1.0 if not occasions else (1.0 if set(occasions) & set(attrs["occasions"] or []) else 0.4)
+    event_fit = 0.7 * formality_fit + 0.3 * occasion_fit
+
+    target_warmth = CLIMATE_WARMTH.get((event_context.get("clima_sugerido") or "").lower(), 3.0)
+    climate_fit = max(0.0, 1.0 - abs((attrs["warmth"] or 3) - target_warmth) / 3.0)
+
+    state_fit = STATE_SCORES.get((field_value(item, "state") or "").lower(), 0.7)
+
+    suggested_colors = {normalize_color_family(c) for c in event_context.get("cores_sugeridas") or []}
+    suggested_styles = {str(s).lower() for s in event_context.get("estilo_recomendado") or []}
+    style = (field_value(item, "style") or "").lower()
+    style_fit = 0.5
+    if attrs["color_family"] in suggested_colors or ("neutro" in (event_context.get("cores_sugeridas") or []) and attrs["color_family"] in NEUTRAL_FAMILIES):
+        style_fit += 0.25
+    if style and any(style in s or s in style for s in suggested_styles):
+        style_fit += 0.25
+
+    score = 10 * (0.40 * event_fit + 0.25 * climate_fit + 0.15 * state_fit + 0.20 * style_fit)
+
+    if preferences:
+        if (field_value(item, "color") or "").lower() in set(preferences.get("cores_favoritas") or []):
+            score += 0.5
+        if style and style in set(preferences.get("estilos_preferidos") or []):
+            score += 0.5
+        if str(field_value(item, "id")) in set(preferences.get("pecas_favoritas") or []):
+            score += 0.25
+
+    return round(min(10.0, score), 2)
+
+
+def score_items_locally(items: Iterable, event_context: Dict, preferences: Optional[Dict] = None) -> List[Dict]:
+    """Mesmo formato da resposta de scoring do LLM: [{id, score, reason, category}]"""
+    return [
+        {
+            "id": str(field_value(item, "id")),
+            "score": score_item_locally(item, event_context, preferences),
+            "reason": "Pontuação local por atributos",
+            "category": (field_value(item, "category") or "").upper(),
+        }
+        for item in items
+    ]
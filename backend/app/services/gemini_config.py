@@ -0,0 +1,141 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+import logging
+import math
+import time
+
+from app.config import settings
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+
+@dataclass(frozen=True)
+class StageConfig:
+    model: str
+    temperature: Optional[float] = None
+    max_output_tokens: Optional[int] = None
+    thinking_budget: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return model_url(self.model)
+
+    def generation_config(self) -> Dict:
+        config: Dict = {}
+        if self.temperature is not None:
+            config["temperature"] = self.temperature
+        if self.max_output_tokens is not None:
+            config["maxOutputTokens"] = self.max_output_tokens
+        if self.thinking_budget is not None:
+            config["thinkingConfig"] = {"thinkingBudget": self.thinking_budget}
+        return config
+
+
+def model_url(model: str) -> str:
+    return f"{GEMINI_BASE_URL}/{model}:generateContent"
+
+
+class StageLatencyTracker:
+    """Janela deslizante de latências por estágio e modelo, usada para p95 e downgrade automático.
+
+    Amostras mais velhas que max_age_seconds são descartadas: depois de um
+    downgrade, o modelo original volta a ser tentado quando a janela dele
+    esvazia.
+    """
+
+    def __init__(self, window: int = 200, max_age_seconds: float = 300.0):
+        self.window = window
+        self.max_age_seconds = max_age_seconds
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+        self.downgrades: Dict[str, int] = {}
+
+    def record(self, stage: str, model: str, seconds: float) -> None:
+        self._samples.setdefault((stage, model), deque(maxlen=self.window)).append((time.monotonic(), seconds))
+
+    @contextmanager
+    def measure(self, stage: str, model: str):
+        """Mede uma chamada HTTP; erros e timeouts também contam (cancelamento de hedge não)"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(stage, model, time.perf_counter() - started)
+            raise
+        self.record(stage, model, time.perf_counter() - started)
+
+    def _recent(self, stage: str, model: str) -> Deque[Tuple[float, float]]:
+        samples = self._samples.get((stage, model))
+        if samples is None:
+            return deque()
+        cutoff = time.monotonic() - self.max_age_seconds
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return samples
+
+    def count(self, stage: str, model: str) -> int:
+        return len(self._recent(stage, model))
+
+    def p95(self, stage: str, model: str) -> Optional[float]:
+        samples = self._recent(stage, model)
+        if not samples:
+            return None
+        ordered = sorted(seconds for _, seconds in samples)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def stats(self) -> Dict:
+        stats: Dict[str, Dict] = {}
+        for stage, model in list(self._samples):
+            p95 = self.p95(stage, model)
+            entry = stats.setdefault(stage, {"downgrades": self.downgrades.get(stage, 0), "models": {}})
+            entry["models"][model] = {
+                "count": self.count(stage, model),
+                "p95": round(p95, 3) if p95 is not None else None,
+            }
+        return stats
+
+
+stage_latency = StageLatencyTracker(
+    window=settings.GEMINI_LATENCY_WINDOW,
+    max_age_seconds=settings.GEMINI_LATENCY_MAX_AGE_SECONDS,
+)
+
+# Amostras mínimas antes de confiar no p95 para rebaixar o modelo
+MIN_SAMPLES_FOR_DOWNGRADE = 20
+
+
+def resolve_stage_config(stage: Optional[str], default_model: Optional[str] = None) -> StageConfig:
+    """Combina o modelo padrão com as configurações do estágio em settings"""
+    raw = dict(settings.GEMINI_STAGE_CONFIG.get(stage or "", {}))
+    config = StageConfig(
+        model=raw.get("model") or default_model or settings.GEMINI_DEFAULT_MODEL,
+        temperature=raw.get("temperature"),
+        max_output_tokens=raw.get("max_output_tokens"),
+        thinking_budget=raw.get("thinking_budget"),
+    )
+
+    if stage and settings.GEMINI_AUTO_DOWNGRADE:
+        budget = settings.GEMINI_STAGE_P95_BUDGET_SECONDS.get(stage)
+        # p95 só do modelo configurado: chamadas no modelo rebaixado não entram na conta
+        p95 = stage_latency.p95(stage, config.model)
+        if (
+            budget is not None
+            and p95 is not None
+            and stage_latency.count(stage, config.model) >= MIN_SAMPLES_FOR_DOWNGRADE
+            and p95 > budget
+            and config.model != settings.GEMINI_DOWNGRADE_MODEL
+        ):
+            logging.info(
+                f"[Gemini] p95 do estágio {stage} ({p95:.2f}s) acima do orçamento ({budget:.2f}s); "
+                f"usando {settings.GEMINI_DOWNGRADE_MODEL}"
+            )
+            stage_latency.downgrades[stage] = stage_latency.downgrades.get(stage, 0) + 1
+            config = StageConfig(
+                model=settings.GEMINI_DOWNGRADE_MODEL,
+                temperature=config.temperature,
+                max_output_tokens=config.max_output_tokens,
+                # thinking budget é específico do modelo original
+                thinking_budget=None,
+            )
+    return config
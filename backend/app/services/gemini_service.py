@@ -1,20 +1,30 @@
 from app.config import settings
+from typing import Dict, List, Optional
+import asyncio
 import httpx
 import json
+import logging
 import re
 import base64
 
+from app.services.gemini_config import StageConfig, resolve_stage_config, stage_latency
+from app.services.resilience import call_with_resilience, gemini_breaker
+from app.services.rate_limiter import Priority, gemini_limiter
+from app.services.recommendation.encoding import estimate_tokens
+
+# Imagens pequenas contam ~258 tokens de entrada no Gemini
+IMAGE_TOKEN_ESTIMATE = 258
+
 class GeminiService:
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
         
     def sanitize_and_parse_json(self, text: str) -> dict:
         # Remove blocos de markdown ```json ou ``` puro
         cleaned = re.sub(r"```(?:json)?\n?([\s\S]*?)\n?```", r"\1", text).strip()
         return json.loads(cleaned)
 
-    async def analyze_image_bytes(self, image_bytes: bytes) -> dict:
+    async def analyze_image_bytes(self, image_bytes: bytes, priority: Priority = Priority.INGESTION) -> dict:
         prompt = """
        <prompt>
   <role>system</role>
@@ -31,9 +41,13 @@ class GeminiService:
       "clothe_type": "string",          <!-- e.g., "shirt", "dress", "pants" -->
       "color": "string",                <!-- main color of the item -->
       "characteristics": ["string"],    <!-- e.g., "sleeveless", "v-neck", "denim" -->
-      "style": "string"                 <!-- e.g., "casual", "formal", "sporty" -->
-      "season": ["string"]              <!-- e.g., "summer", "winter", "all" -->
-      "category": "string"              <!-- must be one of: "top", "bottom", "shoes" -->
+      "style": "string",                <!-- e.g., "casual", "formal", "sporty" -->
+      "season": ["string"],             <!-- e.g., "summer", "winter", "all" -->
+      "category": "string",             <!-- must be one of: "top", "bottom", "shoes" -->
+      "formality": "string",            <!-- one of: "casual", "semi-formal", "formal" -->
+      "warmth": 3,                      <!-- integer 1 (very light) to 5 (very warm) -->
+      "pattern": "string",              <!-- one of: "solid", "striped", "plaid", "floral", "print", "other" -->
+      "occasions": ["string"]           <!-- any of: "work", "party", "casual", "sport", "formal_event", "date", "travel", "beach" -->
     }
   </output_format>
 
@@ -57,7 +71,7 @@ class GeminiService:
                         {"text": prompt},
                         {
                             "inline_data": {
-                                "mime_type": "image/jpeg",  # ou "image/png", dependendo do input
+                                "mime_type": image_mime_type(image_bytes),
                                 "data": image_base64
                             }
                         }
@@ -65,34 +79,210 @@ class GeminiService:
                 }
             ]
         }
+        stage_config = resolve_stage_config("image_analysis")
+        generation_config = stage_config.generation_config()
+        if generation_config:
+            payload["generationConfig"] = generation_config
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-            response = await client.post(
-                self.base_url,
-                headers={"Content-Type": "application/json"},
-                params={"key": self.api_key},
-                json=payload
-            )
+        estimated_tokens = estimate_tokens(prompt) + IMAGE_TOKEN_ESTIMATE + settings.GEMINI_OUTPUT_TOKEN_ESTIMATE
+        result = await self._generate(payload, "image_analysis", stage_config, estimated_tokens, priority)
 
-            try:
-                response.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error: {e}")
-                print(f"Response content: {response.text}")
-                raise
+        try:
+            raw_text = result["candidates"][0]["content"]["parts"][0]["text"]
+            return self.sanitize_and_parse_json(raw_text)
 
-            try:
-                result = response.json()
-            except json.JSONDecodeError:
-                print("Erro ao decodificar JSON da resposta:")
-                print(response.text)
-                raise
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            print("Erro ao acessar estrutura esperada do Gemini:")
+            print(json.dumps(result, indent=2))
+            raise e
+
+    async def _generate(self, payload: dict, stage: str, stage_config: StageConfig, estimated_tokens: int, priority: Priority) -> dict:
+        """POST generateContent com limiter, backoff e circuit breaker"""
+
+        async def attempt() -> dict:
+            async with gemini_limiter.slot(priority, estimated_tokens):
+                return await _post()
+
+        async def _post() -> dict:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(60.0 if stage == "image_analysis_batch" else 30.0)) as client:
+                with stage_latency.measure(stage, stage_config.model):
+                    response = await client.post(
+                        stage_config.url,
+                        headers={"Content-Type": "application/json"},
+                        params={"key": self.api_key},
+                        json=payload
+                    )
+
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    print(f"HTTP error: {e}")
+                    print(f"Response content: {response.text}")
+                    raise
+
+                try:
+                    return response.json()
+                except json.JSONDecodeError:
+                    print("Erro ao decodificar JSON da resposta:")
+                    print(response.text)
+                    raise
 
+        return await call_with_resilience(attempt, breaker=gemini_breaker, label=f"Gemini {stage}")
+
+    async def analyze_images_bytes(self, images: List[bytes], priority: Priority = Priority.BATCH) -> List[Optional[dict]]:
+        """Analisa várias imagens por requisição; resultado alinhado com `images` (None = falhou).
+
+        As imagens são divididas em lotes por quantidade e tamanho do payload.
+        Índices que faltarem na resposta (ou lote que falhar inteiro) são
+        analisados de novo, uma imagem por chamada.
+        """
+        results: List[Optional[dict]] = [None] * len(images)
+        chunks = chunk_images(images)
+
+        async def run_chunk(indexes: List[int]) -> None:
             try:
-                raw_text = result["candidates"][0]["content"]["parts"][0]["text"]
-                return self.sanitize_and_parse_json(raw_text)
+                parsed = await self._analyze_chunk([images[i] for i in indexes], priority)
+            except Exception as e:
+                vision_batch_stats.failed_batches += 1
+                logging.error(f"[Gemini] Lote de {len(indexes)} imagens falhou, analisando uma a uma: {e}")
+                return
+            for local, global_index in enumerate(indexes):
+                results[global_index] = parsed.get(local)
+
+        await asyncio.gather(*(run_chunk(indexes) for indexes in chunks))
+        vision_batch_stats.batches += len(chunks)
+        vision_batch_stats.images += len(images)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            vision_batch_stats.fallbacks += len(missing)
+            retried = await asyncio.gather(
+                *(self.analyze_image_bytes(images[i], priority=priority) for i in missing),
+                return_exceptions=True,
+            )
+            for i, result in zip(missing, retried):
+                if isinstance(result, BaseException):
+                    vision_batch_stats.failures += 1
+                    logging.error(f"[Gemini] Falha ao analisar a imagem {i} do lote: {result}")
+                else:
+                    results[i] = result
+        return results
+
+    async def _analyze_chunk(self, images: List[bytes], priority: Priority) -> Dict[int, dict]:
+        parts: List[dict] = [{"text": BATCH_PROMPT.format(count=len(images), last=len(images) - 1)}]
+        for index, image_bytes in enumerate(images):
+            parts.append({"text": f"Image {index}:"})
+            parts.append({
+                "inline_data": {
+                    "mime_type": image_mime_type(image_bytes),
+                    "data": base64.b64encode(image_bytes).decode("utf-8"),
+                }
+            })
+
+        stage_config = resolve_stage_config("image_analysis_batch")
+        payload = {
+            "contents": [{"parts": parts}],
+            "generationConfig": {
+                **stage_config.generation_config(),
+                "responseMimeType": "application/json",
+                "responseSchema": BATCH_RESPONSE_SCHEMA,
+            },
+        }
+        estimated_tokens = (
+            estimate_tokens(parts[0]["text"])
+            + len(images) * (IMAGE_TOKEN_ESTIMATE + settings.GEMINI_OUTPUT_TOKEN_ESTIMATE)
+        )
+        result = await self._generate(payload, "image_analysis_batch", stage_config, estimated_tokens, priority)
+
+        raw_text = result["candidates"][0]["content"]["parts"][0]["text"]
+        entries = self.sanitize_and_parse_json(raw_text)
+        parsed: Dict[int, dict] = {}
+        for entry in entries if isinstance(entries, list) else []:
+            index = entry.get("index") if isinstance(entry, dict) else None
+            # índice fora do lote ou sem categoria: deixa para a análise individual
+            if isinstance(index, int) and 0 <= index < len(images) and entry.get("category"):
+                parsed[index] = {k: v for k, v in entry.items() if k != "index"}
+        return parsed
+
+
+def image_mime_type(image_bytes: bytes) -> str:
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def chunk_images(images: List[bytes]) -> List[List[int]]:
+    """Índices agrupados respeitando GEMINI_BATCH_MAX_IMAGES e GEMINI_BATCH_MAX_BYTES (base64)"""
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for index, image_bytes in enumerate(images):
+        size = (len(image_bytes) + 2) // 3 * 4
+        if current and (
+            len(current) >= settings.GEMINI_BATCH_MAX_IMAGES
+            or current_bytes + size > settings.GEMINI_BATCH_MAX_BYTES
+        ):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(index)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class VisionBatchStats:
+    def __init__(self):
+        self.batches = 0
+        self.images = 0
+        self.failed_batches = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "images_per_batch": round(self.images / self.batches, 2) if self.batches else 0.0,
+            "failed_batches": self.failed_batches,
+            "single_image_fallbacks": self.fallbacks,
+            "failures": self.failures,
+        }
+
+
+vision_batch_stats = VisionBatchStats()
+
+
+BATCH_PROMPT = """You are a fashion analysis expert.
+You will receive {count} images, each preceded by its label "Image <index>:" (indexes 0 to {last}).
+Analyze the single clothing item in each image and return one JSON object per image, with "index" set to the image index.
+category must be one of "top", "bottom", "shoes"; formality one of "casual", "semi-formal", "formal";
+warmth an integer from 1 (very light) to 5 (very warm); pattern one of "solid", "striped", "plaid", "floral", "print", "other";
+occasions any of "work", "party", "casual", "sport", "formal_event", "date", "travel", "beach".
+Return only the JSON array."""
+
+_STRING = {"type": "STRING"}
+_STRINGS = {"type": "ARRAY", "items": _STRING}
 
-            except (KeyError, IndexError, json.JSONDecodeError) as e:
-                print("Erro ao acessar estrutura esperada do Gemini:")
-                print(json.dumps(result, indent=2))
-                raise e
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "index": {"type": "INTEGER"},
+            "clothe_type": _STRING,
+            "color": _STRING,
+            "characteristics": _STRINGS,
+            "style": _STRING,
+            "season": _STRINGS,
+            "category": {"type": "STRING", "enum": ["top", "bottom", "shoes"]},
+            "formality": {"type": "STRING", "enum": ["casual", "semi-formal", "formal"]},
+            "warmth": {"type": "INTEGER"},
+            "pattern": {"type": "STRING", "enum": ["solid", "striped", "plaid", "floral", "print", "other"]},
+            "occasions": _STRINGS,
+        },
+        "required": ["index", "clothe_type", "color", "category"],
+    },
+}
@@ -0,0 +1,230 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from uuid import UUID
+import asyncio
+import logging
+import time
+
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal, note_write
+from app.models.item import Item as ItemModel
+from app.schemas.item import ItemCreate
+from app.services import storage
+from app.services.background_removal import background_remover
+from app.services.compatibility import CompatibilityService
+from app.services.embeddings import embed_item, image_color_features
+from app.services.garment_attributes import normalize_attributes
+from app.services.gemini_service import GeminiService
+from app.services.rate_limiter import Priority
+from app.services.ttl_cache import TTLCache
+from app.services.wardrobe_cache import wardrobe_cache
+
+# Estados de items.processing_status
+READY = "ready"
+PROCESSING = "processing"
+FAILED = "failed"
+
+# Progresso ao entrar em cada etapa do pipeline
+STAGE_PROGRESS = {"queued": 0.0, "background_removal": 0.05, "upload": 0.35, "analysis": 0.5, "saving": 0.9}
+
+
+def item_payload(analysis: Dict, img_url: str) -> ItemCreate:
+    """Peça nova a partir da análise de visão (mesmos campos do upload síncrono)"""
+    return ItemCreate(
+        name=analysis.get("clothe_type"),
+        type=analysis.get("clothe_type"),
+        characteristics=analysis.get("characteristics"),
+        style=analysis.get("style"),
+        color=analysis.get("color"),
+        category=analysis.get("category"),
+        state="new",
+        season=analysis.get("season", []),
+        img_url=img_url,
+        for_sale=False,
+        **normalize_attributes(analysis),
+    )
+
+
+@dataclass
+class IngestionJob:
+    item_id: UUID
+    user_id: str
+    filename: str
+    raw_url: str
+    image_bytes: Optional[bytes] = None  # ausente quando retomado: baixa de raw_url
+    bg_model: Optional[str] = None  # modelo do rembg; None = settings.REMBG_MODEL
+    stage: str = "queued"
+    progress: float = 0.0
+    status: str = PROCESSING
+    error: Optional[str] = None
+    updated_at: float = field(default_factory=time.time)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def snapshot(self) -> Dict:
+        return {
+            "item_id": str(self.item_id),
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 2),
+            "error": self.error,
+        }
+
+    def advance(self, stage: str, status: str = PROCESSING, error: Optional[str] = None) -> None:
+        self.stage = stage
+        if status == READY:
+            self.progress = 1.0
+        elif status == PROCESSING:
+            self.progress = STAGE_PROGRESS.get(stage, self.progress)
+        self.status = status
+        self.error = error
+        self.updated_at = time.time()
+        # acorda quem está esperando (SSE) e arma um novo evento
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class IngestionQueue:
+    """Pool de workers para o pipeline de upload: remoção de fundo, storage, visão e gravação"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self._queue: "asyncio.Queue[IngestionJob]" = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self.jobs = TTLCache(max_entries=max(1000, max_pending * 4), ttl_seconds=3600)
+        self.completed = 0
+        self.failed = 0
+        self.busy = 0
+        self.total_seconds = 0.0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, job: IngestionJob) -> bool:
+        """False se a fila estiver cheia (o chamador decide entre 503 e processar na hora)"""
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        self.jobs.set(str(job.item_id), job)
+        return True
+
+    def has_capacity(self) -> bool:
+        return not self._queue.full()
+
+    def get(self, item_id) -> Optional[IngestionJob]:
+        return self.jobs.get(str(item_id))
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self.busy += 1
+            started = time.perf_counter()
+            try:
+                await process(job)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"[Ingestion] worker {index}: peça {job.item_id} falhou: {e}")
+            finally:
+                self.busy -= 1
+                self.total_seconds += time.perf_counter() - started
+                self._queue.task_done()
+
+    def stats(self) -> Dict:
+        finished = self.completed + self.failed
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_seconds": round(self.total_seconds / finished, 3) if finished else 0.0,
+        }
+
+
+async def process(job: IngestionJob) -> None:
+    """Roda o pipeline completo de uma peça e marca o resultado em items"""
+    img_url = None  # imagem sem fundo já no storage, até a peça gravada passar a apontar para ela
+    try:
+        image_bytes = job.image_bytes or await storage.download(job.raw_url)
+
+        job.advance("background_removal")
+        # rembg é CPU: roda fora do event loop
+        image_without_bg = await background_remover.remove_async(image_bytes, job.bg_model)
+
+        job.advance("upload")
+        img_url = await storage.upload_bytes(image_without_bg, storage.new_object_key(job.user_id, job.filename))
+
+        job.advance("analysis")
+        analysis = await GeminiService().analyze_image_bytes(image_without_bg, priority=Priority.INGESTION)
+
+        job.advance("saving")
+        payload = item_payload(analysis, img_url)
+        embedding = embed_item(payload, image_color_features(image_without_bg))
+        async with AsyncSessionLocal() as db:
+            item = (await db.execute(select(ItemModel).where(ItemModel.id == job.item_id))).scalar_one_or_none()
+            if item is None:
+                # apagada enquanto processava
+                await _discard(img_url)
+                img_url = None
+                job.advance("saving", status=FAILED, error="Item removido durante o processamento")
+                return
+            for name, value in payload.dict().items():
+                setattr(item, name, value)
+            item.embedding = embedding
+            item.processing_status = READY
+            item.processing_error = None
+            await db.commit()
+            img_url = None
+            await db.refresh(item)
+            wardrobe_cache.invalidate(job.user_id)
+            await note_write(job.user_id)
+            await CompatibilityService(db).add_item(item.user_id, item)
+
+        await _discard(job.raw_url)
+        job.image_bytes = None
+        job.advance("done", status=READY)
+    except Exception as e:
+        job.image_bytes = None
+        if img_url is not None:
+            # falhou depois do upload (análise/gravação): o retry sobe outra
+            await _discard(img_url)
+        await _mark_failed(job.item_id, str(e))
+        job.advance(job.stage, status=FAILED, error=str(e))
+        raise
+
+
+async def _discard(url: str) -> None:
+    try:
+        await storage.delete_object(storage.object_path(url))
+    except Exception as e:
+        logging.error(f"[Ingestion] Erro ao apagar {url}: {e}")
+
+
+async def _mark_failed(item_id: UUID, error: str) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            item = (await db.execute(select(ItemModel).where(ItemModel.id == item_id))).scalar_one_or_none()
+            if item is not None:
+                item.processing_status = FAILED
+                item.processing_error = error[:500]
+                await db.commit()
+    except Exception as e:
+        logging.error(f"[Ingestion] Erro ao marcar peça {item_id} como falha: {e}")
+
+
+ingestion_queue = IngestionQueue(
+    workers=settings.INGESTION_WORKERS,
+    max_pending=settings.INGESTION_QUEUE_SIZE,
+)
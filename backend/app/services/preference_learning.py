@@ -0,0 +1,100 @@
+from typing import Dict, Iterable, List, Optional
+import math
+import time
+
+from app.config import settings
+from app.services.garment_attributes import field_value, item_attributes
+
+# Pesos: {"feature": [peso, timestamp da última atualização]}
+Weights = Dict[str, List[float]]
+
+BIAS = "bias"
+
+
+def item_features(item) -> List[str]:
+    """Features de uma peça: a própria peça + atributos normalizados"""
+    attrs = item_attributes(item)
+    features = [BIAS]
+    item_id = field_value(item, "id")
+    if item_id is not None:
+        features.append(f"item:{item_id}")
+    for name in ("formality", "color_family", "pattern"):
+        if attrs.get(name):
+            features.append(f"{name}:{attrs[name]}")
+    style = (field_value(item, "style") or "").strip().lower()
+    if style:
+        features.append(f"style:{style}")
+    category = (field_value(item, "category") or "").upper()
+    if category and attrs.get("color_family"):
+        features.append(f"{category}:{attrs['color_family']}")
+    return features
+
+
+def _decay(entry: List[float], now: float) -> float:
+    """Peso com decaimento exponencial aplicado de forma preguiçosa (meia-vida em dias)"""
+    weight, updated_at = entry
+    age_days = max(0.0, now - updated_at) / 86400.0
+    return weight * 0.5 ** (age_days / settings.PREFERENCE_HALF_LIFE_DAYS)
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, x))))
+
+
+def predict(weights: Weights, features: Iterable[str], now: Optional[float] = None) -> float:
+    """Probabilidade de o usuário gostar de uma peça com essas features"""
+    now = now or time.time()
+    return _sigmoid(sum(_decay(weights[f], now) for f in features if f in weights))
+
+
+def update(weights: Optional[Weights], items: Iterable, rating: int, now: Optional[float] = None) -> Weights:
+    """Um passo de regressão logística online por peça do outfit: O(tamanho do outfit)"""
+    now = now or time.time()
+    weights = {k: list(v) for k, v in (weights or {}).items()}
+    target = (max(1, min(5, rating)) - 1) / 4.0
+    rate = settings.PREFERENCE_LEARNING_RATE
+
+    for item in items:
+        features = item_features(item)
+        error = target - predict(weights, features, now)
+        for feature in features:
+            current = _decay(weights[feature], now) if feature in weights else 0.0
+            # L2 leve para não deixar pesos de peças únicas explodirem
+            new_value = current + rate * (error - settings.PREFERENCE_L2 * current)
+            weights[feature] = [round(new_value, 4), now]
+
+    return _prune(weights)
+
+
+def _prune(weights: Weights) -> Weights:
+    limit = settings.PREFERENCE_MAX_FEATURES
+    if len(weights) <= limit:
+        return weights
+    now = time.time()
+    ranked = sorted(weights.items(), key=lambda kv: abs(_decay(kv[1], now)), reverse=True)
+    return dict(ranked[:limit])
+
+
+def preference_bonus(weights: Weights, item, now: Optional[float] = None) -> float:
+    """Ajuste na nota 0-10 da peça: até ±PREFERENCE_MAX_BONUS pontos"""
+    if not weights:
+        return 0.0
+    # sem o bias: peça nunca avaliada fica neutra
+    probability = predict(weights, item_features(item)[1:], now)
+    return round(2 * (probability - 0.5) * settings.PREFERENCE_MAX_BONUS, 2)
+
+
+def apply_bonus(scored: List[Dict], weights: Weights, items_by_id: Dict[str, object]) -> List[Dict]:
+    """Soma o bônus aprendido às notas (no formato da resposta de scoring)"""
+    if not weights:
+        return scored
+    now = time.time()
+    result = []
+    for entry in scored:
+        item = items_by_id.get(str(entry.get("id")))
+        if item is None:
+            result.append(entry)
+            continue
+        bonus = preference_bonus(weights, item, now)
+        result.append({**entry, "score": round(float(entry.get("score", 0)) + bonus, 2), "preference_bonus": bonus})
+    return result
@@ -0,0 +1,214 @@
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from app.models.outfit import Outfit
+from app.models.outfit_feedback import OutfitFeedback
+from app.models.user_preference import UserPreference
+from app.services import preference_learning
+
+
+class PreferenceService:
+    """Perfil de preferências materializado em user_preferences.
+
+    O perfil é atualizado incrementalmente quando um outfit é salvo ou um
+    feedback é registrado, então a geração de outfits lê uma única linha em
+    vez de reprocessar o histórico (e chamar o LLM) a cada requisição.
+    """
+
+    TOP_N = 5
+    # Número de outfits a partir do qual o perfil é considerado confiável
+    FULL_CONFIDENCE_OUTFITS = 20
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_preferences(self, user_id: UUID) -> Dict:
+        """Retorna o perfil no formato usado pelos prompts de recomendação"""
+        try:
+            result = await self.db.execute(select(UserPreference).filter_by(user_id=user_id))
+            pref = result.scalar_one_or_none()
+        except Exception as e:
+            logging.error(f"Erro ao buscar preferências: {e}")
+            return {}
+
+        if not pref or not pref.outfit_count:
+            return {}
+
+        favorite_items = self._top(pref.favorite_items)
+        return {
+            "cores_favoritas": pref.preferred_colors or [],
+            "estilos_preferidos": pref.preferred_styles or [],
+            "categorias_frequentes": self._top(pref.category_histogram),
+            "formalidade_usual": pref.preferred_formality,
+            "pecas_favoritas": favorite_items,
+            "confidence": round(min(1.0, pref.outfit_count / self.FULL_CONFIDENCE_OUTFITS), 2),
+        }
+
+    async def get_learned_weights(self, user_id: UUID) -> Dict:
+        """Pesos do aprendizado online (vazio se o usuário ainda não avaliou nada)"""
+        try:
+            result = await self.db.execute(
+                select(UserPreference.preference_weights).filter_by(user_id=user_id)
+            )
+            return result.scalar_one_or_none() or {}
+        except Exception as e:
+            logging.error(f"Erro ao buscar pesos de preferência: {e}")
+            return {}
+
+    async def get_counters(self, user_id: UUID) -> Optional[Dict]:
+        """Contadores mantidos incrementalmente (O(1)); None se o perfil ainda não existe"""
+        result = await self.db.execute(
+            select(
+                UserPreference.outfit_count,
+                UserPreference.feedback_count,
+                UserPreference.rating_sum,
+            ).filter_by(user_id=user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return {
+            "outfit_count": row.outfit_count or 0,
+            "feedback_count": row.feedback_count or 0,
+            "rating_sum": row.rating_sum or 0,
+        }
+
+    async def aggregate_counters(self, user_id: UUID) -> Dict:
+        """Calcula os contadores com COUNT/SUM no banco"""
+        outfit_count = await self.db.scalar(
+            select(func.count()).select_from(Outfit).where(Outfit.user_id == user_id)
+        )
+        result = await self.db.execute(
+            select(func.count(OutfitFeedback.id), func.coalesce(func.sum(OutfitFeedback.rating), 0))
+            .where(OutfitFeedback.user_id == user_id)
+        )
+        feedback_count, rating_sum = result.one()
+        return {
+            "outfit_count": outfit_count or 0,
+            "feedback_count": feedback_count or 0,
+            "rating_sum": int(rating_sum or 0),
+        }
+
+    async def resync_counters(self, user_id: UUID) -> bool:
+        """Regrava os contadores a partir de COUNT/SUM (incremento perdido ou job de reconciliação)"""
+        try:
+            async with self.db.begin_nested():
+                result = await self.db.execute(select(UserPreference).filter_by(user_id=user_id).with_for_update())
+                pref = result.scalar_one_or_none()
+                if pref is None:
+                    # sem perfil: o próximo record_* semeia a partir do histórico
+                    return False
+                counters = await self.aggregate_counters(user_id)
+                changed = any((getattr(pref, name) or 0) != value for name, value in counters.items())
+                for name, value in counters.items():
+                    setattr(pref, name, value)
+            await self.db.commit()
+            return changed
+        except Exception as e:
+            logging.error(f"Erro ao reconciliar contadores de preferências: {e}")
+            return False
+
+    async def record_outfit(self, user_id: UUID, items: Iterable, formality: Optional[str] = None) -> None:
+        """Soma as peças de um outfit recém-salvo aos histogramas do usuário"""
+        try:
+            # Savepoint: uma falha aqui não expira nem invalida o outfit já salvo na sessão
+            async with self.db.begin_nested():
+                pref, created = await self._get_for_update(user_id)
+                self._accumulate(pref, items, weight=1.0, formality=formality)
+                if not created:
+                    pref.outfit_count = (pref.outfit_count or 0) + 1
+                self._refresh_summary(pref)
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar preferências (outfit): {e}")
+            await self.resync_counters(user_id)
+
+    async def record_feedback(self, user_id: UUID, items: Iterable, rating: int) -> None:
+        """Reforça (ou penaliza) as peças de um outfit avaliado pelo usuário"""
+        items = list(items)
+        try:
+            async with self.db.begin_nested():
+                pref, created = await self._get_for_update(user_id)
+                pref.preference_weights = preference_learning.update(pref.preference_weights, items, rating)
+                # rating 1-5 -> peso -2..+2; notas neutras só contam no total
+                weight = float(rating - 3)
+                if weight:
+                    self._accumulate(pref, items, weight=weight)
+                if not created:
+                    pref.feedback_count = (pref.feedback_count or 0) + 1
+                    pref.rating_sum = (pref.rating_sum or 0) + rating
+                self._refresh_summary(pref)
+            await self.db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar preferências (feedback): {e}")
+            await self.resync_counters(user_id)
+
+    async def _get_for_update(self, user_id: UUID) -> Tuple[UserPreference, bool]:
+        stmt = select(UserPreference).filter_by(user_id=user_id).with_for_update()
+        result = await self.db.execute(stmt)
+        pref = result.scalar_one_or_none()
+        if pref is not None:
+            return pref, False
+
+        # Primeira vez: semeia os contadores com o histórico já gravado (que
+        # inclui o outfit/feedback que disparou esta atualização)
+        counters = await self.aggregate_counters(user_id)
+        pref = UserPreference(user_id=user_id, **counters)
+        self.db.add(pref)
+        return pref, True
+
+    def _accumulate(self, pref: UserPreference, items: Iterable, weight: float, formality: Optional[str] = None) -> None:
+        # Colunas JSON não rastreiam mutação in-place: sempre atribuir dicts novos
+        colors = dict(pref.color_histogram or {})
+        styles = dict(pref.style_histogram or {})
+        categories = dict(pref.category_histogram or {})
+        favorites = dict(pref.favorite_items or {})
+
+        for item in items:
+            self._bump(colors, getattr(item, "color", None), weight)
+            self._bump(styles, getattr(item, "style", None), weight)
+            self._bump(categories, getattr(item, "category", None), weight)
+            item_id = getattr(item, "id", None)
+            if item_id is not None:
+                self._bump(favorites, str(item_id), weight, normalize=False)
+
+        pref.color_histogram = colors
+        pref.style_histogram = styles
+        pref.category_histogram = categories
+        pref.favorite_items = favorites
+
+        if formality:
+            formalities = dict(pref.formality_histogram or {})
+            self._bump(formalities, formality, weight)
+            pref.formality_histogram = formalities
+
+    def _refresh_summary(self, pref: UserPreference) -> None:
+        pref.preferred_colors = self._top(pref.color_histogram)
+        pref.preferred_styles = self._top(pref.style_histogram)
+        formality = self._top(pref.formality_histogram, n=1)
+        pref.preferred_formality = formality[0] if formality else None
+        pref.last_updated = datetime.utcnow()
+
+    @staticmethod
+    def _bump(histogram: Dict[str, float], key: Optional[str], weight: float, normalize: bool = True) -> None:
+        if not key:
+            return
+        if normalize:
+            key = key.strip().lower()
+        histogram[key] = round(histogram.get(key, 0.0) + weight, 3)
+
+    @classmethod
+    def _top(cls, histogram: Optional[Dict[str, float]], n: Optional[int] = None) -> List[str]:
+        if not histogram:
+            return []
+        ranked = sorted(
+            ((key, value) for key, value in histogram.items() if value > 0),
+            key=lambda kv: kv[1],
+            reverse=True,
+        )
+        return [key for key, _ in ranked[: n or cls.TOP_N]]
@@ -0,0 +1,247 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+from app.config import settings
+
+
+class Priority(IntEnum):
+    """Menor valor = atendido primeiro"""
+    INTERACTIVE = 0  # geração de outfits (usuário esperando)
+    INGESTION = 1    # análise de imagem de peças novas
+    BATCH = 2        # backfills e jobs em background
+
+
+class LimiterTimeout(Exception):
+    """Esperou na fila do limitador mais do que o tempo disponível"""
+
+
+class TokenBucket:
+    """Balde local com `per_minute` unidades, reabastecido continuamente.
+
+    reserve() debita na hora (o saldo pode ficar negativo) e devolve quanto
+    esperar; assim quem chega depois espera mais, sem polling.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Corrige a reserva com o consumo real (delta > 0 = gastou mais que o estimado)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RedisWindow:
+    """Contadores por janela fixa de 1 minuto compartilhados entre workers"""
+
+    def __init__(self, url: str, prefix: str = "gemini_limiter"):
+        import redis.asyncio as redis  # dependência opcional
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, name: str) -> Tuple[str, float]:
+        now = time.time()
+        window = int(now // 60)
+        return f"{self.prefix}:{name}:{window}", 60 - (now % 60)
+
+    async def reserve(self, name: str, amount: int, limit: int) -> float:
+        """Reserva na janela atual; se estourar, desfaz e devolve o tempo até a próxima"""
+        key, until_next = self._key(name)
+        pipe = self.client.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, 120)
+        total, _ = await pipe.execute()
+        if total <= limit or amount > limit:
+            return 0.0
+        await self.client.decrby(key, amount)
+        return until_next
+
+    async def adjust(self, name: str, delta: int) -> None:
+        key, _ = self._key(name)
+        await self.client.incrby(key, delta)
+
+
+class GeminiLimiter:
+    """Limite global de chamadas ao Gemini: concorrência + requisições/tokens por minuto.
+
+    A fila de concorrência é ordenada por prioridade (e ordem de chegada).
+    Os baldes de RPM/TPM são locais ao processo, ou compartilhados via Redis
+    quando GEMINI_LIMITER_REDIS_URL está configurada. O teto de concorrência
+    é sempre por processo.
+    """
+
+    WAIT_WINDOW = 500
+
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int, redis_url: Optional[str] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.redis_url = redis_url
+        self._redis: Optional[RedisWindow] = None
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._waits: Dict[Priority, Deque[float]] = {p: deque(maxlen=self.WAIT_WINDOW) for p in Priority}
+        self._acquired: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.timeouts = 0
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, tokens: int = 0, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Segura uma vaga de concorrência e consome a cota de RPM/TPM"""
+        if not self.enabled:
+            yield
+            return
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._acquire_slot(priority), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LimiterTimeout(f"fila do Gemini excedeu {timeout:.1f}s")
+        try:
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            await self._wait_for_rate(tokens, remaining)
+            waited = time.monotonic() - started
+            self._waits[priority].append(waited)
+            self._acquired[priority] += 1
+            if waited > 1.0:
+                logging.info(f"[GeminiLimiter] {priority.name} esperou {waited:.2f}s na fila")
+            yield
+        finally:
+            self._release_slot()
+
+    async def adjust(self, delta_tokens: int) -> None:
+        if not self.enabled or not delta_tokens:
+            return
+        try:
+            redis = self._get_redis()
+            if redis is not None:
+                await redis.adjust("tpm", delta_tokens)
+            else:
+                self._tokens.adjust(delta_tokens)
+        except Exception as e:
+            logging.error(f"[GeminiLimiter] Erro ao ajustar cota de tokens: {e}")
+
+    async def _acquire_slot(self, priority: Priority) -> None:
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (int(priority), next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # a vaga foi entregue mas quem esperava desistiu: repassa
+                self._release_slot()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # transfere a vaga direto para o próximo; _in_flight não muda
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    async def _wait_for_rate(self, tokens: int, timeout: Optional[float]) -> None:
+        redis = self._get_redis()
+        while True:
+            if redis is not None:
+                try:
+                    wait = await redis.reserve("rpm", 1, self.rpm)
+                    if not wait:
+                        wait = await redis.reserve("tpm", tokens, self.tpm)
+                        if wait:
+                            await redis.adjust("rpm", -1)
+                except Exception as e:
+                    logging.error(f"[GeminiLimiter] Redis indisponível, usando limites locais: {e}")
+                    self._redis = None
+                    self.redis_url = None
+                    redis = None
+                    continue
+            else:
+                wait = max(self._requests.reserve(1), self._tokens.reserve(tokens))
+
+            if not wait:
+                return
+            if timeout is not None and wait > timeout:
+                if redis is None:
+                    # devolve a reserva que não vai ser usada
+                    self._requests.adjust(-1)
+                    self._tokens.adjust(-tokens)
+                self.timeouts += 1
+                raise LimiterTimeout(f"cota do Gemini só libera em {wait:.1f}s")
+            await asyncio.sleep(wait)
+            if redis is None:
+                return  # a reserva local já foi debitada
+            if timeout is not None:
+                timeout -= wait
+
+    def _get_redis(self) -> Optional[RedisWindow]:
+        if self._redis is None and self.redis_url:
+            try:
+                self._redis = RedisWindow(self.redis_url)
+            except Exception as e:
+                logging.error(f"[GeminiLimiter] Não foi possível usar Redis ({e}); limites locais")
+                self.redis_url = None
+        return self._redis
+
+    def stats(self) -> Dict:
+        by_priority = {}
+        for priority in Priority:
+            waits = sorted(self._waits[priority])
+            by_priority[priority.name.lower()] = {
+                "acquired": self._acquired[priority],
+                "avg_wait": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95_wait": round(waits[min(len(waits) - 1, math.ceil(0.95 * len(waits)) - 1)], 4) if waits else 0.0,
+                "max_wait": round(waits[-1], 4) if waits else 0.0,
+            }
+        return {
+            "enabled": self.enabled,
+            "backend": "redis" if self._redis is not None else "local",
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "timeouts": self.timeouts,
+            "priorities": by_priority,
+        }
+
+
+gemini_limiter = GeminiLimiter(
+    max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+    rpm=settings.GEMINI_RPM_LIMIT,
+    tpm=settings.GEMINI_TPM_LIMIT,
+    redis_url=settings.GEMINI_LIMITER_REDIS_URL,
+    enabled=settings.GEMINI_LIMITER_ENABLED,
+)
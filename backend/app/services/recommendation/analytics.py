@@ -0,0 +1,68 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import Dict, List, Optional
+from uuid import UUID
+import logging
+
+from app.models.outfit_analytics import OutfitAnalytics
+
+
+def compact_scores(scored_items: List[Dict]) -> List[Dict]:
+    """Mantém só o necessário para reaproveitar as notas depois (sem 'reason')"""
+    return [
+        {"id": str(s.get("id")), "score": s.get("score", 0), "category": (s.get("category") or "").upper()}
+        for s in scored_items
+        if s.get("id")
+    ]
+
+
+async def save_generation_context(
+    db: AsyncSession,
+    user_id: UUID,
+    outfit_id: UUID,
+    event_context: Dict,
+    scored_items: List[Dict],
+    strategy: Optional[str] = None,
+    generation_time: Optional[float] = None,
+    user_preferences: Optional[Dict] = None,
+    validation: Optional[Dict] = None,
+    narrative: Optional[str] = None,
+) -> None:
+    """Grava contexto do evento e notas das peças usados para gerar o outfit"""
+    validation = validation or {}
+    try:
+        # Savepoint: falhar aqui não pode derrubar o outfit já salvo
+        async with db.begin_nested():
+            db.add(OutfitAnalytics(
+                user_id=user_id,
+                outfit_id=outfit_id,
+                generation_time=generation_time,
+                confidence_score=validation.get("confidence"),
+                validation_score=validation.get("score"),
+                strategy_used=strategy,
+                event_context=event_context,
+                user_preferences_used=user_preferences or None,
+                item_scores=compact_scores(scored_items),
+                color_harmony_score=validation.get("color_harmony"),
+                style_compatibility_score=validation.get("style_compatibility"),
+                narrative=narrative,
+            ))
+        await db.commit()
+    except Exception as e:
+        logging.error(f"Erro ao salvar contexto de geração do outfit {outfit_id}: {e}")
+
+
+async def load_generation_context(db: AsyncSession, outfit_id: UUID) -> Optional[OutfitAnalytics]:
+    """Busca o contexto de geração mais recente de um outfit"""
+    try:
+        stmt = (
+            select(OutfitAnalytics)
+            .filter_by(outfit_id=outfit_id)
+            .order_by(OutfitAnalytics.created_at.desc())
+            .limit(1)
+        )
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+    except Exception as e:
+        logging.error(f"Erro ao buscar contexto de geração do outfit {outfit_id}: {e}")
+        return None
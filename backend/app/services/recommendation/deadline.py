@@ -0,0 +1,40 @@
+from typing import Optional
+import time
+
+from app.config import settings
+
+
+class DeadlineExceeded(Exception):
+    """Orçamento de tempo da requisição esgotado"""
+
+
+class Deadline:
+    """Prazo absoluto de uma requisição, repassado por todas as etapas do pipeline"""
+
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def nearly_spent(self, reserve: float) -> bool:
+        """True quando sobra menos que `reserve` segundos"""
+        return self.remaining() < reserve
+
+    def cap(self, timeout: float) -> float:
+        """Limita o timeout de uma chamada ao tempo restante"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"prazo de {self.budget:.1f}s esgotado")
+        return min(timeout, remaining)
+
+
+def request_deadline(client_seconds: Optional[float], default_seconds: float) -> Deadline:
+    """Prazo da rota, ou o enviado pelo cliente limitado a OUTFIT_DEADLINE_MAX_SECONDS"""
+    seconds = client_seconds if client_seconds and client_seconds > 0 else default_seconds
+    return Deadline(min(seconds, settings.OUTFIT_DEADLINE_MAX_SECONDS))
@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import json
+import logging
+import math
+
+# Colunas enviadas ao LLM; img_url, price e afins não influenciam a escolha
+ITEM_COLUMNS = ["h", "category", "type", "color", "style", "state", "season", "characteristics"]
+SCORED_COLUMNS = ["h", "score", "type", "color", "style"]
+
+CELL_SEPARATOR = "|"
+LIST_SEPARATOR = ";"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa grosseira (~4 caracteres por token), suficiente para comparar formatos"""
+    return math.ceil(len(text) / 4)
+
+
+class EncodingStats:
+    """Economia acumulada de tokens por tipo de prompt"""
+
+    def __init__(self):
+        self._by_label: Dict[str, Dict[str, int]] = {}
+
+    def record(self, label: str, verbose_tokens: int, compact_tokens: int) -> None:
+        stats = self._by_label.setdefault(label, {"prompts": 0, "verbose_tokens": 0, "compact_tokens": 0})
+        stats["prompts"] += 1
+        stats["verbose_tokens"] += verbose_tokens
+        stats["compact_tokens"] += compact_tokens
+
+    def stats(self) -> Dict:
+        return {
+            label: {
+                **stats,
+                "ratio": round(stats["verbose_tokens"] / stats["compact_tokens"], 2) if stats["compact_tokens"] else None,
+            }
+            for label, stats in self._by_label.items()
+        }
+
+
+encoding_stats = EncodingStats()
+
+
+class ItemEncoder:
+    """Codificação compacta de peças para prompts.
+
+    Cada peça recebe um handle curto (p1, p2, ...) válido só nesta
+    requisição; as respostas do LLM são traduzidas de volta para UUIDs com
+    decode(). As listagens saem em formato tabular separado por "|".
+    """
+
+    def __init__(self, prefix: str = "p"):
+        self.prefix = prefix
+        self._handles: Dict[str, str] = {}
+        self._ids: Dict[str, str] = {}
+
+    def handle(self, item_id) -> str:
+        item_id = str(item_id)
+        handle = self._handles.get(item_id)
+        if handle is None:
+            handle = f"{self.prefix}{len(self._handles) + 1}"
+            self._handles[item_id] = handle
+            self._ids[handle] = item_id
+        return handle
+
+    def decode(self, value) -> Optional[str]:
+        """Handle -> UUID; aceita também o UUID completo caso o LLM o devolva"""
+        if value is None:
+            return None
+        value = str(value).strip()
+        if value in self._ids:
+            return self._ids[value]
+        if value in self._handles:
+            return value
+        return None
+
+    def decode_many(self, values: Iterable) -> List[str]:
+        decoded = [self.decode(value) for value in values]
+        return [item_id for item_id in decoded if item_id is not None]
+
+    def table(self, rows: Sequence[Dict], columns: Sequence[str] = ITEM_COLUMNS) -> str:
+        """Listagem tabular: cabeçalho + uma linha por peça; 'h' é o handle da peça"""
+        lines = [CELL_SEPARATOR.join(columns)]
+        for row in rows:
+            cells = []
+            for column in columns:
+                value = self.handle(row["id"]) if column == "h" else row.get(column)
+                cells.append(self._cell(value))
+            lines.append(CELL_SEPARATOR.join(cells))
+        return "\n".join(lines)
+
+    def report(self, label: str, rows: Sequence[Dict], compact: str) -> None:
+        """Registra (e loga) quantos tokens a listagem compacta economizou frente ao JSON"""
+        verbose_tokens = estimate_tokens(json.dumps(list(rows), default=str))
+        compact_tokens = estimate_tokens(compact)
+        encoding_stats.record(label, verbose_tokens, compact_tokens)
+        logging.info(
+            f"[ItemEncoder] {label}: ~{verbose_tokens} -> ~{compact_tokens} tokens "
+            f"({len(rows)} peças)"
+        )
+
+    @staticmethod
+    def _cell(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, (list, tuple)):
+            return LIST_SEPARATOR.join(ItemEncoder._cell(v) for v in value)
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        if isinstance(value, float):
+            return f"{value:g}"
+        return str(value).replace(CELL_SEPARATOR, "/").replace("\n", " ")
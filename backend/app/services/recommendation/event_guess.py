@@ -0,0 +1,136 @@
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+
+from app.services.garment_attributes import OCCASION_WORDS, event_occasions, has_word, matches_words, normalize_formality
+
+# Ocasião -> formalidade mais provável
+OCCASION_FORMALITY = {
+    "formal_event": "formal",
+    "work": "semi-formal",
+    "date": "semi-formal",
+    "party": "semi-formal",
+    "sport": "casual",
+    "beach": "casual",
+    "travel": "casual",
+    "casual": "casual",
+}
+
+OUTDOOR_WORDS = ["praia", "beach", "parque", "park", "trilha", "hike", "ao ar livre", "outdoor", "piscina", "pool", "churrasco", "corrida", "run"]
+NIGHT_WORDS = ["noite", "night", "jantar", "dinner", "balada", "festa", "party", "gala", "show"]
+MORNING_WORDS = ["manhã", "morning", "café da manhã", "breakfast", "academia", "gym"]
+HOT_WORDS = ["calor", "quente", "hot", "verão", "summer", "praia", "beach", "piscina", "pool"]
+COLD_WORDS = ["frio", "cold", "inverno", "winter", "neve", "snow", "chuva", "rain"]
+
+# Campos do contexto que mudam as notas das peças: se batem, o scoring especulativo vale
+MATCH_FIELDS = ("formalidade", "clima_sugerido", "ocasioes")
+
+
+def guess_event_context(event_raw: Optional[str], event_json: Optional[dict]) -> Dict:
+    """Palpite local do contexto do evento, no mesmo formato do LLM (sem chamada externa)"""
+    event_json = event_json or {}
+    text = f"{event_raw or ''} {json.dumps(event_json, ensure_ascii=False)}".lower()
+
+    # palavras reconhecidas viram o tipo_evento, para event_occasions() enxergar as mesmas ocasiões
+    found = [(occasion, word) for occasion, words in OCCASION_WORDS.items() for word in words if has_word(text, word)]
+    tipo_evento = " ".join(dict.fromkeys(word for _, word in found)) or "lazer"
+    formalidade = OCCASION_FORMALITY[found[0][0]] if found else "casual"
+    # o usuário pode ter dito a formalidade com todas as letras
+    formalidade = normalize_formality(event_json.get("formalidade")) or (
+        normalize_formality(text) if matches_words(text, ["formal", "social", "smart", "casual"]) else None
+    ) or formalidade
+
+    if matches_words(text, HOT_WORDS):
+        clima = "quente"
+    elif matches_words(text, COLD_WORDS):
+        clima = "frio"
+    else:
+        clima = "ameno"
+
+    return {
+        "formalidade": formalidade,
+        "ambiente": "outdoor" if matches_words(text, OUTDOOR_WORDS) else "indoor",
+        "horario": "noite" if matches_words(text, NIGHT_WORDS) else "manhã" if matches_words(text, MORNING_WORDS) else "tarde",
+        "clima_sugerido": event_json.get("clima_sugerido") or clima,
+        "estilo_recomendado": [],
+        "cores_sugeridas": [],
+        "tipo_evento": event_json.get("tipo_evento") or tipo_evento,
+        "duracao_estimada": "media",
+    }
+
+
+def _signature(context: Dict) -> Dict:
+    return {
+        "formalidade": normalize_formality(context.get("formalidade")) or "casual",
+        "clima_sugerido": (context.get("clima_sugerido") or "ameno").strip().lower(),
+        "ocasioes": set(event_occasions(context)),
+    }
+
+
+def _same(field: str, expected, got) -> bool:
+    if field == "ocasioes":
+        # o LLM resume o evento em poucas palavras: basta uma ocasião em comum
+        return bool(expected & got) or not (expected or got)
+    return expected == got
+
+
+def context_mismatches(guess: Dict, actual: Dict) -> List[str]:
+    """Campos relevantes para o scoring em que o palpite errou"""
+    expected, got = _signature(guess), _signature(actual)
+    return [field for field in MATCH_FIELDS if not _same(field, expected[field], got[field])]
+
+
+class SpeculationStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.mismatched_fields: Counter = Counter()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "mismatched_fields": dict(self.mismatched_fields),
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+async def speculative_scoring(
+    guess: Dict,
+    analyze: Awaitable[Dict],
+    score: Callable[[Dict], Awaitable[List[Dict]]],
+) -> Tuple[Dict, List[Dict]]:
+    """Pontua com o contexto previsto enquanto o contexto real ainda está no LLM.
+
+    Se o contexto real bate com o palpite nos MATCH_FIELDS, as notas já
+    calculadas são aproveitadas (economiza uma ida ao LLM no caminho
+    crítico); senão a especulação é cancelada e as peças são repontuadas.
+    """
+    speculative = asyncio.ensure_future(score(guess))
+    try:
+        event_context = await analyze
+    except BaseException:
+        speculative.cancel()
+        raise
+
+    mismatches = context_mismatches(guess, event_context)
+    if not mismatches:
+        try:
+            scored = await speculative
+            speculation_stats.hits += 1
+            return event_context, scored
+        except Exception as e:
+            logging.error(f"[Speculative] Scoring especulativo falhou, repontuando: {e}")
+            mismatches = ["error"]
+    else:
+        speculative.cancel()
+
+    speculation_stats.misses += 1
+    speculation_stats.mismatched_fields.update(mismatches)
+    return event_context, await score(event_context)
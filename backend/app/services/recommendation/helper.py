@@ -2,30 +2,79 @@ import httpx
 import logging
 import json
 import re
+from typing import Dict, Optional
+
+from app.config import settings
+from app.services.gemini_config import model_url, resolve_stage_config, stage_latency
+from app.services.resilience import CircuitOpenError, call_with_resilience, default_policy, gemini_breaker
+from app.services.rate_limiter import Priority, gemini_limiter
+from .encoding import estimate_tokens
+from .deadline import Deadline, DeadlineExceeded
 
 class GeminiService:
-    def __init__(self, api_key: str, model: str = "gemini-2.5-flash"):
+    def __init__(self, api_key: str, model: Optional[str] = None):
         self.api_key = api_key
-        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+        self.model = model  # None = GEMINI_DEFAULT_MODEL / modelo do estágio
+        self.url = model_url(model) if model else None
+
+    async def send_prompt(self, prompt: str, max_retries: int = 3, generation_config: Optional[Dict] = None, stage: Optional[str] = None, deadline: Optional[Deadline] = None, priority: Priority = Priority.INTERACTIVE) -> str:
+        """Envia prompt para o Gemini com backoff, circuit breaker e hedge opcional"""
+        stage_config = resolve_stage_config(stage, self.model)
+        config = stage_config.generation_config()
+        if generation_config:
+            # ex.: {"responseMimeType": "application/json", "responseSchema": {...}}
+            config.update(generation_config)
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        if config:
+            payload["generationConfig"] = config
+        stage_name = stage or "default"
+        estimated_tokens = estimate_tokens(prompt) + min(
+            config.get("maxOutputTokens") or settings.GEMINI_OUTPUT_TOKEN_ESTIMATE,
+            settings.GEMINI_OUTPUT_TOKEN_ESTIMATE,
+        )
+
+        async def attempt() -> str:
+            queue_timeout = deadline.remaining() if deadline else None
+            async with gemini_limiter.slot(priority, estimated_tokens, timeout=queue_timeout):
+                # Cada tentativa só pode usar o que resta do prazo da requisição
+                timeout = deadline.cap(30.0) if deadline else 30.0
+                with stage_latency.measure(stage_name, stage_config.model):
+                    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout)) as client:
+                        response = await client.post(
+                            stage_config.url,
+                            headers={"Content-Type": "application/json"},
+                            params={"key": self.api_key},
+                            json=payload
+                        )
+                        response.raise_for_status()
+                        result = response.json()
+            used_tokens = (result.get("usageMetadata") or {}).get("totalTokenCount")
+            if used_tokens:
+                await gemini_limiter.adjust(used_tokens - estimated_tokens)
+            parts = result.get("candidates", [])[0].get("content", {}).get("parts", [])
+            if parts and isinstance(parts[0], dict) and "text" in parts[0]:
+                return parts[0]["text"]
+            return ""
+
+        try:
+            return await call_with_resilience(
+                attempt,
+                breaker=gemini_breaker,
+                policy=default_policy(max_retries),
+                deadline=deadline,
+                hedge_delay=self._hedge_delay(stage_name, stage_config.model),
+                label=f"Gemini {stage_name}",
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logging.error(f"[GeminiService] Falha no estágio {stage_name} ({stage_config.model}): {e}")
+            if deadline and deadline.expired:
+                raise DeadlineExceeded(f"prazo esgotado no estágio {stage_name}") from e
+            raise
 
-    async def send_prompt(self, prompt: str, max_retries: int = 3) -> str:
-        """Envia prompt para o Gemini com retry automático"""
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-                    response = await client.post(
-                        self.url,
-                        headers={"Content-Type": "application/json"},
-                        params={"key": self.api_key},
-                        json={"contents": [{"parts": [{"text": prompt}]}]}
-                    )
-                    response.raise_for_status()
-                    result = response.json()
-                    parts = result.get("candidates", [])[0].get("content", {}).get("parts", [])
-                    if parts and isinstance(parts[0], dict) and "text" in parts[0]:
-                        return parts[0]["text"]
-            except Exception as e:
-                logging.error(f"[GeminiService] Tentativa {attempt + 1} falhou: {e}")
-                if attempt == max_retries - 1:
-                    raise
-        return ""
\ No newline at end of file
+    @staticmethod
+    def _hedge_delay(stage: str, model: str) -> Optional[float]:
+        if not settings.GEMINI_HEDGE_ENABLED or stage_latency.count(stage, model) < settings.GEMINI_HEDGE_MIN_SAMPLES:
+            return None
+        return stage_latency.p95(stage, model)
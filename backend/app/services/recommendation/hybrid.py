@@ -4,6 +4,7 @@ import httpx
 import json
 import logging
 import re
+import time
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from app.models.item import Item
@@ -12,9 +13,22 @@ from app.models.user_preference import UserPreference  # Novo modelo para prefer
 from app.models.outfit_feedback import OutfitFeedback  # Novo modelo para feedback
 from app.schemas.outfit import OutfitCreate
 from app.config import settings
+from app.services.preference_service import PreferenceService
+from app.services.wardrobe_cache import wardrobe_cache
 from app.models.item import Item 
 from sqlalchemy.ext.asyncio import AsyncSession
 from .helper import GeminiService  # você pode mover Gemini para um helper geral
+from .analytics import save_generation_context, load_generation_context
+from .encoding import ItemEncoder, ITEM_COLUMNS, SCORED_COLUMNS
+from .deadline import Deadline
+from .strategy_bandit import strategy_bandit
+from .event_guess import guess_event_context, speculative_scoring
+from .narrative import narrative_signature, narrative_store
+from app.services.rate_limiter import Priority
+from app.services.garment_attributes import item_attributes, score_items_locally
+from app.services.embeddings import centroid, embed_item, nearest_items
+from app.services.compatibility import CompatibilityGraph, CompatibilityService
+from app.services import preference_learning
 
 
 
@@ -22,27 +36,38 @@ class HybridRecommendationService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.llm = GeminiService(settings.GEMINI_API_KEY)
+        self.preferences = PreferenceService(db)
+        self.encoder = ItemEncoder()  # handles curtos válidos nesta requisição
+        self._descriptions: Dict[str, Dict] = {}
+        self.deadline: Optional[Deadline] = None
+        self.compatibility = CompatibilityService(db)
+        self.graph: Optional[CompatibilityGraph] = None
         self.trend_colors_2025 = ["sage green", "warm terracotta", "indigo blue", "soft beige", "deep burgundy"]
         self.trend_styles_2025 = ["oversized controlled", "vintage modern", "colorful minimalism", "texture mixing"]
 
-    async def generate_outfit(self, user_id: UUID, event_raw: str, event_json: dict, gender: str) -> Dict:
+    async def generate_outfit(self, user_id: UUID, event_raw: str, event_json: dict, gender: str, deadline: Optional[Deadline] = None, defer_narrative: bool = False) -> Dict:
+        started = time.perf_counter()
+        self.deadline = deadline
         try:
-            result = await self.db.execute(select(Item).filter_by(user_id=user_id))
-            user_items = result.scalars().all()
+            user_items = await wardrobe_cache.get_items(self.db, user_id)
 
-            # Buscar itens à venda
-            result = await self.db.execute(select(Item).where(Item.for_sale == True))
-            for_sale_items = result.scalars().all()
+            # Buscar itens à venda (top-k por categoria no índice vetorial)
+            for_sale_items = await self._marketplace_candidates(user_items)
 
-            all_items = user_items + for_sale_items
+            own_ids = {item.id for item in user_items}
+            all_items = list(user_items) + [item for item in for_sale_items if item.id not in own_ids]
 
             if not all_items:
                 return {"error": "Nenhum item encontrado no guarda-roupa ou à venda"}
 
-            event_context = await self._analyze_event_context(event_raw, event_json)
+            self.graph = await self.compatibility.get_graph(user_id, user_items)
+            self.graph.add_items(for_sale_items)
+
             user_preferences = await self._get_user_preferences(user_id)
             item_descriptions = self._prepare_item_descriptions(all_items)
-            scored_items = await self._score_items_for_event(item_descriptions, event_context, gender)
+            event_context, scored_items = await self._context_and_scores(event_raw, event_json, item_descriptions, gender)
+            learned = await self.preferences.get_learned_weights(user_id)
+            scored_items = preference_learning.apply_bonus(scored_items, learned, self._descriptions)
 
             outfit_result = await self._generate_outfit_with_retries(
                 event_raw, event_context, scored_items, user_preferences, gender
@@ -58,16 +83,34 @@ class HybridRecommendationService:
             )
 
             outfit_items_full = await self._get_outfit_items_full(outfit_result["outfit"])
-            final_analysis = await self._analyze_final_outfit(
-                event_raw, event_json, outfit_items_full, validation_result, gender
-            )
+            signature = narrative_signature(outfit_result["outfit"], event_context, gender)
+            # Narrativa adiada: responde com o texto de template e gera a versão final em segundo plano
+            narrative_pending = defer_narrative and narrative_store.cached(signature) is None
+            if narrative_pending:
+                final_analysis = self._template_recommendation(outfit_items_full)
+            else:
+                final_analysis = await self._analyze_final_outfit(
+                    event_raw, event_json, outfit_items_full, validation_result, gender, signature=signature
+                )
 
             db_outfit = await self._save_outfit(user_id, event_raw, event_json, outfit_result["outfit"])
+            await self.preferences.record_outfit(user_id, outfit_items_full, event_context.get("formalidade"))
+            await save_generation_context(
+                self.db, user_id, db_outfit.id, event_context, scored_items,
+                strategy=outfit_result.get("strategy"),
+                generation_time=time.perf_counter() - started,
+                user_preferences=user_preferences,
+                validation=validation_result,
+                narrative=None if narrative_pending else final_analysis,
+            )
+            if narrative_pending:
+                self.schedule_narrative(db_outfit.id, event_raw, event_json, outfit_items_full, validation_result, gender, signature)
 
             return {
                 "outfit": db_outfit,
                 "items": outfit_items_full,
                 "recommendation": final_analysis,
+                "narrative_status": "pending" if narrative_pending else "ready",
                 "confidence": validation_result.get("confidence", 0.8),
                 "event_context": event_context,
                 "validation": validation_result
@@ -77,6 +120,83 @@ class HybridRecommendationService:
             logging.error(f"Erro na geração do outfit: {e}")
             return {"error": "Erro interno na geração do outfit"}
 
+    async def swap_piece(self, user_id: UUID, outfit: Outfit, category: str, gender: str, revalidate: bool = False, exclude: Optional[List[str]] = None, deadline: Optional[Deadline] = None) -> Dict:
+        """Troca só a peça de uma categoria, reaproveitando contexto e notas da geração original"""
+        started = time.perf_counter()
+        self.deadline = deadline
+        category = category.upper()
+        try:
+            current_ids = [str(id_) for id_ in outfit.items]
+            current_items = await self._get_outfit_items_full(current_ids)
+            current_piece = next((i for i in current_items if (i.category or "").upper() == category), None)
+            if current_piece is None:
+                return {"error": f"O outfit não tem peça da categoria {category}"}
+
+            stored = await load_generation_context(self.db, outfit.id)
+            if stored is not None and stored.item_scores:
+                event_context = stored.event_context or {}
+                scored_items = stored.item_scores
+            else:
+                # Outfit sem contexto salvo: notas locais sobre o guarda-roupa atual
+                event_context = {}
+                wardrobe = await wardrobe_cache.get_items(self.db, user_id)
+                scored_items = score_items_locally(wardrobe, event_context)
+
+            skip = set(current_ids) | {str(id_) for id_ in (exclude or [])}
+            candidates = sorted(
+                (s for s in scored_items if (s.get("category") or "").upper() == category and str(s.get("id")) not in skip),
+                key=lambda s: s.get("score", 0),
+                reverse=True,
+            )
+            # Descarta peças que não existem mais
+            available = await self._get_outfit_items_full([str(s["id"]) for s in candidates])
+            available_by_id = {str(i.id): i for i in available}
+            candidates = [s for s in candidates if str(s["id"]) in available_by_id]
+            if not candidates:
+                return {"error": f"Nenhuma outra peça disponível na categoria {category}"}
+
+            # Entre as candidatas, a que melhor combina com as peças mantidas
+            keep_ids = [id_ for id_ in current_ids if id_ != str(current_piece.id)]
+            self.graph = await self.compatibility.get_graph(user_id)
+            self.graph.add_items(list(available) + list(current_items))
+            await self.graph.load([s["id"] for s in candidates[:10]] + keep_ids)
+            replacement_score = self.graph.best_replacement(candidates[:10], keep_ids) or candidates[0]
+            replacement = available_by_id[str(replacement_score["id"])]
+
+            new_ids = [str(replacement.id) if id_ == str(current_piece.id) else id_ for id_ in current_ids]
+
+            validation_result = {}
+            if revalidate:
+                validation_result = await self._validate_outfit_combination(new_ids, event_context)
+
+            new_items = await self._get_outfit_items_full(new_ids)
+            db_outfit = await self._save_outfit(user_id, outfit.event_raw, outfit.event_json, new_ids)
+            await self.preferences.record_outfit(user_id, new_items, event_context.get("formalidade"))
+            await save_generation_context(
+                self.db, user_id, db_outfit.id, event_context, scored_items,
+                strategy=f"swap:{category}",
+                generation_time=time.perf_counter() - started,
+                validation=validation_result,
+            )
+
+            recommendation = (
+                f"Trocamos {current_piece.name or current_piece.type or 'a peça'} por "
+                f"{replacement.name or replacement.type or 'outra peça'} ({replacement.color or 'cor neutra'}), "
+                f"mantendo o restante do look."
+            )
+            return {
+                "outfit": db_outfit,
+                "items": new_items,
+                "recommendation": recommendation,
+                "confidence": validation_result.get("confidence", 0.8),
+                "event_context": event_context,
+                "validation": validation_result
+            }
+
+        except Exception as e:
+            logging.error(f"Erro ao trocar peça do outfit: {e}")
+            return {"error": "Erro interno ao trocar peça do outfit"}
+
     async def _analyze_event_context(self, event_raw: str, event_json: dict) -> Dict:
         """Analisa o contexto do evento para melhor recomendação"""
         prompt = f"""fin
@@ -107,7 +227,7 @@ class HybridRecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="event_context", deadline=self.deadline)
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 context = json.loads(match.group(0))
@@ -128,73 +248,8 @@ class HybridRecommendationService:
         }
 
     async def _get_user_preferences(self, user_id: UUID) -> Dict:
-        """Busca preferências do usuário baseadas em histórico"""
-        try:
-            # Buscar outfits anteriores
-            stmt = select(Outfit).filter_by(user_id=user_id).order_by(Outfit.created_at.desc()).limit(20)
-            result = await self.db.execute(stmt)
-            recent_outfits = result.scalars().all()
-            
-            # Buscar feedback positivo
-            stmt = select(OutfitFeedback).filter_by(user_id=user_id).filter(OutfitFeedback.rating >= 4)
-            result = await self.db.execute(stmt)
-            positive_feedback = result.scalars().all()
-            
-            # Analisar padrões
-            preferences = await self._analyze_user_patterns(recent_outfits, positive_feedback)
-            
-            return preferences
-            
-        except Exception as e:
-            logging.error(f"Erro ao buscar preferências: {e}")
-            return {}
-
-    async def _analyze_user_patterns(self, recent_outfits: List, positive_feedback: List) -> Dict:
-        """Analisa padrões de preferência do usuário"""
-        if not recent_outfits:
-            return {}
-        
-        # Coletar dados dos outfits
-        outfit_data = []
-        for outfit in recent_outfits:
-            outfit_items = await self._get_outfit_items_full(outfit.items)
-            outfit_data.extend([{
-                "type": item.type,
-                "color": item.color,
-                "style": item.style,
-                "category": item.category
-            } for item in outfit_items])
-        
-        prompt = f"""
-        Analise os padrões de preferência do usuário baseado em seus outfits anteriores:
-        
-        Dados dos outfits: {json.dumps(outfit_data)}
-        
-        Identifique:
-        - Cores mais usadas
-        - Estilos preferidos
-        - Combinações favoritas
-        - Padrões de formalidade
-        
-        Retorne JSON:
-        {{
-            "cores_favoritas": ["lista"],
-            "estilos_preferidos": ["lista"],
-            "formalidade_usual": "casual|semi-formal|formal",
-            "combinacoes_favoritas": ["descrições"],
-            "confidence": 0.8
-        }}
-        """
-        
-        try:
-            response = await self.llm.send_prompt(prompt)
-            match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
-            if match:
-                return json.loads(match.group(0))
-        except Exception as e:
-            logging.error(f"Erro ao analisar padrões: {e}")
-        
-        return {}
+        """Busca o perfil de preferências materializado do usuário"""
+        return await self.preferences.get_preferences(user_id)
 
     def _prepare_item_descriptions(self, items: List[Item]) -> List[Dict]:
         """Prepara descrições estruturadas dos itens"""
@@ -209,15 +264,30 @@ class HybridRecommendationService:
                 "category": item.category,
                 "style": item.style,
                 "characteristics": item.characteristics,
-                "img_url": item.img_url,
                 "for_sale": item.for_sale,
-                "price": float(item.price) if item.price is not None else None,
+                **item_attributes(item),
             }
             for item in items
         ]
 
+    async def _context_and_scores(self, event_raw: str, event_json: dict, items: List[Dict], gender: str) -> Tuple[Dict, List[Dict]]:
+        """Contexto do evento + notas das peças, com scoring especulativo quando possível"""
+        if not settings.OUTFIT_SPECULATIVE_SCORING or settings.OUTFIT_LOCAL_SCORING:
+            event_context = await self._analyze_event_context(event_raw, event_json)
+            return event_context, await self._score_items_for_event(items, event_context, gender)
+        return await speculative_scoring(
+            guess_event_context(event_raw, event_json),
+            self._analyze_event_context(event_raw, event_json),
+            lambda context: self._score_items_for_event(items, context, gender),
+        )
+
     async def _score_items_for_event(self, items: List[Dict], event_context: Dict, gender: str) -> List[Dict]:
         """Pontua cada peça baseado na adequação ao evento"""
+        self._descriptions = {item["id"]: item for item in items}
+        if settings.OUTFIT_LOCAL_SCORING:
+            return score_items_locally(items, event_context)
+        listing = self.encoder.table(items, ITEM_COLUMNS + ["for_sale"])
+        self.encoder.report("scoring", items, listing)
         prompt = f"""
         Contexto do evento: {json.dumps(event_context)}
         Gênero do usuário: {gender}
@@ -229,13 +299,14 @@ class HybridRecommendationService:
         - Estado da peça (15%)
         - Tendências 2025 (20%)
         
-        Peças: {json.dumps(items)}
+        Peças (uma por linha, colunas separadas por "|", listas por ";"; "h" identifica a peça):
+        {listing}
         
-        Retorne APENAS um JSON válido:
+        Retorne APENAS um JSON válido, usando em "id" o valor da coluna "h":
         {{
             "scores": [
                 {{
-                    "id": "id_da_peca",
+                    "id": "p1",
                     "score": 8.5,
                     "reason": "motivo da pontuação",
                     "category": "TOP|BOTTOM|SHOES"
@@ -245,16 +316,21 @@ class HybridRecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="scoring", deadline=self.deadline)
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 result = json.loads(match.group(0))
-                return result.get("scores", [])
+                scores = []
+                for score in result.get("scores", []):
+                    item_id = self.encoder.decode(score.get("id"))
+                    if item_id is not None:
+                        scores.append({**score, "id": item_id})
+                return scores
         except Exception as e:
             logging.error(f"Erro ao pontuar itens: {e}")
         
-        # Fallback: pontuação neutra
-        return [{"id": item["id"], "score": 7.0, "reason": "Pontuação padrão", "category": item["category"]} for item in items]
+        # Fallback: pontuação local pelos atributos das peças
+        return score_items_locally(items, event_context)
 
     async def _generate_outfit_with_retries(self, event_raw: str, event_context: Dict, scored_items: List[Dict], user_preferences: Dict, gender: str) -> Dict:
         """Gera outfit com múltiplas tentativas e estratégias"""
@@ -277,24 +353,31 @@ class HybridRecommendationService:
         for category in categories_available:
             categories_available[category].sort(key=lambda x: x.get("score", 0), reverse=True)
         
-        # Múltiplas tentativas com diferentes estratégias
-        strategies = [
-            "best_scored",  # Melhores pontuações
-            "trend_focused",  # Foco em tendências
-            "user_preference",  # Baseado em preferências
-            "color_harmony"  # Harmonia de cores
-        ]
-        
-        for strategy in strategies:
-            try:
-                outfit = await self._try_outfit_generation(event_raw, event_context, categories_available, user_preferences, strategy, gender)
-                if outfit and len(outfit) == 3:
-                    return {"outfit": outfit, "strategy": strategy}
-            except Exception as e:
-                logging.error(f"Estratégia {strategy} falhou: {e}")
+        # Múltiplas tentativas com diferentes estratégias, na ordem sugerida pelo bandit
+        # (best_scored, trend_focused, user_preference, color_harmony)
+        strategies = await strategy_bandit.order(self.db, event_context)
+        outcomes = []
+
+        try:
+            for strategy in strategies:
+                if self._budget_low(settings.DEADLINE_STRATEGY_RESERVE_SECONDS):
+                    logging.info(f"Prazo curto: pulando estratégias restantes a partir de {strategy}")
+                    break
+                started = time.perf_counter()
+                try:
+                    outfit = await self._try_outfit_generation(event_raw, event_context, categories_available, user_preferences, strategy, gender)
+                    success = bool(outfit) and len(outfit) == 3
+                    outcomes.append((strategy, success, time.perf_counter() - started))
+                    if success:
+                        return {"outfit": outfit, "strategy": strategy}
+                except Exception as e:
+                    outcomes.append((strategy, False, time.perf_counter() - started))
+                    logging.error(f"Estratégia {strategy} falhou: {e}")
+        finally:
+            await strategy_bandit.record_attempts(self.db, event_context, outcomes)
         
         # Fallback final
-        return self._generate_fallback_outfit(categories_available)
+        return await self._generate_fallback_outfit(categories_available)
 
     async def _try_outfit_generation(self, event_raw: str, event_context: Dict, categories_available: Dict, user_preferences: Dict, strategy: str, gender: str) -> List[str]:
         """Tenta gerar outfit com estratégia específica"""
@@ -306,16 +389,28 @@ class HybridRecommendationService:
             "color_harmony": "Priorize harmonia de cores e combinações elegantes"
         }
         
+        listings = {}
+        for category in ["TOP", "BOTTOM", "SHOES"]:
+            rows = [
+                {**self._descriptions.get(scored["id"], {}), **scored}
+                for scored in categories_available.get(category, [])[:5]
+            ]
+            listings[category] = self.encoder.table(rows, SCORED_COLUMNS)
+            self.encoder.report("strategy", categories_available.get(category, [])[:5], listings[category])
+
         prompt = f"""
         EVENTO: {event_raw}
         GÊNERO DO USUÁRIO: {gender}
         CONTEXTO: {json.dumps(event_context)}
         ESTRATÉGIA: {strategy_prompts.get(strategy, "")}
         
-        PEÇAS DISPONÍVEIS POR CATEGORIA:
-        TOP: {json.dumps(categories_available.get("TOP", [])[:5])}
-        BOTTOM: {json.dumps(categories_available.get("BOTTOM", [])[:5])}
-        SHOES: {json.dumps(categories_available.get("SHOES", [])[:5])}
+        PEÇAS DISPONÍVEIS POR CATEGORIA (colunas separadas por "|"; "h" identifica a peça):
+        TOP:
+        {listings["TOP"]}
+        BOTTOM:
+        {listings["BOTTOM"]}
+        SHOES:
+        {listings["SHOES"]}
         
         INSTRUÇÕES:
         1. Escolha EXATAMENTE 1 peça de cada categoria (TOP, BOTTOM, SHOES)
@@ -324,17 +419,17 @@ class HybridRecommendationService:
         4. Adequação às tendências 2025
         
         RESPOSTA OBRIGATÓRIA:
-        Retorne APENAS um JSON válido no formato:
-        {{"outfit": ["id_top", "id_bottom", "id_shoes"], "confidence": 0.95}}
+        Retorne APENAS um JSON válido no formato (valores da coluna "h"):
+        {{"outfit": ["h_top", "h_bottom", "h_shoes"], "confidence": 0.95}}
         """
         
-        response = await self.llm.send_prompt(prompt)
+        response = await self.llm.send_prompt(prompt, stage="strategy", deadline=self.deadline)
         
         try:
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 result = json.loads(match.group(0))
-                outfit = result.get("outfit", [])
+                outfit = self.encoder.decode_many(result.get("outfit", []))
                 if len(outfit) == 3:
                     return outfit
         except Exception as e:
@@ -344,6 +439,12 @@ class HybridRecommendationService:
 
     async def _generate_fallback_outfit(self, categories_available: Dict) -> Dict:
         try:
+            if self.graph is not None:
+                await self.graph.load_pools(categories_available)
+                best = self.graph.best_outfit(categories_available)
+                if best:
+                    return {"outfit": best[0], "strategy": "fallback:graph"}
+
             outfit = []
             missing = []
 
@@ -374,6 +475,12 @@ class HybridRecommendationService:
 
     async def _validate_outfit_combination(self, outfit_ids: List[str], event_context: Dict) -> Dict:
         """Valida se as peças combinam bem entre si"""
+        if self.graph is not None and (not settings.OUTFIT_LLM_VALIDATION or self._budget_low(settings.DEADLINE_VALIDATION_RESERVE_SECONDS)):
+            await self.graph.load(outfit_ids)
+            return self.graph.validate(outfit_ids)
+        if self._budget_low(settings.DEADLINE_VALIDATION_RESERVE_SECONDS):
+            logging.info("Prazo curto: pulando validação via LLM")
+            return {"valid": True, "confidence": 0.7, "score": 7.0, "skipped": True}
         try:
             outfit_items = await self._get_outfit_items_full(outfit_ids)
             
@@ -382,7 +489,7 @@ class HybridRecommendationService:
             
             PEÇAS SELECIONADAS:
             {json.dumps([{
-                "id": item.id,
+                "h": self.encoder.handle(item.id),
                 "type": item.type,
                 "color": item.color,
                 "style": item.style,
@@ -407,7 +514,7 @@ class HybridRecommendationService:
             }}
             """
             
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="validation", deadline=self.deadline)
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 return json.loads(match.group(0))
@@ -420,16 +527,29 @@ class HybridRecommendationService:
     async def _get_outfit_items_full(self, outfit_ids: List[str]) -> List[Item]:
         """Busca itens completos do banco de dados"""
         try:
-            uuid_ids = [UUID(id_) for id_ in outfit_ids]
-            stmt = select(Item).filter(Item.id.in_(uuid_ids))
-            result = await self.db.execute(stmt)
-            return result.scalars().all()
+            return await wardrobe_cache.get_items_by_ids(self.db, outfit_ids)
         except Exception as e:
             logging.error(f"Erro ao buscar itens: {e}")
             return []
 
-    async def _analyze_final_outfit(self, event_raw: str, event_json: dict, outfit_items: List[Item], validation_result: Dict, gender: str) -> str:
+    def schedule_narrative(self, outfit_id: UUID, event_raw: str, event_json: dict, outfit_items: List[Item], validation_result: Dict, gender: str, signature: str) -> None:
+        """Gera a análise final depois da resposta (sem o prazo da requisição)"""
+        narrative_store.schedule(
+            outfit_id,
+            signature,
+            lambda: self._analyze_final_outfit(
+                event_raw, event_json, outfit_items, validation_result, gender, signature=signature, background=True
+            ),
+        )
+
+    async def _analyze_final_outfit(self, event_raw: str, event_json: dict, outfit_items: List[Item], validation_result: Dict, gender: str, signature: Optional[str] = None, background: bool = False) -> str:
         """Gera análise final do outfit"""
+        cached = narrative_store.cached(signature) if signature else None
+        if cached is not None:
+            return cached
+        if not background and self._budget_low(settings.DEADLINE_FINAL_ANALYSIS_RESERVE_SECONDS):
+            logging.info("Prazo curto: usando recomendação de template")
+            return self._template_recommendation(outfit_items)
         prompt = f"""
         EVENTO: {event_raw}
         DETALHES: {json.dumps(event_json)}
@@ -463,11 +583,39 @@ class HybridRecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(
+                prompt, stage="final_analysis",
+                deadline=None if background else self.deadline,
+                # em segundo plano não compete com as gerações interativas
+                priority=Priority.INGESTION if background else Priority.INTERACTIVE,
+            )
+            if response and signature:
+                narrative_store.remember(signature, response)
+            if not response and background:
+                raise ValueError("resposta vazia do LLM")
             return response or "Look criado com sucesso! Suas peças combinam perfeitamente para o evento."
         except Exception as e:
             logging.error(f"Erro na análise final: {e}")
+            if background:
+                # em segundo plano a falha é contada e o GET /narrative pode gerar de novo
+                raise
+            return "Look criado com sucesso! Suas peças combinam perfeitamente para o evento."
+
+    def _budget_low(self, reserve: float) -> bool:
+        return self.deadline is not None and self.deadline.nearly_spent(reserve)
+
+    def _template_recommendation(self, outfit_items: List[Item]) -> str:
+        """Texto curto sem LLM, usado quando o prazo da requisição está no fim"""
+        pieces = [
+            f"{item.name or item.type or 'peça'}" + (f" {item.color}" if item.color else "")
+            for item in outfit_items
+        ]
+        if not pieces:
             return "Look criado com sucesso! Suas peças combinam perfeitamente para o evento."
+        return (
+            f"Look criado com {', '.join(pieces)}. "
+            "As peças foram escolhidas pela adequação ao evento e pela harmonia entre cores e estilos."
+        )
 
     async def _save_outfit(self, user_id: UUID, event_raw: str, event_json: dict, outfit_ids: List[str]) -> Outfit:
         """Salva outfit no banco de dados"""
@@ -503,105 +651,50 @@ class HybridRecommendationService:
             self.db.add(feedback_record)
             await self.db.commit()
             
-            # Atualizar preferências do usuário se rating for alto
-            if rating >= 4:
-                await self._update_user_preferences(user_id, outfit_id)
+            # Atualizar perfil de preferências (notas baixas também contam)
+            await self._update_user_preferences(user_id, outfit_id, rating)
                 
         except Exception as e:
             logging.error(f"Erro ao salvar feedback: {e}")
 
-    async def _update_user_preferences(self, user_id: UUID, outfit_id: UUID) -> None:
-        """Atualiza preferências do usuário baseado em feedback positivo"""
+    async def _update_user_preferences(self, user_id: UUID, outfit_id: UUID, rating: int) -> None:
+        """Atualiza o perfil de preferências do usuário a partir do feedback"""
         try:
-            # Buscar o outfit
             stmt = select(Outfit).filter_by(id=outfit_id)
             result = await self.db.execute(stmt)
             outfit = result.scalar_one_or_none()
             
             if outfit:
-                # Buscar itens do outfit
                 outfit_items = await self._get_outfit_items_full([str(id_) for id_ in outfit.items])
-                
-                # Extrair padrões positivos
-                colors = [item.color for item in outfit_items]
-                styles = [item.style for item in outfit_items]
-                
-                # Atualizar ou criar preferências
-                preference_data = {
-                    "preferred_colors": colors,
-                    "preferred_styles": styles,
-                    "last_updated": datetime.utcnow()
-                }
-                
-                # Salvar preferências (implementar modelo UserPreference)
-                logging.info(f"Atualizando preferências do usuário {user_id}: {preference_data}")
+                await self.preferences.record_feedback(user_id, outfit_items, rating)
+                await strategy_bandit.record_rating(self.db, outfit_id, rating)
                 
         except Exception as e:
             logging.error(f"Erro ao atualizar preferências: {e}")
 
-    async def get_outfit_analytics(self, user_id: UUID) -> Dict:
-        """Retorna analytics dos outfits do usuário"""
-        try:
-            # Buscar todos os outfits do usuário
-            stmt = select(Outfit).filter_by(user_id=user_id)
-            result = await self.db.execute(stmt)
-            outfits = result.scalars().all()
-            
-            # Buscar feedbacks
-            stmt = select(OutfitFeedback).filter_by(user_id=user_id)
-            result = await self.db.execute(stmt)
-            feedbacks = result.scalars().all()
-            
-            # Calcular estatísticas
-            total_outfits = len(outfits)
-            avg_rating = sum(f.rating for f in feedbacks) / len(feedbacks) if feedbacks else 0
-            most_used_items = await self._get_most_used_items(user_id)
-            
-            return {
-                "total_outfits": total_outfits,
-                "average_rating": round(avg_rating, 2),
-                "most_used_items": most_used_items,
-                "feedback_count": len(feedbacks),
-                "recent_outfits": outfits[-5:] if outfits else []
-            }
-            
-        except Exception as e:
-            logging.error(f"Erro ao gerar analytics: {e}")
-            return {}
-
-    async def _get_most_used_items(self, user_id: UUID) -> List[Dict]:
-        """Retorna os itens mais usados em outfits"""
-        try:
-            stmt = select(Outfit).filter_by(user_id=user_id)
-            result = await self.db.execute(stmt)
-            outfits = result.scalars().all()
-            
-            # Contar uso dos itens
-            item_usage = {}
-            for outfit in outfits:
-                for item_id in outfit.items:
-                    item_usage[item_id] = item_usage.get(item_id, 0) + 1
-            
-            # Buscar detalhes dos itens mais usados
-            if item_usage:
-                top_items = sorted(item_usage.items(), key=lambda x: x[1], reverse=True)[:5]
-                stmt = select(Item).filter(Item.id.in_([item[0] for item in top_items]))
-                result = await self.db.execute(stmt)
-                items = result.scalars().all()
-                
-                return [
-                    {
-                        "item": item,
-                        "usage_count": item_usage.get(item.id, 0)
-                    }
-                    for item in items
-                ]
-            
-        except Exception as e:
-            logging.error(f"Erro ao buscar itens mais usados: {e}")
-        
-        return []
-    
+    async def _marketplace_candidates(self, user_items) -> List[Item]:
+        """Peças à venda mais próximas do guarda-roupa do usuário, por categoria"""
+        k = settings.HYBRID_MARKETPLACE_CANDIDATES
+        candidates: Dict[UUID, Item] = {}
+        for category in ["TOP", "BOTTOM", "SHOES"]:
+            found: List[Item] = []
+            try:
+                same_category = [embed_item(i) for i in user_items if (i.category or "").upper() == category]
+                query = centroid(same_category) or embed_item({"category": category})
+                found = [item for item, _ in await nearest_items(self.db, query, k=k, category=category, for_sale=True)]
+            except Exception as e:
+                # nearest_items usa savepoint: a sessão continua válida para o fallback
+                logging.error(f"Erro na busca vetorial do marketplace ({category}): {e}")
+            if len(found) < k:
+                # Vetores ainda não calculados (ou índice devolveu pouco): completa com varredura limitada
+                stmt = select(Item).where(Item.for_sale == True, Item.category.ilike(category))
+                if found:
+                    stmt = stmt.where(Item.id.notin_([item.id for item in found]))
+                result = await self.db.execute(stmt.limit(k - len(found)))
+                found += list(result.scalars().all())
+            for item in found:
+                candidates[item.id] = item
+        return list(candidates.values())
 
     async def _find_items_for_sale(self, missing_categories: List[str]) -> List[str]:
         """Busca itens à venda no banco para categorias faltantes"""
@@ -0,0 +1,225 @@
+from uuid import UUID
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+from app.models.outfit import Outfit
+from app.schemas.outfit import OutfitCreate
+from app.config import settings
+from app.services.preference_service import PreferenceService
+from app.services.wardrobe_cache import wardrobe_cache
+from sqlalchemy.ext.asyncio import AsyncSession
+from .helper import GeminiService
+from .analytics import save_generation_context
+from .encoding import ItemEncoder
+from .deadline import Deadline
+from app.services.garment_attributes import event_occasions, item_attributes, normalize_formality
+from app.services.compatibility import CompatibilityService
+from app.services import preference_learning
+
+
+CATEGORIES = ["TOP", "BOTTOM", "SHOES"]
+
+# Saída estruturada: contexto + seleção + justificativa em uma única chamada
+LITE_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "contexto": {
+            "type": "OBJECT",
+            "properties": {
+                "formalidade": {"type": "STRING", "enum": ["casual", "semi-formal", "formal"]},
+                "ambiente": {"type": "STRING", "enum": ["indoor", "outdoor", "misto"]},
+                "clima_sugerido": {"type": "STRING", "enum": ["quente", "frio", "ameno"]},
+                "tipo_evento": {"type": "STRING"},
+            },
+            "required": ["formalidade", "ambiente", "clima_sugerido", "tipo_evento"],
+        },
+        "outfit": {
+            "type": "OBJECT",
+            "properties": {category: {"type": "STRING"} for category in CATEGORIES},
+            "required": CATEGORIES,
+        },
+        "confidence": {"type": "NUMBER"},
+        "recomendacao": {"type": "STRING"},
+    },
+    "required": ["contexto", "outfit", "recomendacao"],
+}
+
+
+class LiteRecommendationService:
+    """Modo de baixa latência: uma única chamada ao LLM sobre candidatos pré-filtrados"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.llm = GeminiService(settings.GEMINI_API_KEY)
+        self.preferences = PreferenceService(db)
+        self.encoder = ItemEncoder()
+        self.deadline: Optional[Deadline] = None
+        self.candidates_per_category = settings.LITE_CANDIDATES_PER_CATEGORY
+
+    async def generate_outfit(self, user_id: UUID, event_raw: str, event_json: dict, gender: str, deadline: Optional[Deadline] = None) -> Dict:
+        started = time.perf_counter()
+        self.deadline = deadline
+        try:
+            items = await wardrobe_cache.get_items(self.db, user_id)
+            if not items:
+                return {"error": "Nenhum item encontrado no guarda-roupa"}
+
+            user_preferences = await self.preferences.get_preferences(user_id)
+            learned = await self.preferences.get_learned_weights(user_id)
+            candidates = self._prune_candidates(items, event_raw, event_json, user_preferences, learned)
+
+            missing = [category for category in CATEGORIES if not candidates[category]]
+            if missing:
+                return {"error": f"Categorias faltando no guarda-roupa: {set(missing)}"}
+
+            result = await self._select_outfit(event_raw, event_json, candidates, user_preferences, gender)
+            if result["strategy"] == "lite_fallback":
+                graph = await CompatibilityService(self.db).get_graph(user_id, items)
+                await graph.load_pools(candidates)
+                best = graph.best_outfit(candidates)
+                if best:
+                    result["outfit"] = best[0]
+            event_context = result["contexto"]
+            outfit_ids = result["outfit"]
+
+            db_outfit = await self._save_outfit(user_id, event_raw, event_json, outfit_ids)
+            outfit_items_full = await wardrobe_cache.get_items_by_ids(self.db, outfit_ids)
+            await self.preferences.record_outfit(user_id, outfit_items_full, event_context.get("formalidade"))
+            await save_generation_context(
+                self.db, user_id, db_outfit.id, event_context,
+                [c for category in CATEGORIES for c in candidates[category]],
+                strategy=result["strategy"],
+                generation_time=time.perf_counter() - started,
+                user_preferences=user_preferences,
+                narrative=result["recomendacao"],
+            )
+
+            return {
+                "outfit": db_outfit,
+                "items": outfit_items_full,
+                "recommendation": result["recomendacao"],
+                "confidence": result.get("confidence", 0.7),
+                "event_context": event_context,
+            }
+
+        except Exception as e:
+            logging.error(f"[LiteRecommendation] Erro na geração do outfit: {e}")
+            return {"error": "Erro interno na geração do outfit"}
+
+    def _prune_candidates(self, items, event_raw: Optional[str], event_json: Optional[dict], preferences: Dict, learned: Optional[Dict] = None) -> Dict[str, List[Dict]]:
+        """Pontuação local barata para mandar só os melhores candidatos ao LLM"""
+        event_text = f"{event_raw or ''} {json.dumps(event_json or {}, ensure_ascii=False)}".lower()
+        favorite_colors = set(preferences.get("cores_favoritas") or [])
+        favorite_styles = set(preferences.get("estilos_preferidos") or [])
+        favorite_items = set(preferences.get("pecas_favoritas") or [])
+        wanted_occasions = set(event_occasions({"tipo_evento": event_text}))
+        wanted_formality = normalize_formality(event_text) if any(w in event_text for w in ("formal", "social", "smart", "casual")) else None
+
+        grouped: Dict[str, List[Dict]] = {category: [] for category in CATEGORIES}
+        for item in items:
+            category = (item.category or "").upper()
+            if category not in grouped:
+                continue
+            style = (item.style or "").lower()
+            color = (item.color or "").lower()
+            score = 5.0
+            if style and style in event_text:
+                score += 2.0
+            if style in favorite_styles:
+                score += 1.0
+            if color in favorite_colors:
+                score += 1.0
+            if str(item.id) in favorite_items:
+                score += 0.5
+            attrs = item_attributes(item)
+            if wanted_occasions & set(attrs["occasions"] or []):
+                score += 1.5
+            if wanted_formality and attrs["formality"] == wanted_formality:
+                score += 1.5
+            score += preference_learning.preference_bonus(learned, item)
+            grouped[category].append({
+                "id": str(item.id),
+                "score": score,
+                "category": category,
+                "type": item.type,
+                "color": item.color,
+                "style": item.style,
+                "season": list(item.season or []),
+            })
+
+        for category in grouped:
+            grouped[category].sort(key=lambda c: c["score"], reverse=True)
+            grouped[category] = grouped[category][: self.candidates_per_category]
+        return grouped
+
+    async def _select_outfit(self, event_raw: Optional[str], event_json: Optional[dict], candidates: Dict[str, List[Dict]], preferences: Dict, gender: str) -> Dict:
+        listing = {}
+        for category in CATEGORIES:
+            listing[category] = self.encoder.table(candidates[category], ["h", "type", "color", "style", "season"])
+            self.encoder.report("lite", candidates[category], listing[category])
+        prompt = f"""
+        Você é um personal stylist. Em uma única resposta:
+        1. Extraia o contexto do evento (formalidade, ambiente, clima, tipo).
+        2. Escolha EXATAMENTE 1 peça de cada categoria entre as candidatas (use o valor da coluna "h").
+        3. Escreva uma justificativa curta (2-3 frases, em português) com uma dica de styling.
+
+        EVENTO: {event_raw}
+        DETALHES: {json.dumps(event_json or {}, ensure_ascii=False)}
+        GÊNERO DO USUÁRIO: {gender}
+        PREFERÊNCIAS: {json.dumps(preferences, ensure_ascii=False)}
+
+        CANDIDATAS (colunas separadas por "|", listas por ";"):
+        TOP:
+        {listing["TOP"]}
+        BOTTOM:
+        {listing["BOTTOM"]}
+        SHOES:
+        {listing["SHOES"]}
+        """
+
+        try:
+            response = await self.llm.send_prompt(
+                prompt,
+                stage="lite",
+                deadline=self.deadline,
+                generation_config={
+                    "responseMimeType": "application/json",
+                    "responseSchema": LITE_RESPONSE_SCHEMA,
+                },
+            )
+            result = json.loads(response)
+            valid_ids = {category: {c["id"] for c in candidates[category]} for category in CATEGORIES}
+            chosen = {category: self.encoder.decode(h) for category, h in (result.get("outfit") or {}).items()}
+            if all(chosen.get(category) in valid_ids[category] for category in CATEGORIES):
+                return {
+                    "contexto": result.get("contexto") or {},
+                    "outfit": [chosen[category] for category in CATEGORIES],
+                    "recomendacao": result.get("recomendacao") or "Look criado com sucesso!",
+                    "confidence": result.get("confidence", 0.8),
+                    "strategy": "lite",
+                }
+            logging.warning(f"[LiteRecommendation] Ids inválidos na resposta: {chosen}")
+        except Exception as e:
+            logging.error(f"[LiteRecommendation] Erro na seleção: {e}")
+
+        # Fallback local: melhor candidata de cada categoria
+        return {
+            "contexto": {},
+            "outfit": [candidates[category][0]["id"] for category in CATEGORIES],
+            "recomendacao": "Look montado com as peças mais adequadas do seu guarda-roupa.",
+            "confidence": 0.6,
+            "strategy": "lite_fallback",
+        }
+
+    async def _save_outfit(self, user_id: UUID, event_raw: str, event_json: dict, outfit_ids: List[str]) -> Outfit:
+        outfit_data = OutfitCreate(
+            event_raw=event_raw,
+            event_json=event_json,
+            items=[UUID(id_) for id_ in outfit_ids]
+        )
+        db_outfit = Outfit(**outfit_data.dict(), user_id=user_id)
+        self.db.add(db_outfit)
+        await self.db.commit()
+        await self.db.refresh(db_outfit)
+        return db_outfit
@@ -0,0 +1,108 @@
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from uuid import UUID
+import asyncio
+import hashlib
+import logging
+
+from sqlalchemy import update
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.models.outfit_analytics import OutfitAnalytics
+from app.services.ttl_cache import TTLCache
+
+# Campos do contexto que mudam o texto; o resto (duração, público...) não entra na chave
+SIGNATURE_FIELDS = ("tipo_evento", "formalidade", "clima_sugerido", "horario", "ambiente")
+
+
+def narrative_signature(item_ids: Iterable, event_context: Optional[Dict], gender: Optional[str]) -> str:
+    """Mesmo conjunto de peças + evento parecido = mesma narrativa"""
+    event_context = event_context or {}
+    parts = sorted(str(i) for i in item_ids)
+    for field in SIGNATURE_FIELDS:
+        parts.append(" ".join(str(event_context.get(field) or "").lower().split()))
+    parts.append(gender or "")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class NarrativeStore:
+    """Narrativas finais: cache por assinatura e geração em segundo plano por outfit"""
+
+    def __init__(self):
+        self.by_signature = TTLCache(
+            max_entries=settings.NARRATIVE_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.NARRATIVE_CACHE_TTL_SECONDS,
+        )
+        # textos prontos recentes, para o GET não precisar ir ao banco
+        self.by_outfit = TTLCache(max_entries=settings.NARRATIVE_CACHE_MAX_ENTRIES, ttl_seconds=3600)
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.generated = 0
+        self.failed = 0
+
+    def cached(self, signature: str) -> Optional[str]:
+        return self.by_signature.get(signature)
+
+    def remember(self, signature: str, text: str) -> None:
+        self.by_signature.set(signature, text)
+
+    def is_pending(self, outfit_id) -> bool:
+        return str(outfit_id) in self._pending
+
+    def schedule(self, outfit_id: UUID, signature: str, produce: Callable[[], Awaitable[str]]) -> None:
+        """Dispara a geração sem segurar a resposta; o resultado vai para o cache e para outfit_analytics"""
+        key = str(outfit_id)
+        if key in self._pending:
+            return
+
+        async def run():
+            try:
+                text = await produce()
+                self.by_outfit.set(key, text)
+                await save_narrative(outfit_id, text)
+                self.generated += 1
+                return text
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"[Narrative] Erro ao gerar narrativa do outfit {outfit_id}: {e}")
+                return None
+            finally:
+                self._pending.pop(key, None)
+
+        self._pending[key] = asyncio.create_task(run())
+
+    async def get(self, outfit_id, wait: float = 0.0) -> Optional[str]:
+        """Texto pronto, esperando até `wait` segundos por uma geração em andamento"""
+        key = str(outfit_id)
+        text = self.by_outfit.get(key)
+        if text is not None:
+            return text
+        task = self._pending.get(key)
+        if task is not None and wait > 0:
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), wait)
+            except asyncio.TimeoutError:
+                return None
+        return None
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self._pending),
+            "generated": self.generated,
+            "failed": self.failed,
+            "signature_cache": self.by_signature.stats(),
+        }
+
+
+async def save_narrative(outfit_id: UUID, text: str) -> None:
+    """Grava a narrativa no contexto de geração do outfit (sessão própria: roda depois da requisição)"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(OutfitAnalytics).where(OutfitAnalytics.outfit_id == outfit_id).values(narrative=text)
+            )
+            await db.commit()
+    except Exception as e:
+        logging.error(f"[Narrative] Erro ao salvar narrativa do outfit {outfit_id}: {e}")
+
+
+narrative_store = NarrativeStore()
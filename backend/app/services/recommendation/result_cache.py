@@ -0,0 +1,34 @@
+from typing import Iterable, Optional
+import hashlib
+import json
+
+from app.config import settings
+from app.services.ttl_cache import TTLCache
+
+
+def normalize_event(event_raw: Optional[str], event_json: Optional[dict]) -> str:
+    """Normaliza o evento para que variações de caixa/espaços caiam na mesma chave"""
+    raw = " ".join((event_raw or "").lower().split())
+    details = json.dumps(event_json or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{raw}|{details}"
+
+
+def wardrobe_fingerprint(items: Iterable) -> str:
+    """Impressão digital do conteúdo do guarda-roupa (muda a cada create/update/delete)"""
+    digest = hashlib.sha1()
+    for item in sorted(items, key=lambda i: str(i.id)):
+        digest.update(repr(item).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def make_outfit_cache_key(user_id, event_raw: Optional[str], event_json: Optional[dict], mode: str, gender: str, fingerprint: str, defer_narrative: bool = False) -> str:
+    # defer_narrative entra na chave: com ele o resultado traz a narrativa provisória (template)
+    payload = "\n".join([str(user_id), normalize_event(event_raw, event_json), mode, gender or "", fingerprint, str(int(defer_narrative))])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Resultados completos de generate_outfit (OutfitResponse), opt-in via settings
+outfit_result_cache = TTLCache(
+    max_entries=settings.OUTFIT_RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.OUTFIT_RESULT_CACHE_TTL_SECONDS,
+)
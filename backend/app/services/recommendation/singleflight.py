@@ -0,0 +1,172 @@
+from typing import Awaitable, Callable, Dict, Optional, Type, TypeVar
+import asyncio
+import hashlib
+import json
+import logging
+
+from pydantic import BaseModel
+
+from app.config import settings
+from app.services.ttl_cache import TTLCache
+from .result_cache import normalize_event
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Junta chamadas concorrentes com a mesma chave em uma única execução.
+
+    A execução roda numa task própria protegida com asyncio.shield: se o
+    cliente que a iniciou desconectar, as demais requisições que aguardam
+    a mesma chave continuam recebendo o resultado.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logging.info(f"[SingleFlight] Requisição agrupada em execução já em andamento ({key[:12]})")
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # evita "exception was never retrieved" quando todos desistiram
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+def make_flight_key(user_id, event_raw: Optional[str], event_json: Optional[dict], mode: str, defer_narrative: bool = False) -> str:
+    return f"{user_id}|{mode}|{int(defer_narrative)}|{normalize_event(event_raw, event_json)}"
+
+
+def make_idempotency_key(user_id, idempotency_key: str) -> str:
+    return f"idem|{user_id}|{idempotency_key.strip()}"
+
+
+def body_fingerprint(body: BaseModel) -> str:
+    """Hash do corpo da requisição: a mesma Idempotency-Key com outro corpo é erro do cliente"""
+    payload = json.dumps(body.model_dump(mode="json"), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """Idempotency-Key reutilizada com um corpo diferente"""
+
+
+class IdempotencyStore:
+    """Respostas por Idempotency-Key, guardadas junto com o hash do corpo.
+
+    Sem OUTFIT_IDEMPOTENCY_REDIS_URL o escopo é o processo: um retry que cai
+    em outro worker gera de novo. Com Redis a chave é reservada (SET NX)
+    antes da geração e a resposta fica visível para todos os workers.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, pending_ttl_seconds: float, redis_url: Optional[str] = None):
+        self.local = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.redis_url = redis_url
+        self._redis = None
+        self.conflicts = 0
+
+    def _client(self):
+        if self._redis is None and self.redis_url:
+            try:
+                import redis.asyncio as redis  # dependência opcional
+                self._redis = redis.from_url(self.redis_url)
+            except Exception as e:
+                logging.error(f"[Idempotency] Não foi possível usar Redis ({e}); chaves só no processo")
+                self.redis_url = None
+        return self._redis
+
+    async def lookup(self, key: str, body_hash: str, model: Type[BaseModel]) -> Optional[BaseModel]:
+        """Resposta já entregue para a chave, None se não houver (ou ainda em andamento)"""
+        entry = self.local.get(key)
+        if entry is None:
+            client = self._client()
+            if client is not None:
+                try:
+                    raw = await client.get(key)
+                except Exception as e:
+                    logging.error(f"[Idempotency] Erro ao ler do Redis: {e}")
+                    raw = None
+                if raw:
+                    data = json.loads(raw)
+                    response = model.model_validate_json(data["response"]) if data.get("response") else None
+                    entry = (data["hash"], response)
+        if entry is None:
+            return None
+        stored_hash, response = entry
+        if stored_hash != body_hash:
+            self.conflicts += 1
+            raise IdempotencyConflict(key)
+        return response
+
+    async def reserve(self, key: str, body_hash: str) -> bool:
+        """Marca a chave como em andamento; False se outro worker já reservou"""
+        client = self._client()
+        if client is not None:
+            try:
+                value = json.dumps({"hash": body_hash, "response": None})
+                if not await client.set(key, value, nx=True, ex=int(self.pending_ttl_seconds)):
+                    return False
+            except Exception as e:
+                logging.error(f"[Idempotency] Erro ao reservar no Redis: {e}")
+        self.local.set(key, (body_hash, None))
+        return True
+
+    async def save(self, key: str, body_hash: str, response: BaseModel) -> None:
+        self.local.set(key, (body_hash, response))
+        client = self._client()
+        if client is not None:
+            try:
+                value = json.dumps({"hash": body_hash, "response": response.model_dump_json()})
+                await client.set(key, value, ex=int(self.ttl_seconds))
+            except Exception as e:
+                logging.error(f"[Idempotency] Erro ao gravar no Redis: {e}")
+
+    async def release(self, key: str) -> None:
+        """Geração falhou: o cliente pode tentar de novo com a mesma chave"""
+        self.local.pop(key)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.delete(key)
+            except Exception as e:
+                logging.error(f"[Idempotency] Erro ao liberar no Redis: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            **self.local.stats(),
+            "backend": "redis" if self._redis is not None else "local",
+            "conflicts": self.conflicts,
+        }
+
+
+outfit_flights = SingleFlight()
+
+# Respostas já entregues por Idempotency-Key (por usuário)
+idempotent_responses = IdempotencyStore(
+    max_entries=settings.OUTFIT_IDEMPOTENCY_MAX_ENTRIES,
+    ttl_seconds=settings.OUTFIT_IDEMPOTENCY_TTL_SECONDS,
+    # reserva de quem morreu no meio da geração não trava a chave por um dia
+    pending_ttl_seconds=settings.OUTFIT_DEADLINE_SECONDS * 2,
+    redis_url=settings.OUTFIT_IDEMPOTENCY_REDIS_URL,
+)
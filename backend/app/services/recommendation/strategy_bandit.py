@@ -0,0 +1,168 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+import logging
+import random
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.models.strategy_stats import StrategyStats
+from app.services.ttl_cache import TTLCache
+from .analytics import load_generation_context
+
+# Ordem fixa original (usada sem dados ou com o bandit desligado)
+STRATEGIES = ["best_scored", "trend_focused", "user_preference", "color_harmony"]
+GLOBAL_KEY = "*"
+
+# (strategy, sucesso, latência em segundos)
+Outcome = Tuple[str, bool, float]
+
+
+def _norm(value) -> str:
+    text = " ".join(str(value or "").strip().lower().split())
+    return text[:40] or "?"
+
+
+def context_key(event_context: Optional[Dict]) -> str:
+    event_context = event_context or {}
+    return f"{_norm(event_context.get('tipo_evento'))}|{_norm(event_context.get('formalidade'))}"
+
+
+def _empty() -> Dict[str, float]:
+    return {"attempts": 0, "successes": 0, "latency_sum": 0.0, "rating_count": 0, "rating_sum": 0}
+
+
+class StrategyBandit:
+    """Escolhe a ordem das estratégias por contexto de evento.
+
+    Cada estratégia é um braço com três sinais: taxa de sucesso (outfit
+    completo e parseado), nota média dada pelo usuário e latência. O
+    contexto sem histórico herda um prior do agregado global.
+    """
+
+    def __init__(self):
+        self._stats = TTLCache(max_entries=512, ttl_seconds=settings.STRATEGY_BANDIT_STATS_TTL_SECONDS)
+        self.generations = 0
+        self.attempts = 0
+        self.first_choice: Counter = Counter()
+        self.wins: Counter = Counter()
+
+    async def order(self, db: AsyncSession, event_context: Optional[Dict]) -> List[str]:
+        """Estratégias da mais para a menos promissora (amostragem de Thompson)"""
+        if not settings.STRATEGY_BANDIT_ENABLED:
+            return list(STRATEGIES)
+        key = context_key(event_context)
+        local = await self._load(db, key)
+        shared = await self._load(db, GLOBAL_KEY)
+        sampled = {strategy: self._sample(local.get(strategy), shared.get(strategy)) for strategy in STRATEGIES}
+        ordered = sorted(STRATEGIES, key=lambda s: sampled[s], reverse=True)
+        self.first_choice[ordered[0]] += 1
+        return ordered
+
+    def _sample(self, local: Optional[Dict], shared: Optional[Dict]) -> float:
+        local, shared = local or _empty(), shared or _empty()
+        m = settings.STRATEGY_BANDIT_PRIOR_WEIGHT
+
+        prior_success = (shared["successes"] + 1) / (shared["attempts"] + 2)
+        failures = local["attempts"] - local["successes"]
+        success = random.betavariate(1 + local["successes"] + m * prior_success, 1 + failures + m * (1 - prior_success))
+
+        # nota 1-5 vira "acertos" fracionários em 0-1
+        def good(stats):
+            return (stats["rating_sum"] - stats["rating_count"]) / 4.0
+
+        prior_quality = (good(shared) + 1) / (shared["rating_count"] + 2)
+        quality = random.betavariate(
+            1 + good(local) + m * prior_quality,
+            1 + local["rating_count"] - good(local) + m * (1 - prior_quality),
+        )
+
+        source = local if local["attempts"] else shared
+        latency = source["latency_sum"] / source["attempts"] if source["attempts"] else 0.0
+        return success * quality - settings.STRATEGY_LATENCY_PENALTY * latency
+
+    async def record_attempts(self, db: AsyncSession, event_context: Optional[Dict], outcomes: Iterable[Outcome]) -> None:
+        """Grava as tentativas de uma geração em um único savepoint"""
+        outcomes = [o for o in outcomes if o[0] in STRATEGIES]
+        if not outcomes:
+            return
+        self.generations += 1
+        self.attempts += len(outcomes)
+        for strategy, success, _ in outcomes:
+            if success:
+                self.wins[strategy] += 1
+        await self._increment(db, event_context, [
+            (strategy, {"attempts": 1, "successes": int(success), "latency_sum": round(latency, 3)})
+            for strategy, success, latency in outcomes
+        ])
+
+    async def record_rating(self, db: AsyncSession, outfit_id: UUID, rating: int) -> None:
+        """Credita a nota de um outfit à estratégia que o gerou"""
+        context = await load_generation_context(db, outfit_id)
+        if context is None or context.strategy_used not in STRATEGIES:
+            return
+        await self._increment(db, context.event_context, [
+            (context.strategy_used, {"rating_count": 1, "rating_sum": max(1, min(5, int(rating)))})
+        ])
+
+    async def _increment(self, db: AsyncSession, event_context: Optional[Dict], updates: List[Tuple[str, Dict]]) -> None:
+        keys = (context_key(event_context), GLOBAL_KEY)
+        for key in keys:
+            cached = self._stats.get(key)
+            if cached is None:
+                continue
+            for strategy, deltas in updates:
+                entry = cached.setdefault(strategy, _empty())
+                for field, delta in deltas.items():
+                    entry[field] += delta
+        try:
+            # Savepoint: estatística de estratégia nunca derruba a geração
+            async with db.begin_nested():
+                for (strategy, deltas), key in ((u, k) for u in updates for k in keys):
+                    stmt = insert(StrategyStats).values(
+                        context_key=key, strategy=strategy, updated_at=datetime.utcnow(),
+                        **{**_empty(), **deltas},
+                    )
+                    stmt = stmt.on_conflict_do_update(
+                        constraint="uq_outfit_strategy_stats_context",
+                        set_={
+                            **{field: getattr(StrategyStats, field) + delta for field, delta in deltas.items()},
+                            "updated_at": datetime.utcnow(),
+                        },
+                    )
+                    await db.execute(stmt)
+            await db.commit()
+        except Exception as e:
+            logging.error(f"Erro ao atualizar estatísticas de estratégia: {e}")
+
+    async def _load(self, db: AsyncSession, key: str) -> Dict[str, Dict]:
+        cached = self._stats.get(key)
+        if cached is not None:
+            return cached
+        stats: Dict[str, Dict] = {}
+        try:
+            result = await db.execute(select(StrategyStats).filter_by(context_key=key))
+            for row in result.scalars().all():
+                stats[row.strategy] = {field: getattr(row, field) or 0 for field in _empty()}
+        except Exception as e:
+            logging.error(f"Erro ao carregar estatísticas de estratégia ({key}): {e}")
+        self._stats.set(key, stats)
+        return stats
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": settings.STRATEGY_BANDIT_ENABLED,
+            "generations": self.generations,
+            "attempts": self.attempts,
+            "attempts_per_generation": round(self.attempts / self.generations, 3) if self.generations else 0.0,
+            "first_choice": dict(self.first_choice),
+            "wins": dict(self.wins),
+            "contexts_cached": self._stats.stats()["entries"],
+        }
+
+
+strategy_bandit = StrategyBandit()
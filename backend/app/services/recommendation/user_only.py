@@ -1,9 +1,9 @@
-from sqlalchemy.future import select
 from uuid import UUID
 import httpx
 import json
 import logging
 import re
+import time
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from app.models.item import Item
@@ -12,22 +12,31 @@ from app.models.user_preference import UserPreference
 from app.models.outfit_feedback import OutfitFeedback
 from app.schemas.outfit import OutfitCreate
 from app.config import settings
+from app.services.preference_service import PreferenceService
+from app.services.wardrobe_cache import wardrobe_cache
 from sqlalchemy.ext.asyncio import AsyncSession
 from .helper import GeminiService  # você pode mover Gemini para um helper geral
+from .analytics import save_generation_context
+from .encoding import ItemEncoder
+from .deadline import Deadline
+from .event_guess import guess_event_context, speculative_scoring
+from app.services.garment_attributes import item_attributes, score_items_locally
+from app.services.compatibility import CompatibilityGraph, CompatibilityService
+from app.services import preference_learning
 
 class UserOnlyRecommendationService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.llm = GeminiService(settings.GEMINI_API_KEY)
+        self.preferences = PreferenceService(db)
+        self.encoder = ItemEncoder()
+        self.deadline: Optional[Deadline] = None
         self.trend_colors_2025 = ["sage green", "warm terracotta", "indigo blue", "soft beige", "deep burgundy"]
         self.trend_styles_2025 = ["oversized controlled", "vintage modern", "colorful minimalism", "texture mixing"]
         
     async def _get_outfit_items_full(self, outfit_ids: List[str]) -> List[Item]:
         try:
-            uuid_ids = [UUID(id_) for id_ in outfit_ids]
-            stmt = select(Item).filter(Item.id.in_(uuid_ids))
-            result = await self.db.execute(stmt)
-            return result.scalars().all()
+            return await wardrobe_cache.get_items_by_ids(self.db, outfit_ids)
         except Exception as e:
             logging.error(f"[RecommendationBase] Failed to fetch outfit items: {e}")
             return []
@@ -48,29 +57,49 @@ class UserOnlyRecommendationService:
             logging.error(f"[RecommendationBase] Failed to save outfit: {e}")
             raise
 
-    async def generate_outfit(self, user_id: UUID, event_raw: str, event_json: dict, gender: str) -> Dict:
+    async def generate_outfit(self, user_id: UUID, event_raw: str, event_json: dict, gender: str, deadline: Optional[Deadline] = None) -> Dict:
+        started = time.perf_counter()
+        self.deadline = deadline
         try:
-            stmt = select(Item).filter_by(user_id=user_id)
-            result = await self.db.execute(stmt)
-            items = result.scalars().all()
+            items = await wardrobe_cache.get_items(self.db, user_id)
 
             if not items:
                 return {"error": "No wardrobe items found."}
 
-            event_context = await self._analyze_event_context(event_raw, event_json)
             item_descriptions = self._prepare_item_descriptions(items)
-            scored_items = await self._score_items(event_context, item_descriptions, gender)
+            if settings.OUTFIT_SPECULATIVE_SCORING and not settings.OUTFIT_LOCAL_SCORING:
+                event_context, scored_items = await speculative_scoring(
+                    guess_event_context(event_raw, event_json),
+                    self._analyze_event_context(event_raw, event_json),
+                    lambda context: self._score_items(context, item_descriptions, gender),
+                )
+            else:
+                event_context = await self._analyze_event_context(event_raw, event_json)
+                scored_items = await self._score_items(event_context, item_descriptions, gender)
+            learned = await self.preferences.get_learned_weights(user_id)
+            scored_items = preference_learning.apply_bonus(
+                scored_items, learned, {d["id"]: d for d in item_descriptions}
+            )
             categories = self._group_by_category(scored_items)
+            graph = await CompatibilityService(self.db).get_graph(user_id, items)
+            await graph.load_pools(categories)
 
-            outfit = self._assemble_best_outfit(categories)
+            outfit = self._assemble_best_outfit(categories, graph)
             if not outfit:
                 return {"error": "Could not generate a complete outfit."}
 
             db_outfit = await self._save_outfit(user_id, event_raw, event_json, outfit)
+            outfit_items_full = await self._get_outfit_items_full(outfit)
+            await self.preferences.record_outfit(user_id, outfit_items_full, event_context.get("formalidade"))
+            await save_generation_context(
+                self.db, user_id, db_outfit.id, event_context, scored_items,
+                strategy="best_scored",
+                generation_time=time.perf_counter() - started,
+            )
 
             return {
                 "outfit": db_outfit,
-                "items": await self._get_outfit_items_full(outfit),
+                "items": outfit_items_full,
                 "recommendation": "Outfit generated using only your wardrobe items.",
                 "is_optimal": False
             }
@@ -88,10 +117,15 @@ class UserOnlyRecommendationService:
                 "style": item.style,
                 "season": item.season,
                 "state": item.state,
+                **item_attributes(item),
             } for item in items
         ]
 
     async def _score_items(self, context: dict, items: List[dict], gender: str) -> List[Dict]:
+        if settings.OUTFIT_LOCAL_SCORING:
+            return score_items_locally(items, context)
+        listing = self.encoder.table(items, ["h", "category", "type", "color", "style", "season", "state"])
+        self.encoder.report("scoring", items, listing)
         prompt = f"""
         Você é um assistente de moda. Avalie as peças abaixo com base no evento descrito e dê uma nota de 0 a 10 para cada.
 
@@ -100,45 +134,52 @@ class UserOnlyRecommendationService:
 
         Gênero do usuário: {gender}
 
-        Peças:
-        {json.dumps(items)}
+        Peças (colunas separadas por "|", listas por ";"; "h" identifica a peça):
+        {listing}
 
-        Responda APENAS com um JSON válido:
+        Responda APENAS com um JSON válido, usando em "id" o valor da coluna "h":
         {{
           "scores": [
-            {{"id": "uuid", "score": 8.3, "category": "TOP"}},
+            {{"id": "p1", "score": 8.3, "category": "TOP"}},
             ...
           ]
         }}
         """
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="scoring", deadline=self.deadline)
             match = re.search(r'{.*}', response, re.DOTALL)
             if match:
-                return json.loads(match.group(0)).get("scores", [])
+                scores = []
+                for score in json.loads(match.group(0)).get("scores", []):
+                    item_id = self.encoder.decode(score.get("id"))
+                    if item_id is not None:
+                        scores.append({**score, "id": item_id})
+                return scores
         except Exception as e:
             logging.error(f"[UserOnlyScore] Erro: {e}")
-        return []
+        return score_items_locally(items, context)
 
-    def _group_by_category(self, scored: List[Dict]) -> Dict[str, List[str]]:
+    def _group_by_category(self, scored: List[Dict], per_category: int = 5) -> Dict[str, List[Dict]]:
         grouped = {"TOP": [], "BOTTOM": [], "SHOES": []}
         for s in sorted(scored, key=lambda x: x["score"], reverse=True):
-            cat = s["category"].upper()
-            if cat in grouped and len(grouped[cat]) < 1:
-                grouped[cat].append(s["id"])
+            cat = (s.get("category") or "").upper()
+            if cat in grouped and len(grouped[cat]) < per_category:
+                grouped[cat].append(s)
         return grouped
 
-    def _assemble_best_outfit(self, grouped: Dict[str, List[str]]) -> Optional[List[str]]:
-        if all(grouped[cat] for cat in ["TOP", "BOTTOM", "SHOES"]):
-            return [grouped["TOP"][0], grouped["BOTTOM"][0], grouped["SHOES"][0]]
-        return None
+    def _assemble_best_outfit(self, grouped: Dict[str, List[Dict]], graph: Optional[CompatibilityGraph] = None) -> Optional[List[str]]:
+        """Melhor combinação entre as mais bem pontuadas, pesando a compatibilidade entre pares"""
+        if not all(grouped[cat] for cat in ["TOP", "BOTTOM", "SHOES"]):
+            return None
+        if graph is not None:
+            best = graph.best_outfit(grouped)
+            if best:
+                return best[0]
+        return [grouped["TOP"][0]["id"], grouped["BOTTOM"][0]["id"], grouped["SHOES"][0]["id"]]
 
     async def _get_outfit_items_full(self, outfit_ids: List[str]) -> List[Item]:
         try:
-            uuid_ids = [UUID(id_) for id_ in outfit_ids]
-            stmt = select(Item).filter(Item.id.in_(uuid_ids))
-            result = await self.db.execute(stmt)
-            return result.scalars().all()
+            return await wardrobe_cache.get_items_by_ids(self.db, outfit_ids)
         except Exception as e:
             logging.error(f"Erro ao buscar peças do outfit: {e}")
             return []
@@ -160,7 +201,7 @@ class UserOnlyRecommendationService:
         {{"formalidade": "casual", "ambiente": "indoor", "clima_sugerido": "ameno", "tipo_evento": "social"}}
         """
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="event_context", deadline=self.deadline)
             match = re.search(r'{.*}', response, re.DOTALL)
             if match:
                 return json.loads(match.group(0))
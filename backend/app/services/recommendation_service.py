@@ -1,6 +1,6 @@
+from sqlalchemy import func
 from sqlalchemy.future import select
 from uuid import UUID
-import httpx
 import json
 import logging
 import re
@@ -12,42 +12,19 @@ from app.models.user_preference import UserPreference  # Novo modelo para prefer
 from app.models.outfit_feedback import OutfitFeedback  # Novo modelo para feedback
 from app.schemas.outfit import OutfitCreate
 from app.config import settings
+from app.services.preference_service import PreferenceService
+from app.services.wardrobe_cache import wardrobe_cache
 from app.models.item import Item 
 from sqlalchemy.ext.asyncio import AsyncSession
-
-
-class GeminiService:
-    def __init__(self, api_key: str, model: str = "gemini-2.5-flash"):
-        self.api_key = api_key
-        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-
-    async def send_prompt(self, prompt: str, max_retries: int = 3) -> str:
-        """Envia prompt para o Gemini com retry automático"""
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-                    response = await client.post(
-                        self.url,
-                        headers={"Content-Type": "application/json"},
-                        params={"key": self.api_key},
-                        json={"contents": [{"parts": [{"text": prompt}]}]}
-                    )
-                    response.raise_for_status()
-                    result = response.json()
-                    parts = result.get("candidates", [])[0].get("content", {}).get("parts", [])
-                    if parts and isinstance(parts[0], dict) and "text" in parts[0]:
-                        return parts[0]["text"]
-            except Exception as e:
-                logging.error(f"[GeminiService] Tentativa {attempt + 1} falhou: {e}")
-                if attempt == max_retries - 1:
-                    raise
-        return ""
+from app.services.recommendation.helper import GeminiService
+from app.services.recommendation.strategy_bandit import strategy_bandit
 
 
 class RecommendationService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.llm = GeminiService(settings.GEMINI_API_KEY)
+        self.preferences = PreferenceService(db)
         self.trend_colors_2025 = ["sage green", "warm terracotta", "indigo blue", "soft beige", "deep burgundy"]
         self.trend_styles_2025 = ["oversized controlled", "vintage modern", "colorful minimalism", "texture mixing"]
 
@@ -55,8 +32,7 @@ class RecommendationService:
         """Gera outfit completo com análise contextual"""
         try:
             # 1. Buscar itens do usuário
-            result = await self.db.execute(select(Item).filter_by(user_id=user_id))
-            items = result.scalars().all()
+            items = await wardrobe_cache.get_items(self.db, user_id)
             
             if not items:
                 return {"error": "Nenhum item encontrado no guarda-roupa"}
@@ -98,6 +74,7 @@ class RecommendationService:
             
             # 10. Salvar no banco
             db_outfit = await self._save_outfit(user_id, event_raw, event_json, outfit_result["outfit"])
+            await self.preferences.record_outfit(user_id, outfit_items_full, event_context.get("formalidade"))
             
             return {
                 "outfit": db_outfit,
@@ -142,7 +119,7 @@ class RecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="event_context")
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 context = json.loads(match.group(0))
@@ -163,73 +140,8 @@ class RecommendationService:
         }
 
     async def _get_user_preferences(self, user_id: UUID) -> Dict:
-        """Busca preferências do usuário baseadas em histórico"""
-        try:
-            # Buscar outfits anteriores
-            stmt = select(Outfit).filter_by(user_id=user_id).order_by(Outfit.created_at.desc()).limit(20)
-            result = await self.db.execute(stmt)
-            recent_outfits = result.scalars().all()
-            
-            # Buscar feedback positivo
-            stmt = select(OutfitFeedback).filter_by(user_id=user_id).filter(OutfitFeedback.rating >= 4)
-            result = await self.db.execute(stmt)
-            positive_feedback = result.scalars().all()
-            
-            # Analisar padrões
-            preferences = await self._analyze_user_patterns(recent_outfits, positive_feedback)
-            
-            return preferences
-            
-        except Exception as e:
-            logging.error(f"Erro ao buscar preferências: {e}")
-            return {}
-
-    async def _analyze_user_patterns(self, recent_outfits: List, positive_feedback: List) -> Dict:
-        """Analisa padrões de preferência do usuário"""
-        if not recent_outfits:
-            return {}
-        
-        # Coletar dados dos outfits
-        outfit_data = []
-        for outfit in recent_outfits:
-            outfit_items = await self._get_outfit_items_full(outfit.items)
-            outfit_data.extend([{
-                "type": item.type,
-                "color": item.color,
-                "style": item.style,
-                "category": item.category
-            } for item in outfit_items])
-        
-        prompt = f"""
-        Analise os padrões de preferência do usuário baseado em seus outfits anteriores:
-        
-        Dados dos outfits: {json.dumps(outfit_data)}
-        
-        Identifique:
-        - Cores mais usadas
-        - Estilos preferidos
-        - Combinações favoritas
-        - Padrões de formalidade
-        
-        Retorne JSON:
-        {{
-            "cores_favoritas": ["lista"],
-            "estilos_preferidos": ["lista"],
-            "formalidade_usual": "casual|semi-formal|formal",
-            "combinacoes_favoritas": ["descrições"],
-            "confidence": 0.8
-        }}
-        """
-        
-        try:
-            response = await self.llm.send_prompt(prompt)
-            match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
-            if match:
-                return json.loads(match.group(0))
-        except Exception as e:
-            logging.error(f"Erro ao analisar padrões: {e}")
-        
-        return {}
+        """Busca o perfil de preferências materializado do usuário"""
+        return await self.preferences.get_preferences(user_id)
 
     def _prepare_item_descriptions(self, items: List[Item]) -> List[Dict]:
         """Prepara descrições estruturadas dos itens"""
@@ -280,7 +192,7 @@ class RecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="scoring")
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 result = json.loads(match.group(0))
@@ -363,7 +275,7 @@ class RecommendationService:
         {{"outfit": ["id_top", "id_bottom", "id_shoes"], "confidence": 0.95}}
         """
         
-        response = await self.llm.send_prompt(prompt)
+        response = await self.llm.send_prompt(prompt, stage="strategy")
         
         try:
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
@@ -445,7 +357,7 @@ class RecommendationService:
             }}
             """
             
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="validation")
             match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
             if match:
                 return json.loads(match.group(0))
@@ -458,10 +370,7 @@ class RecommendationService:
     async def _get_outfit_items_full(self, outfit_ids: List[str]) -> List[Item]:
         """Busca itens completos do banco de dados"""
         try:
-            uuid_ids = [UUID(id_) for id_ in outfit_ids]
-            stmt = select(Item).filter(Item.id.in_(uuid_ids))
-            result = await self.db.execute(stmt)
-            return result.scalars().all()
+            return await wardrobe_cache.get_items_by_ids(self.db, outfit_ids)
         except Exception as e:
             logging.error(f"Erro ao buscar itens: {e}")
             return []
@@ -501,7 +410,7 @@ class RecommendationService:
         """
         
         try:
-            response = await self.llm.send_prompt(prompt)
+            response = await self.llm.send_prompt(prompt, stage="final_analysis")
             return response or "Look criado com sucesso! Suas peças combinam perfeitamente para o evento."
         except Exception as e:
             logging.error(f"Erro na análise final: {e}")
@@ -527,7 +436,7 @@ class RecommendationService:
             logging.error(f"Erro ao salvar outfit: {e}")
             raise
 
-    async def save_user_feedback(self, user_id: UUID, outfit_id: UUID, rating: int, feedback: str) -> None:
+    async def save_user_feedback(self, user_id: UUID, outfit_id: UUID, rating: int, feedback: str) -> Optional[OutfitFeedback]:
         """Salva feedback do usuário para melhorar futuras recomendações"""
         try:
             feedback_record = OutfitFeedback(
@@ -541,99 +450,93 @@ class RecommendationService:
             self.db.add(feedback_record)
             await self.db.commit()
             
-            # Atualizar preferências do usuário se rating for alto
-            if rating >= 4:
-                await self._update_user_preferences(user_id, outfit_id)
+            # Atualizar perfil de preferências (notas baixas também contam)
+            await self._update_user_preferences(user_id, outfit_id, rating)
+            await self.db.refresh(feedback_record)
+            return feedback_record
                 
         except Exception as e:
             logging.error(f"Erro ao salvar feedback: {e}")
+            return None
 
-    async def _update_user_preferences(self, user_id: UUID, outfit_id: UUID) -> None:
-        """Atualiza preferências do usuário baseado em feedback positivo"""
+    async def _update_user_preferences(self, user_id: UUID, outfit_id: UUID, rating: int) -> None:
+        """Atualiza o perfil de preferências do usuário a partir do feedback"""
         try:
-            # Buscar o outfit
             stmt = select(Outfit).filter_by(id=outfit_id)
             result = await self.db.execute(stmt)
             outfit = result.scalar_one_or_none()
             
             if outfit:
-                # Buscar itens do outfit
                 outfit_items = await self._get_outfit_items_full([str(id_) for id_ in outfit.items])
-                
-                # Extrair padrões positivos
-                colors = [item.color for item in outfit_items]
-                styles = [item.style for item in outfit_items]
-                
-                # Atualizar ou criar preferências
-                preference_data = {
-                    "preferred_colors": colors,
-                    "preferred_styles": styles,
-                    "last_updated": datetime.utcnow()
-                }
-                
-                # Salvar preferências (implementar modelo UserPreference)
-                logging.info(f"Atualizando preferências do usuário {user_id}: {preference_data}")
+                await self.preferences.record_feedback(user_id, outfit_items, rating)
+                await strategy_bandit.record_rating(self.db, outfit_id, rating)
                 
         except Exception as e:
             logging.error(f"Erro ao atualizar preferências: {e}")
 
     async def get_outfit_analytics(self, user_id: UUID) -> Dict:
-        """Retorna analytics dos outfits do usuário"""
+        """Retorna analytics dos outfits do usuário (agregações feitas no banco)"""
         try:
-            # Buscar todos os outfits do usuário
-            stmt = select(Outfit).filter_by(user_id=user_id)
-            result = await self.db.execute(stmt)
-            outfits = result.scalars().all()
-            
-            # Buscar feedbacks
-            stmt = select(OutfitFeedback).filter_by(user_id=user_id)
+            # Contadores incrementais do perfil; agrega no banco se ainda não existir
+            counters = await self.preferences.get_counters(user_id)
+            if counters is None:
+                counters = await self.preferences.aggregate_counters(user_id)
+
+            feedback_count = counters["feedback_count"]
+            avg_rating = counters["rating_sum"] / feedback_count if feedback_count else 0
+
+            stmt = (
+                select(Outfit)
+                .filter_by(user_id=user_id)
+                .order_by(Outfit.created_at.desc())
+                .limit(5)
+            )
             result = await self.db.execute(stmt)
-            feedbacks = result.scalars().all()
-            
-            # Calcular estatísticas
-            total_outfits = len(outfits)
-            avg_rating = sum(f.rating for f in feedbacks) / len(feedbacks) if feedbacks else 0
+            recent_outfits = result.scalars().all()
+
             most_used_items = await self._get_most_used_items(user_id)
             
             return {
-                "total_outfits": total_outfits,
+                "total_outfits": counters["outfit_count"],
                 "average_rating": round(avg_rating, 2),
                 "most_used_items": most_used_items,
-                "feedback_count": len(feedbacks),
-                "recent_outfits": outfits[-5:] if outfits else []
+                "feedback_count": feedback_count,
+                "recent_outfits": recent_outfits
             }
             
         except Exception as e:
             logging.error(f"Erro ao gerar analytics: {e}")
             return {}
 
-    async def _get_most_used_items(self, user_id: UUID) -> List[Dict]:
-        """Retorna os itens mais usados em outfits"""
+    async def _get_most_used_items(self, user_id: UUID, limit: int = 5) -> List[Dict]:
+        """Retorna os itens mais usados em outfits (unnest + GROUP BY no banco)"""
         try:
-            stmt = select(Outfit).filter_by(user_id=user_id)
+            used = (
+                select(func.unnest(Outfit.items).label("item_id"))
+                .where(Outfit.user_id == user_id)
+                .subquery()
+            )
+            usage = (
+                select(used.c.item_id, func.count().label("usage_count"))
+                .group_by(used.c.item_id)
+                .order_by(func.count().desc())
+                .limit(limit)
+                .subquery()
+            )
+            stmt = (
+                select(Item, usage.c.usage_count)
+                .join(usage, Item.id == usage.c.item_id)
+                .order_by(usage.c.usage_count.desc())
+            )
             result = await self.db.execute(stmt)
-            outfits = result.scalars().all()
-            
-            # Contar uso dos itens
-            item_usage = {}
-            for outfit in outfits:
-                for item_id in outfit.items:
-                    item_usage[item_id] = item_usage.get(item_id, 0) + 1
             
-            # Buscar detalhes dos itens mais usados
-            if item_usage:
-                top_items = sorted(item_usage.items(), key=lambda x: x[1], reverse=True)[:5]
-                stmt = select(Item).filter(Item.id.in_([item[0] for item in top_items]))
-                result = await self.db.execute(stmt)
-                items = result.scalars().all()
-                
-                return [
-                    {
-                        "item": item,
-                        "usage_count": item_usage.get(item.id, 0)
-                    }
-                    for item in items
-                ]
+            return [
+                {
+                    "item": item,
+                    "usage_count": usage_count
+                }
+                for item, usage_count in result.all()
+            ]
             
         except Exception as e:
             logging.error(f"Erro ao buscar itens mais usados: {e}")
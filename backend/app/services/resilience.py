@@ -0,0 +1,248 @@
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from app.config import settings
+
+T = TypeVar("T")
+
+# 408/425/429 e 5xx são transitórios; os demais 4xx indicam erro na requisição
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Upstream marcado como indisponível; a chamada falha sem sair do processo"""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    max_retry_after: float = 30.0
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes da próxima tentativa: Retry-After se houver, senão exponencial com jitter"""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        # "full jitter": sorteia entre 0 e o teto exponencial
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def default_policy(max_attempts: Optional[int] = None) -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=max_attempts or settings.RESILIENCE_MAX_ATTEMPTS,
+        base_delay=settings.RESILIENCE_BASE_DELAY_SECONDS,
+        max_delay=settings.RESILIENCE_MAX_DELAY_SECONDS,
+        max_retry_after=settings.RESILIENCE_MAX_RETRY_AFTER_SECONDS,
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    # timeouts, conexão recusada, reset etc.
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Lê o header Retry-After (segundos ou data HTTP) de uma resposta de erro"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Abre após N falhas transitórias seguidas e deixa passar uma sonda depois de reset_seconds"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            else:
+                self.rejected += 1
+                raise CircuitOpenError(f"circuito {self.name} aberto")
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"circuito {self.name} em teste")
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logging.info(f"[CircuitBreaker] {self.name} fechado novamente")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Chamada terminou sem resposta do upstream (erro local, cancelamento): libera a sonda"""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning(f"[CircuitBreaker] {self.name} aberto após {self.failures} falhas")
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class HedgeStats:
+    def __init__(self):
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def stats(self) -> Dict:
+        return {"hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+hedge_stats = HedgeStats()
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+)
+supabase_breaker = CircuitBreaker(
+    "supabase",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+)
+
+
+async def hedged(attempt: Callable[[], Awaitable[T]], delay: float) -> T:
+    """Dispara uma segunda tentativa se a primeira passar de `delay`; fica com a que terminar antes"""
+    first = asyncio.ensure_future(attempt())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        hedge_stats.hedged += 1
+        second = asyncio.ensure_future(attempt())
+        tasks.add(second)
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        hedge_stats.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call_with_resilience(
+    attempt: Callable[[], Awaitable[T]],
+    *,
+    breaker: Optional[CircuitBreaker] = None,
+    policy: Optional[RetryPolicy] = None,
+    deadline=None,
+    hedge_delay: Optional[float] = None,
+    label: str = "upstream",
+) -> T:
+    """Executa `attempt` com backoff, Retry-After, circuit breaker e hedge opcional.
+
+    `attempt` deve levantar httpx.HTTPStatusError (raise_for_status) para que o
+    status seja classificado. `deadline` é qualquer objeto com remaining().
+    """
+    policy = policy or default_policy()
+    for attempt_number in range(policy.max_attempts):
+        if breaker:
+            breaker.before_call()
+        try:
+            if hedge_delay:
+                result = await hedged(attempt, hedge_delay)
+            else:
+                result = await attempt()
+        except BaseException as e:
+            # BaseException: uma sonda cancelada (hedge, especulação, cliente desconectou) precisa ser liberada
+            retryable = isinstance(e, Exception) and is_retryable(e)
+            if breaker:
+                if retryable:
+                    breaker.record_failure()
+                elif isinstance(e, httpx.HTTPStatusError):
+                    # 4xx não retentável: o upstream respondeu, então está saudável
+                    breaker.record_success()
+                else:
+                    # limiter, prazo, parse ou cancelamento: nada a dizer sobre o upstream
+                    breaker.release_probe()
+            if not retryable or attempt_number == policy.max_attempts - 1:
+                raise
+            delay = policy.backoff(attempt_number, retry_after_seconds(e))
+            if deadline is not None and deadline.remaining() <= delay:
+                raise
+            logging.warning(
+                f"[Resilience] {label}: tentativa {attempt_number + 1} falhou ({e}); "
+                f"nova tentativa em {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+            continue
+        if breaker:
+            breaker.record_success()
+        return result
+    raise RuntimeError("RetryPolicy sem tentativas")  # max_attempts < 1
+
+
+def resilience_stats() -> Dict:
+    return {
+        "circuit_breakers": {
+            gemini_breaker.name: gemini_breaker.stats(),
+            supabase_breaker.name: supabase_breaker.stats(),
+        },
+        "hedging": hedge_stats.stats(),
+    }
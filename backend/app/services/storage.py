@@ -0,0 +1,116 @@
+from pathlib import Path as _Path
+from typing import Optional
+import uuid
+
+import httpx
+
+from app.config import settings
+from app.services.resilience import call_with_resilience, supabase_breaker
+
+
+def new_object_key(user_id: str, filename: str, folder: str = "") -> str:
+    ext = _Path(filename or "").suffix or ".png"
+    prefix = f"{user_id}/{folder}/" if folder else f"{user_id}/"
+    return f"{prefix}{uuid.uuid4()}{ext}"
+
+
+def public_url(file_key: str) -> str:
+    return (
+        f"{settings.SUPABASE_URL}/storage/v1/object/public/"
+        f"{settings.SUPABASE_STORAGE_BUCKET}/{file_key}"
+    )
+
+
+def object_path(url: str) -> str:
+    """Caminho do objeto no bucket a partir da URL pública"""
+    return url.replace(public_url(""), "")
+
+
+async def upload_bytes(data: bytes, file_key: str, content_type: str = "image/png") -> str:
+    """Envia para o Supabase Storage e devolve a URL pública (levanta em caso de erro)"""
+
+    async def attempt():
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(
+                f"{settings.SUPABASE_URL}/storage/v1/object/"
+                f"{settings.SUPABASE_STORAGE_BUCKET}/{file_key}",
+                headers={
+                    "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+                    "Content-Type": content_type,
+                    # upsert: se a tentativa anterior gravou e só a resposta se perdeu (timeout),
+                    # o retry sobrescreve com os mesmos bytes em vez de falhar com 409 (chave é única)
+                    "x-upsert": "true",
+                },
+                content=data,
+            )
+            resp.raise_for_status()
+            return resp
+
+    await call_with_resilience(attempt, breaker=supabase_breaker, label="Supabase upload")
+    return public_url(file_key)
+
+
+async def delete_object(path: str) -> None:
+
+    async def attempt():
+        async with httpx.AsyncClient() as client:
+            resp = await client.delete(
+                f"{settings.SUPABASE_URL}/storage/v1/object/"
+                f"{settings.SUPABASE_STORAGE_BUCKET}/{path}",
+                headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"}
+            )
+            resp.raise_for_status()
+            return resp
+
+    await call_with_resilience(attempt, breaker=supabase_breaker, label="Supabase delete")
+
+
+async def download(url: str) -> bytes:
+
+    async def attempt():
+        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
+            resp = await client.get(url)
+            resp.raise_for_status()
+            return resp
+
+    resp = await call_with_resilience(attempt, breaker=supabase_breaker, label="Supabase download")
+    return resp.content
+
+
+async def create_signed_upload(file_key: str) -> str:
+    """URL assinada para o cliente enviar o arquivo direto ao bucket (PUT), sem passar pela API"""
+
+    async def attempt():
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(
+                f"{settings.SUPABASE_URL}/storage/v1/object/upload/sign/"
+                f"{settings.SUPABASE_STORAGE_BUCKET}/{file_key}",
+                headers={"Authorization": f"Bearer {settings.SUPABASE_KEY}"},
+            )
+            resp.raise_for_status()
+            return resp
+
+    resp = await call_with_resilience(attempt, breaker=supabase_breaker, label="Supabase sign upload")
+    # a resposta traz o caminho relativo com o token: /object/upload/sign/<bucket>/<key>?token=...
+    return f"{settings.SUPABASE_URL}/storage/v1{resp.json()['url']}"
+
+
+async def object_size(file_key: str) -> Optional[int]:
+    """Tamanho do objeto em bytes, ou None se ele não existir (ValueError se o storage não informar)"""
+
+    async def attempt():
+        async with httpx.AsyncClient() as client:
+            resp = await client.head(public_url(file_key))
+            if resp.status_code in (400, 404):
+                return None
+            resp.raise_for_status()
+            return resp
+
+    resp = await call_with_resilience(attempt, breaker=supabase_breaker, label="Supabase head")
+    if resp is None:
+        return None
+    length = resp.headers.get("content-length")
+    if not length:
+        # sem tamanho não dá para aplicar o limite: quem chama rejeita
+        raise ValueError("storage não informou o tamanho do objeto")
+    return int(length)
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import settings
+from app.database.database import is_replica
+from app.models.item import Item
+
+
+@dataclass(frozen=True, slots=True)
+class ItemRecord:
+    """Cópia compacta e somente leitura de uma linha de items"""
+    id: UUID
+    user_id: UUID
+    name: Optional[str]
+    type: Optional[str]
+    color: Optional[str]
+    state: Optional[str]
+    season: Optional[Tuple[str, ...]]
+    category: Optional[str]
+    img_url: str
+    for_sale: bool
+    price: Optional[float]
+    characteristics: Optional[Tuple[str, ...]]
+    style: Optional[str]
+    created_at: Optional[datetime]
+    formality: Optional[str] = None
+    warmth: Optional[int] = None
+    color_family: Optional[str] = None
+    pattern: Optional[str] = None
+    occasions: Optional[Tuple[str, ...]] = None
+
+    @classmethod
+    def from_model(cls, item: Item) -> "ItemRecord":
+        return cls(
+            id=item.id,
+            user_id=item.user_id,
+            name=item.name,
+            type=item.type,
+            color=item.color,
+            state=item.state,
+            season=tuple(item.season) if item.season is not None else None,
+            category=item.category,
+            img_url=item.img_url,
+            for_sale=bool(item.for_sale),
+            price=float(item.price) if item.price is not None else None,
+            characteristics=tuple(item.characteristics) if item.characteristics is not None else None,
+            style=item.style,
+            created_at=item.created_at,
+            formality=item.formality,
+            warmth=item.warmth,
+            color_family=item.color_family,
+            pattern=item.pattern,
+            occasions=tuple(item.occasions) if item.occasions is not None else None,
+        )
+
+
+@dataclass(slots=True)
+class _Entry:
+    version: int
+    loaded_at: float
+    items: Tuple[ItemRecord, ...]
+
+
+class WardrobeCache:
+    """Snapshot do guarda-roupa por usuário, com versão e despejo LRU.
+
+    create/update/delete de itens chamam invalidate(), que incrementa a
+    versão do usuário e descarta o snapshot. As versões são carimbos
+    crescentes que nunca voltam atrás: o mapa é limitado, e o usuário que
+    sai dele passa a valer o piso (maior carimbo já descartado). O cache é
+    por processo; com vários workers, o TTL limita por quanto tempo um
+    snapshot pode ficar desatualizado em relação a escritas feitas em outro worker.
+    """
+
+    def __init__(self, max_users: int, max_items: int, ttl_seconds: float):
+        self.max_users = max_users
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # user -> (carimbo, quando); ordem de inserção = ordem dos carimbos
+        self._versions: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._version_floor = 0
+        self.max_versions = max(1000, max_users * 4)
+        self._index: Dict[UUID, ItemRecord] = {}
+        self._clock = 0
+        self._item_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, user_id) -> int:
+        stamp = self._versions.get(str(user_id))
+        return stamp[0] if stamp is not None else self._version_floor
+
+    def invalidate(self, user_id) -> int:
+        """Incrementa a versão do guarda-roupa e descarta o snapshot"""
+        key = str(user_id)
+        self._clock += 1
+        now = time.monotonic()
+        self._versions.pop(key, None)
+        self._versions[key] = (self._clock, now)
+        self._prune_versions(now)
+        self._drop(key)
+        return self._clock
+
+    def _prune_versions(self, now: float) -> None:
+        # carimbo mais velho que o TTL não protege snapshot válido; o piso sobe junto,
+        # então uma leitura iniciada antes do invalidate nunca volta a casar
+        while self._versions:
+            key, (stamp, stamped_at) = next(iter(self._versions.items()))
+            if len(self._versions) <= self.max_versions and now - stamped_at <= self.ttl_seconds:
+                break
+            self._versions.pop(key)
+            self._version_floor = max(self._version_floor, stamp)
+
+    async def get_items(self, db: AsyncSession, user_id) -> Tuple[ItemRecord, ...]:
+        key = str(user_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == self.version(key) and not self._expired(entry):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.items
+
+        self.misses += 1
+        version = self.version(key)
+        # peças ainda em processamento (upload assíncrono) não entram nas recomendações
+        result = await db.execute(select(Item).filter_by(user_id=user_id, processing_status="ready"))
+        items = tuple(ItemRecord.from_model(item) for item in result.scalars().all())
+
+        # Se houve escrita durante a consulta, não guarda um snapshot velho;
+        # leitura da réplica também não (pode estar atrasada em relação ao primário)
+        if self.version(key) == version and not is_replica(db):
+            self._store(key, _Entry(version=version, loaded_at=time.monotonic(), items=items))
+        return items
+
+    def find(self, item_ids: Iterable) -> Tuple[Dict[UUID, ItemRecord], List[UUID]]:
+        """Procura itens nos snapshots em cache; retorna (encontrados, faltantes)"""
+        found: Dict[UUID, ItemRecord] = {}
+        missing: List[UUID] = []
+        for item_id in item_ids:
+            uuid_id = item_id if isinstance(item_id, UUID) else UUID(str(item_id))
+            record = self._index.get(uuid_id)
+            if record is not None and self._is_fresh(str(record.user_id)):
+                found[uuid_id] = record
+            else:
+                missing.append(uuid_id)
+        return found, missing
+
+    async def get_items_by_ids(self, db: AsyncSession, item_ids: Iterable) -> List:
+        """Busca itens por id, usando o cache e consultando o banco só para os faltantes"""
+        uuid_ids = [item_id if isinstance(item_id, UUID) else UUID(str(item_id)) for item_id in item_ids]
+        found, missing = self.find(uuid_ids)
+        by_id: Dict[UUID, object] = dict(found)
+        if missing:
+            result = await db.execute(select(Item).filter(Item.id.in_(missing)))
+            for item in result.scalars().all():
+                by_id[item.id] = item
+        return [by_id[item_id] for item_id in uuid_ids if item_id in by_id]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "items": self._item_count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _is_fresh(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.version == self.version(key) and not self._expired(entry)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.loaded_at > self.ttl_seconds
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        self._drop(key)
+        if len(entry.items) > self.max_items:
+            return
+        self._entries[key] = entry
+        self._item_count += len(entry.items)
+        for record in entry.items:
+            self._index[record.id] = record
+        while len(self._entries) > self.max_users or self._item_count > self.max_items:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._item_count -= len(entry.items)
+        for record in entry.items:
+            if self._index.get(record.id) is record:
+                del self._index[record.id]
+
+
+wardrobe_cache = WardrobeCache(
+    max_users=settings.WARDROBE_CACHE_MAX_USERS,
+    max_items=settings.WARDROBE_CACHE_MAX_ITEMS,
+    ttl_seconds=settings.WARDROBE_CACHE_TTL_SECONDS,
+)
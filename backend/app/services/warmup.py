@@ -0,0 +1,93 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class WarmupStep:
+    def __init__(self, name: str, run: Callable[[], Awaitable[None]], required: bool):
+        self.name = name
+        self.run = run
+        self.required = required
+        self.status = PENDING
+        self.attempts = 0
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "status": self.status,
+            "required": self.required,
+            "attempts": self.attempts,
+            "seconds": self.seconds,
+            "error": self.error,
+        }
+
+
+class Warmup:
+    """Etapas pesadas do startup rodando depois que a API já aceita conexões.
+
+    Etapas obrigatórias (banco) seguram o GET /ready até terminarem e são
+    repetidas em caso de erro; as opcionais (modelo do rembg, cliente
+    Supabase) só adiantam trabalho que de outro jeito cairia na primeira
+    requisição.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, WarmupStep] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.started_at: Optional[float] = None
+
+    def add(self, name: str, run: Callable[[], Awaitable[None]], required: bool = False) -> None:
+        self.steps[name] = WarmupStep(name, run, required)
+
+    def start(self, retry_seconds: float = 5.0) -> None:
+        self.started_at = time.time()
+        self._tasks = [asyncio.create_task(self._run(step, retry_seconds)) for step in self.steps.values()]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, step: WarmupStep, retry_seconds: float) -> None:
+        while True:
+            step.status = RUNNING
+            step.attempts += 1
+            started = time.perf_counter()
+            try:
+                await step.run()
+                step.status = DONE
+                step.error = None
+                step.seconds = round(time.perf_counter() - started, 3)
+                logging.info(f"[Warmup] {step.name} pronto em {step.seconds}s")
+                return
+            except Exception as e:
+                step.status = FAILED
+                step.error = str(e)[:300]
+                logging.error(f"[Warmup] {step.name} falhou (tentativa {step.attempts}): {e}")
+                if not step.required:
+                    return
+            await asyncio.sleep(retry_seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self.started_at is not None and all(
+            step.status == DONE for step in self.steps.values() if step.required
+        )
+
+    def snapshot(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "steps": {name: step.snapshot() for name, step in self.steps.items()},
+        }
+
+
+warmup = Warmup()
@@ -1,6 +1,7 @@
 # app/main.py
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.models import APIKey, APIKeyIn, SecuritySchemeType
 from fastapi.openapi.utils import get_openapi
@@ -9,9 +10,19 @@ import os
 
 import asyncio
 
-from app.database.database import engine
-from app.models import item, outfit, profile
-from app.routers import items, outfits, user, profiles
+from sqlalchemy import text
+
+from app.config import settings
+from app.database.database import engine, note_write
+from app.database.schema import init_models, load_models
+from app.dependencies import get_supabase
+from app.routers import items, outfits, user, profiles, metrics
+from app.services.background_removal import background_remover
+from app.services.ingestion import ingestion_queue
+from app.services.warmup import warmup
+
+# registra todos os modelos (relacionamentos por nome) mesmo sem DDL no startup
+load_models()
 
 app = FastAPI(title="Fashion AI App", version="1.0.0")
 
@@ -24,26 +35,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def mark_user_writes(request: Request, call_next):
+    response = await call_next(request)
+    # escrita confirmada (2xx já com commit): leituras do usuário vão ao primário por um tempo
+    if request.method not in ("GET", "HEAD", "OPTIONS") and 200 <= response.status_code < 300:
+        user_id = getattr(request.state, "user_id", None)
+        if user_id:
+            await note_write(user_id)
+    return response
+
 # Include routers
 app.include_router(items.router, prefix="/items", tags=["items"])
 app.include_router(outfits.router, prefix="/outfits", tags=["outfits"])
 app.include_router(user.router, prefix="/user", tags=["user"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 # profiles.router já define prefix="/profiles"
 app.include_router(profiles.router)
 
 
-# Create database tables
-async def init_models():
-    async with engine.begin() as conn:
-        # importa modelos para registrar metadata
-        await conn.run_sync(item.Base.metadata.create_all)
-        await conn.run_sync(outfit.Base.metadata.create_all)
-        await conn.run_sync(profile.Base.metadata.create_all)
+async def prepare_database():
+    if settings.RUN_DDL_ON_STARTUP:
+        # garante que as tabelas existam
+        await init_models(engine)
+    else:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+async def prepare_supabase():
+    await asyncio.to_thread(get_supabase)
 
 @app.on_event("startup")
 async def startup():
-    # garante que as tabelas existam
-    await init_models()
+    # não bloqueia o startup: banco e modelos carregam depois que o servidor já escuta
+    warmup.add("database", prepare_database, required=True)
+    warmup.add("supabase", prepare_supabase)
+    if settings.WARMUP_REMBG:
+        warmup.add("background_removal", background_remover.warm_up)
+    warmup.start(retry_seconds=settings.WARMUP_RETRY_SECONDS)
+
+@app.get("/ready", tags=["health"])
+async def ready():
+    """Readiness: 200 só depois do warm-up obrigatório (banco pronto)"""
+    snapshot = warmup.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warmup.stop()
+    # workers do upload assíncrono (peças em andamento ficam em "processing")
+    await ingestion_queue.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+# Settings exige estas variáveis; o teste não fala com nenhum serviço
+for _name in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_DB_URL", "GEMINI_API_KEY", "SECRET_KEY"):
+    os.environ.setdefault(_name, "test")
+
+from app.services.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_resilience
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_cancelled_half_open_probe_is_released():
+    breaker = _half_open_breaker()
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        probe = asyncio.ensure_future(call_with_resilience(slow, breaker=breaker, policy=RetryPolicy(max_attempts=1)))
+        await started.wait()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+
+        async def ok():
+            return "ok"
+
+        # a próxima chamada vira a nova sonda em vez de receber CircuitOpenError
+        return await call_with_resilience(ok, breaker=breaker, policy=RetryPolicy(max_attempts=1))
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_local_error_does_not_close_half_open_circuit():
+    breaker = _half_open_breaker()
+
+    async def local_timeout():
+        raise asyncio.TimeoutError("limiter")
+
+    try:
+        asyncio.run(call_with_resilience(local_timeout, breaker=breaker, policy=RetryPolicy(max_attempts=1)))
+    except asyncio.TimeoutError:
+        pass
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # sonda liberada: outra chamada pode testar o upstream
+    breaker.before_call()
+    try:
+        breaker.before_call()
+        raise AssertionError("segunda sonda simultânea deveria ser rejeitada")
+    except CircuitOpenError:
+        pass